@@ -0,0 +1,286 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Measure the throughput and the latency of the client under load.
+
+The client calls an endpoint of a local :py:class:`MockRundeck
+<benchmarks.mock_rundeck.MockRundeck>` server, with a configurable
+response size, latency and error rate, and the requests per second and
+the latency percentiles are reported for every number of threads, in
+three modes:
+
+* ``sync``: the threads call the endpoint method of one shared client;
+* ``submit``: one thread submits all the calls with
+  :py:meth:`pyrundeck.api.RundeckApiClient.submit` to a
+  :py:class:`pyrundeck.scheduler.RequestScheduler` with as many
+  workers, and the latency includes the time in the queue;
+* ``launch_queue``: the calls are ``run_job`` launches enqueued in a
+  :py:class:`pyrundeck.launch_queue.LaunchQueue` with as many drainers,
+  and the latency is the time from enqueueing to done.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from pyrundeck import (RundeckApiClient, RequestsTransport, Urllib3Transport,
+                       RequestScheduler, LaunchQueue)
+from pyrundeck.endpoints import endpoint_by_name
+from benchmarks.mock_rundeck import MockRundeck
+
+
+MODES = ('sync', 'submit', 'launch_queue')
+
+# The arguments every endpoint method is called with.
+_PARAMS = {
+    'import_job': {'xmlBatch': '<joblist/>'},
+    'export_jobs': {'project': 'p'},
+    'list_jobs': {'project': 'p'},
+    'running_executions': {'project': 'p'},
+    'bulk_job_delete': {'idlist': '1,2'},
+}
+
+_TRANSPORTS = {
+    'requests': lambda size: RequestsTransport(pool_maxsize=size),
+    'urllib3': lambda size: Urllib3Transport(maxsize=size),
+}
+
+
+def _params(endpoint):
+    params = dict(_PARAMS.get(endpoint, {}))
+    if '{id}' in endpoint_by_name(endpoint)['path']:
+        params['id'] = '1'
+    return params
+
+
+def _failed(result):
+    return result[0] >= 400
+
+
+def bench_sync(client, endpoint, threads, count):
+    """Return the latencies of ``count`` calls made by ``threads``
+    threads, the number of failed calls and the seconds taken.
+    """
+    method = getattr(client, endpoint)
+    params = _params(endpoint)
+    latencies = []
+    errors = []
+
+    def work(calls):
+        mine = []
+        failed = 0
+        for _ in range(calls):
+            start = time.time()
+            try:
+                if _failed(method(**params)):
+                    failed += 1
+            except Exception:
+                failed += 1
+            mine.append(time.time() - start)
+        latencies.extend(mine)
+        errors.append(failed)
+
+    workers = [threading.Thread(target=work,
+                                args=(count // threads +
+                                      (i < count % threads),))
+               for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, sum(errors), time.time() - start
+
+
+def bench_submit(client, endpoint, threads, count):
+    """As :py:func:`bench_sync`, with the calls submitted to a
+    scheduler with ``threads`` workers.
+    """
+    scheduler = RequestScheduler(workers=threads)
+    client.scheduler = scheduler
+    params = _params(endpoint)
+    latencies = []
+    errors = []
+
+    def done(submitted):
+        def callback(future):
+            latencies.append(time.time() - submitted)
+            if future.exception() is not None or _failed(future.result()):
+                errors.append(1)
+        return callback
+
+    try:
+        start = time.time()
+        futures = []
+        for _ in range(count):
+            future = client.submit(endpoint, **params)
+            future.add_done_callback(done(time.time()))
+            futures.append(future)
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+        seconds = time.time() - start
+    finally:
+        client.scheduler = None
+        scheduler.shutdown()
+    return latencies, len(errors), seconds
+
+
+def bench_launch_queue(client, endpoint, threads, count):
+    """As :py:func:`bench_sync`, with ``count`` launches of a job
+    drained by a launch queue with ``threads`` drainers.
+    """
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'launches.db')
+    queue = LaunchQueue(client, path, workers=threads, poll_interval=0.01,
+                        max_attempts=1)
+    try:
+        start = time.time()
+        tickets = [queue.enqueue(id='1', argString='-n {}'.format(i))
+                   for i in range(count)]
+        for ticket in tickets:
+            try:
+                queue.result(ticket)
+            except Exception:
+                pass
+        seconds = time.time() - start
+    finally:
+        queue.stop()
+    try:
+        db = sqlite3.connect(path)
+        rows = db.execute('SELECT updated - created, state '
+                          'FROM launches').fetchall()
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+    return ([latency for latency, _ in rows],
+            sum(1 for _, state in rows if state != 'done'), seconds)
+
+
+_BENCHES = {
+    'sync': bench_sync,
+    'submit': bench_submit,
+    'launch_queue': bench_launch_queue,
+}
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q / 100.0))]
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'errors': errors,
+        'seconds': seconds,
+        'calls_per_second': len(latencies) / seconds,
+        'p50': _percentile(latencies, 50),
+        'p90': _percentile(latencies, 90),
+        'p99': _percentile(latencies, 99),
+        'max': latencies[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-e', '--endpoint', default='list_jobs',
+                        help='the endpoint method called in the sync and '
+                             'submit modes')
+    parser.add_argument('-s', '--size', type=int,
+                        help='elements of the responses of the endpoint')
+    parser.add_argument('-t', '--threads', default='1,2,4,8,16',
+                        help='comma separated numbers of threads')
+    parser.add_argument('-n', '--calls', type=int, default=1000,
+                        help='calls per number of threads')
+    parser.add_argument('-m', '--modes', default=','.join(MODES),
+                        help='comma separated modes, of: {}'
+                             .format(', '.join(MODES)))
+    parser.add_argument('-l', '--latency', type=float, default=0.005,
+                        help='seconds the server waits before responding')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0,
+                        help='maximum random seconds added to the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of the requests answered with 5xx')
+    parser.add_argument('--transport', choices=sorted(_TRANSPORTS),
+                        default='requests')
+    parser.add_argument('-o', '--output', help='write the results to this '
+                                               'JSON file')
+    args = parser.parse_args()
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in _BENCHES:
+            parser.error('unknown mode {}'.format(mode))
+    threads = [int(n) for n in args.threads.split(',')]
+    logging.disable(logging.CRITICAL)
+
+    sizes = {}
+    if args.size is not None:
+        sizes[args.endpoint] = args.size
+    results = []
+    with MockRundeck(sizes, latency=args.latency, jitter=args.jitter,
+                     error_rate=args.error_rate) as server:
+        for mode in modes:
+            endpoint = 'run_job' if mode == 'launch_queue' else args.endpoint
+            for count in threads:
+                client = RundeckApiClient(
+                    'token', server.url,
+                    transport=_TRANSPORTS[args.transport](max(threads)))
+                result = summarize(*_BENCHES[mode](client, endpoint, count,
+                                                   args.calls))
+                result.update(mode=mode, endpoint=endpoint, threads=count)
+                results.append(result)
+                client.transport.close()
+                print('{:12} {:20} {:3} threads {:8.1f} calls/s  p50 {:7.2f} '
+                      'ms  p90 {:7.2f} ms  p99 {:7.2f} ms  errors {}'
+                      .format(mode, endpoint, count,
+                              result['calls_per_second'],
+                              result['p50'] * 1000, result['p90'] * 1000,
+                              result['p99'] * 1000, result['errors']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'latency': args.latency, 'jitter': args.jitter,
+                       'error_rate': args.error_rate,
+                       'transport': args.transport, 'results': results},
+                      f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Measure the private memory of forked worker processes.
+
+A parent process imports pyrundeck, creates a client and keeps a number
+of parsed results in memory, like a web application preloaded by a
+pre-fork server. It then forks workers that parse results and run the
+garbage collector, and report the memory they do not share with the
+parent (``Private_Clean`` plus ``Private_Dirty`` from
+``/proc/self/smaps_rollup``). This is measured once with a plain fork
+and once after :py:func:`pyrundeck.fork.freeze`.
+
+Only Linux provides ``/proc/self/smaps_rollup``.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import sys
+
+from lxml import etree
+
+from pyrundeck import RundeckApiClient, MemoryTransport, fork
+from pyrundeck.rundeck_parser import parse
+
+
+def jobs_xml(count):
+    jobs = ''.join('<job id="job-{0}"><name>job {0}</name><group>g</group>'
+                   '<project>p</project><description>job number {0}'
+                   '</description></job>'.format(i) for i in range(count))
+    return ('<result success="true" apiversion="13"><jobs count="{}">{}'
+            '</jobs></result>'.format(count, jobs))
+
+
+def private_kb():
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total
+
+
+def _worker(client, payload, iterations, out):
+    gc.enable()
+    base = private_kb()
+    for _ in range(iterations):
+        client.list_jobs()
+        parse(etree.fromstring(payload))
+    gc.collect()
+    os.write(out, '{} {}\n'.format(base, private_kb()).encode('ascii'))
+
+
+def run(workers, preload, iterations, freeze):
+    payload = jobs_xml(100)
+    transport = MemoryTransport()
+    transport.add('list_jobs', payload)
+    client = RundeckApiClient('token', 'http://rundeck', transport=transport)
+    # The state of the application, shared with the workers.
+    results = [parse(etree.fromstring(jobs_xml(preload)))
+               for _ in range(10)]
+    if freeze:
+        gc.disable()
+        fork.freeze()
+
+    read_end, write_end = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            try:
+                _worker(client, payload, iterations, write_end)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    os.close(write_end)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    with os.fdopen(read_end) as f:
+        samples = [tuple(map(int, line.split())) for line in f]
+
+    if freeze:
+        gc.unfreeze()
+        gc.enable()
+    del results
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-w', '--workers', type=int, default=4)
+    parser.add_argument('-p', '--preload', type=int, default=5000,
+                        help='jobs per preloaded result')
+    parser.add_argument('-i', '--iterations', type=int, default=50,
+                        help='requests per worker')
+    args = parser.parse_args()
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        sys.exit('/proc/self/smaps_rollup is not available')
+    logging.disable(logging.CRITICAL)
+
+    for name, freeze in [('plain', False), ('frozen', True)]:
+        samples = run(args.workers, args.preload, args.iterations, freeze)
+        start = sum(s[0] for s in samples) / float(len(samples))
+        end = sum(s[1] for s in samples) / float(len(samples))
+        print('{:8} private memory per worker: {:8.0f} kB after fork, '
+              '{:8.0f} kB after work'.format(name, start, end))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Measure the time taken by ``import pyrundeck``.
+
+``import pyrundeck`` is run repeatedly in a new interpreter with
+``python -X importtime``, and the median of the cumulative import time
+of the package is compared to a budget. The script exits with status
+1 if the budget is exceeded, or if one of the modules that pyrundeck
+imports only on first use was imported.
+
+The slowest modules imported by the package are listed as well.
+"""
+
+import argparse
+import subprocess
+import sys
+
+
+DEFERRED = ('requests', 'urllib3', 'lxml.etree', 'yaml', 'ssl')
+
+_CHECK = ('import sys, pyrundeck; '
+          'print(",".join(m for m in {!r} if m in sys.modules))'
+          .format(DEFERRED))
+
+
+def _import_once():
+    """Return the ``(self, cumulative, module)`` import times, in
+    microseconds, of the modules imported by ``pyrundeck``, the package
+    itself last, and the deferred modules that were imported.
+    """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                                _CHECK],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        sys.exit(err)
+
+    # A module is reported after the modules it imports, indented by
+    # two spaces per level, so the modules imported by the package are
+    # the nested ones reported right before it.
+    times = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        module = module[1:]
+        if module == 'pyrundeck':
+            times.append((int(own), int(cumulative), module))
+            break
+        if not module.startswith(' '):
+            times = []
+        else:
+            times.append((int(own), int(cumulative), module.strip()))
+    else:
+        sys.exit('pyrundeck was not imported')
+    return times, [m for m in out.strip().split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=20,
+                        help='number of interpreters to start')
+    parser.add_argument('-b', '--budget', type=float, default=50.0,
+                        help='the budget in milliseconds')
+    parser.add_argument('-t', '--top', type=int, default=10,
+                        help='number of slowest modules listed')
+    args = parser.parse_args()
+
+    samples = []
+    deferred = set()
+    for _ in range(args.runs):
+        modules, imported = _import_once()
+        deferred.update(imported)
+        samples.append((modules[-1][1], modules))
+    samples.sort(key=lambda sample: sample[0])
+    median, modules = samples[len(samples) // 2]
+
+    print('import pyrundeck: {:.1f} ms median, {:.1f} ms min, '
+          '{:.1f} ms max (budget {:.1f} ms)'
+          .format(median / 1000.0, samples[0][0] / 1000.0,
+                  samples[-1][0] / 1000.0, args.budget))
+    print('slowest modules of the median run, by own import time:')
+    for own, _, module in sorted(modules, reverse=True)[:args.top]:
+        print('  {:8.1f} ms {}'.format(own / 1000.0, module))
+
+    failed = False
+    if deferred:
+        print('imported on import: {}'.format(', '.join(sorted(deferred))))
+        failed = True
+    if median / 1000.0 > args.budget:
+        print('over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Measure the memory used at each stage of the life of a response.
+
+A response of a local :py:class:`MockRundeck
+<benchmarks.mock_rundeck.MockRundeck>` server is taken through the
+steps of the client one at a time, and the memory is measured after
+each of them:
+
+``raw bytes``
+    The body read by the transport.
+``text``
+    The body decoded to ``response.text``.
+``tree``
+    The ``lxml.etree`` tree of the text.
+``native``
+    The native objects converted from the tree.
+``response released``
+    The response, the text and the tree are gone; the native objects
+    remain.
+``result released``
+    Everything is gone; what remains is kept by the client or leaked.
+
+The same is then measured for a call of the endpoint method of the
+client (``client call`` and ``client result released``), which
+includes whatever ``_perform_request`` and the parser hold on to.
+
+For every stage the memory of the Python heap, as traced by
+``tracemalloc``, and the RSS of the process are reported, both the
+current value and the peak reached during the stage, relative to the
+start. The tree of ``lxml`` is not allocated on the Python heap and
+only shows in the RSS. The RSS also keeps memory that was freed but not
+returned to the system, which later stages reuse. Reading the RSS
+needs Linux. The heap and the RSS are measured in separate runs, since
+tracing the heap adds to the RSS.
+
+The client drops the response before converting the tree, so the peak
+of a client call can be lower than the sum of the stages.
+
+Every endpoint and size is measured in a new interpreter. The results
+can be written as JSON with ``--output`` and compared with the results
+of an earlier run with ``--baseline``; the script exits with status 1
+if the peak memory of a client call grew by more than the tolerance.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import subprocess
+import sys
+import tracemalloc
+
+from lxml import etree
+
+from pyrundeck import RundeckApiClient
+from pyrundeck.endpoints import endpoint_by_name
+from pyrundeck.rundeck_parser import parse
+from benchmarks.bench_parser import _reset_peak_rss, _rss_kb
+from benchmarks.mock_rundeck import MockRundeck
+
+
+#: The endpoints measured, with the arguments of their calls.
+ENDPOINTS = {
+    'export_jobs': {'project': 'p'},
+    'job_executions_info': {'id': '1'},
+    'list_jobs': {'project': 'p'},
+}
+
+_MEASURED = ('heap', 'heap_peak', 'rss', 'rss_peak')
+
+
+class _Stages(object):
+    """Record the memory at the end of every stage, relative to the
+    memory when created: the Python heap if ``trace``, or else the RSS.
+    Tracing every allocation adds to the RSS, so both are not measured
+    at once.
+    """
+    def __init__(self, trace):
+        gc.collect()
+        self.trace = trace
+        if trace:
+            tracemalloc.start()
+            self.start = tracemalloc.get_traced_memory()[0]
+        else:
+            self.start = _reset_peak_rss()
+        self.stages = []
+
+    def __call__(self, name):
+        stage = {'stage': name}
+        if self.trace:
+            heap, peak = tracemalloc.get_traced_memory()
+            stage['heap'] = heap - self.start
+            stage['heap_peak'] = peak - self.start
+            # The peak of the next stage is its own.
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        elif self.start is not None:
+            stage['rss'] = (_rss_kb('VmRSS') - self.start) * 1024
+            stage['rss_peak'] = (_rss_kb('VmHWM') - self.start) * 1024
+            _reset_peak_rss()
+        self.stages.append(stage)
+
+    def stop(self):
+        if self.trace:
+            tracemalloc.stop()
+        return self.stages
+
+
+def measure(endpoint, size, trace):
+    """Return the memory of every stage of a response of ``endpoint``
+    with ``size`` elements: the Python heap if ``trace``, or else the
+    RSS.
+    """
+    params = ENDPOINTS[endpoint]
+    with MockRundeck({endpoint: size}) as server:
+        client = RundeckApiClient('token', server.url)
+        method = getattr(client, endpoint)
+        # Import everything, build the parser, open the connection
+        # and generate the payload before measuring. A response of the
+        # measured size would leave memory that the stages then reuse
+        # without growing the RSS.
+        client.system_info()
+        server.payload(endpoint)
+        path = endpoint_by_name(endpoint)['path'].replace(
+            '{id}', params.get('id', ''))
+        url = server.url + path
+        query = dict((k, v) for k, v in params.items() if k != 'id')
+
+        stages = _Stages(trace)
+        response = client.transport.request('GET', url, params=query,
+                                            **client.client_args)
+        body = response.content
+        stages('raw bytes')
+        text = response.text
+        stages('text')
+        tree = etree.fromstring(text)
+        stages('tree')
+        native = parse(tree)
+        stages('native')
+        del response, body, text, tree
+        gc.collect()
+        stages('response released')
+        del native
+        gc.collect()
+        stages('result released')
+
+        result = method(**params)
+        stages('client call')
+        del result
+        gc.collect()
+        stages('client result released')
+        client.transport.close()
+        return stages.stop()
+
+
+def _measure_in_child(endpoint, size):
+    """Measure the heap and the RSS, each in a new interpreter, and
+    return the stages with both.
+    """
+    stages = None
+    for measured in ('heap', 'rss'):
+        process = subprocess.Popen([sys.executable, '-m',
+                                    'benchmarks.bench_memory', '--child',
+                                    endpoint, str(size), measured],
+                                   stdout=subprocess.PIPE,
+                                   universal_newlines=True)
+        out, _ = process.communicate()
+        if process.returncode != 0:
+            sys.exit('measuring {} {} failed'.format(endpoint, size))
+        if stages is None:
+            stages = json.loads(out)
+        else:
+            for stage, more in zip(stages, json.loads(out)):
+                stage.update(more)
+    return stages
+
+
+def _mb(size):
+    return '     n/a' if size is None else '{:8.1f}'.format(size / 1e6)
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of the peak memory of every client call from
+    ``baseline`` and return the calls that grew by more than
+    ``tolerance``.
+    """
+    grew = []
+    for key in sorted(set(results) & set(baseline)):
+        now = [s for s in results[key] if s['stage'] == 'client call'][0]
+        before = [s for s in baseline[key] if s['stage'] == 'client call'][0]
+        for measured in ('heap_peak', 'rss_peak'):
+            if not now.get(measured) or not before.get(measured):
+                continue
+            change = float(now[measured]) / before[measured] - 1
+            print('{:28} {:10} {:+7.1%}'.format(key, measured, change))
+            if change > tolerance:
+                grew.append('{} {}'.format(key, measured))
+    return grew
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-e', '--endpoints', default=','.join(sorted(ENDPOINTS)),
+                        help='comma separated endpoints, of: {}'
+                             .format(', '.join(sorted(ENDPOINTS))))
+    parser.add_argument('-s', '--sizes', default='1000,10000,100000',
+                        help='comma separated numbers of elements')
+    parser.add_argument('-o', '--output', help='write the results to this '
+                                               'JSON file')
+    parser.add_argument('-b', '--baseline', help='compare with the results '
+                                                 'in this JSON file')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help='the growth from the baseline that fails the '
+                             'run, e.g. 0.1 for 10%%')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    if args.child:
+        endpoint, size, measured = args.child
+        print(json.dumps(measure(endpoint, int(size), measured == 'heap')))
+        return
+
+    endpoints = args.endpoints.split(',')
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error('unknown endpoint {}'.format(endpoint))
+    results = {}
+    for endpoint in endpoints:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            key = '{}/{}'.format(endpoint, size)
+            results[key] = _measure_in_child(endpoint, size)
+            print('{}, MB:{:>17} {:>8} {:>8} {:>8}'
+                  .format(key, 'heap', 'peak', 'rss', 'peak'))
+            for stage in results[key]:
+                print('  {:24} {}'.format(stage['stage'], ' '.join(
+                    _mb(stage.get(measured)) for measured in _MEASURED)))
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        grew = compare(results, baseline, args.tolerance)
+        if grew:
+            print('more memory than the baseline: {}'.format(', '.join(grew)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Measure the throughput and the memory of the parser.
+
+Synthetic responses of :py:mod:`benchmarks.payloads` are generated at
+several sizes, e.g. job listings of 1000, 10000 and 100000 jobs. Each
+is parsed repeatedly with ``etree.fromstring`` and
+:py:func:`pyrundeck.rundeck_parser.parse`, and the median time of both
+steps is reported with the throughput in MB/s and elements/s. A
+separate run measures the peak memory: the peak of the Python heap
+reported by ``tracemalloc`` and, on Linux, the growth of the peak RSS
+of the process, which includes the tree of ``lxml``.
+
+The results can be written as JSON with ``--output`` and compared with
+the results of an earlier run with ``--baseline``. The script exits
+with status 1 if a document got slower than the baseline by more than
+the tolerance.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from lxml import etree
+
+from pyrundeck.rundeck_parser import parse
+from benchmarks.payloads import PAYLOADS
+
+
+def _rss_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise ValueError(field)
+
+
+def _reset_peak_rss():
+    """Make the peak RSS of the process its current RSS, and return
+    it in kB, or ``None`` if this is not supported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _rss_kb('VmRSS')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure_time(data, runs):
+    """Return the median seconds of ``etree.fromstring`` and of
+    ``parse`` over ``runs`` runs, and the number of elements.
+    """
+    fromstring, parsing = [], []
+    for _ in range(runs):
+        gc.collect()
+        start = time.time()
+        tree = etree.fromstring(data)
+        parsed = time.time()
+        parse(tree)
+        fromstring.append(parsed - start)
+        parsing.append(time.time() - parsed)
+    elements = sum(1 for _ in tree.iter())
+    return _median(fromstring), _median(parsing), elements
+
+
+def measure_memory(data):
+    """Return the peak of the Python heap, and the growth of the peak
+    RSS, in bytes, of parsing ``data``. Either is ``None`` if it cannot
+    be measured.
+    """
+    gc.collect()
+    rss = _reset_peak_rss()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    result = parse(etree.fromstring(data))
+    heap = None
+    if tracemalloc is not None:
+        heap = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    peak = None
+    if rss is not None:
+        peak = (_rss_kb('VmHWM') - rss) * 1024
+    del result
+    return heap, peak
+
+
+def run(payloads, sizes, runs):
+    results = {}
+    for name in payloads:
+        # The system information does not grow.
+        for size in sizes if name != 'system_info' else [None]:
+            data = PAYLOADS[name](size).encode('utf-8')
+            fromstring, parsing, elements = measure_time(data, runs)
+            heap, rss = measure_memory(data)
+            total = fromstring + parsing
+            key = name if size is None else '{}/{}'.format(name, size)
+            results[key] = {
+                'bytes': len(data),
+                'elements': elements,
+                'fromstring_seconds': fromstring,
+                'parse_seconds': parsing,
+                'mb_per_second': len(data) / total / 1e6,
+                'elements_per_second': elements / total,
+                'peak_heap_bytes': heap,
+                'peak_rss_bytes': rss,
+            }
+            print('{:20} {:>10.1f} kB {:>9.2f} ms fromstring {:>9.2f} ms parse '
+                  '{:>7.2f} MB/s {:>10.0f} el/s heap {} rss {}'
+                  .format(key, len(data) / 1024.0, fromstring * 1000,
+                          parsing * 1000, results[key]['mb_per_second'],
+                          results[key]['elements_per_second'],
+                          _mb(heap), _mb(rss)))
+            sys.stdout.flush()
+    return results
+
+
+def _mb(size):
+    return 'n/a' if size is None else '{:.1f} MB'.format(size / 1e6)
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of every document from ``baseline`` and return
+    the documents that got slower by more than ``tolerance``.
+    """
+    slower = []
+    for key in sorted(set(results) & set(baseline)):
+        now = (results[key]['fromstring_seconds'] +
+               results[key]['parse_seconds'])
+        before = (baseline[key]['fromstring_seconds'] +
+                  baseline[key]['parse_seconds'])
+        change = now / before - 1
+        print('{:20} {:+7.1%} time'.format(key, change))
+        if change > tolerance:
+            slower.append(key)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-p', '--payloads', default=','.join(sorted(PAYLOADS)),
+                        help='comma separated payloads, of: {}'
+                             .format(', '.join(sorted(PAYLOADS))))
+    parser.add_argument('-s', '--sizes', default='1000,10000,100000',
+                        help='comma separated numbers of elements')
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help='timed runs per document')
+    parser.add_argument('-o', '--output', help='write the results to this '
+                                               'JSON file')
+    parser.add_argument('-b', '--baseline', help='compare with the results '
+                                                 'in this JSON file')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help='the slowdown from the baseline that fails '
+                             'the run, e.g. 0.1 for 10%%')
+    args = parser.parse_args()
+    payloads = args.payloads.split(',')
+    for name in payloads:
+        if name not in PAYLOADS:
+            parser.error('unknown payload {}'.format(name))
+    sizes = [int(size) for size in args.sizes.split(',')]
+    logging.disable(logging.CRITICAL)
+
+    results = run(payloads, sizes, args.runs)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'lxml': etree.__version__,
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print('slower than the baseline: {}'.format(', '.join(slower)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
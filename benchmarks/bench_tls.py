@@ -0,0 +1,143 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Measure the cost of TLS setup per request.
+
+Requests are sent to a local HTTPS stub server whose certificate is
+trusted through a CA bundle, by default the bundle of ``requests`` with
+the certificate of the server appended, in three ways:
+
+* ``per-request``: ``requests.request`` with ``verify`` set to the CA
+  bundle, which opens a new connection and loads the bundle for every
+  request, as the client used to do;
+* ``resumed``: the default transport of the client against a server
+  that closes every connection, so that every request performs a
+  handshake that resumes the previous TLS session;
+* ``pooled``: the default transport against a server that keeps
+  connections open.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import requests
+
+from pyrundeck import RundeckApiClient
+from tests.stub_server import StubServer, system_info_xml
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'tests',
+                        'test_data')
+CERTFILE = os.path.join(DATA_DIR, 'stub_server.pem')
+KEYFILE = os.path.join(DATA_DIR, 'stub_server.key')
+
+
+def _handle(method, path, body):
+    return 200, system_info_xml()
+
+
+def _time(send, requests_count):
+    send()
+    start = time.time()
+    for _ in range(requests_count):
+        send()
+    return (time.time() - start) / requests_count
+
+
+def bench_per_request(bundle, requests_count):
+    with StubServer(_handle, CERTFILE, KEYFILE) as server:
+        url = server.url + '/api/1/system/info'
+        return _time(lambda: requests.request('GET', url, verify=bundle),
+                     requests_count), None
+
+
+def _bench_client(bundle, requests_count, keep_alive):
+    with StubServer(_handle, CERTFILE, KEYFILE,
+                    keep_alive=keep_alive) as server:
+        client = RundeckApiClient('token', server.url, pem_file_path=bundle)
+        url = server.url + '/api/1/system/info'
+        elapsed = _time(lambda: client.transport.request('GET', url,
+                                                         verify=bundle),
+                        requests_count)
+        return elapsed, client.transport.ssl_context.stats()
+
+
+def bench_resumed(bundle, requests_count):
+    return _bench_client(bundle, requests_count, keep_alive=False)
+
+
+def bench_pooled(bundle, requests_count):
+    return _bench_client(bundle, requests_count, keep_alive=True)
+
+
+def _full_bundle(directory):
+    """Write the bundle of ``requests`` followed by the certificate of
+    the stub server.
+    """
+    bundle = os.path.join(directory, 'bundle.pem')
+    with open(bundle, 'wb') as out:
+        for name in (requests.certs.where(), CERTFILE):
+            with open(name, 'rb') as f:
+                shutil.copyfileobj(f, out)
+    return bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--requests', type=int, default=200,
+                        help='requests per measurement')
+    parser.add_argument('--small-bundle', action='store_true',
+                        help='trust only the certificate of the server')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    directory = tempfile.mkdtemp()
+    try:
+        bundle = CERTFILE if args.small_bundle else _full_bundle(directory)
+        for name, bench in [('per-request', bench_per_request),
+                            ('resumed', bench_resumed),
+                            ('pooled', bench_pooled)]:
+            elapsed, stats = bench(bundle, args.requests)
+            line = '{:12} {:8.3f} ms/request'.format(name, elapsed * 1000)
+            if stats is not None:
+                line += '  handshakes={handshakes} resumed={resumed}' \
+                    .format(**stats)
+            print(line)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""A local stand-in for a Rundeck server.
+
+:py:class:`MockRundeck` answers the requests of every method of
+:py:class:`pyrundeck.endpoints.EndpointMixins` with the synthetic
+responses of :py:mod:`benchmarks.payloads`, of a configurable size. It
+can add latency to every response and answer a fraction of the
+requests with an error, and counts the requests it served. It is built
+on the standard library only, so it can be run anywhere, e.g.::
+
+    python -m benchmarks.mock_rundeck --port 4440 --latency 0.01
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from pyrundeck.endpoints import find_endpoint
+from benchmarks import payloads
+from tests.stub_server import StubServer
+
+
+#: The default number of elements of the response of every endpoint.
+DEFAULT_SIZES = {
+    'import_job': 10,
+    'export_jobs': 100,
+    'list_jobs': 100,
+    'job_executions_info': 20,
+    'running_executions': 10,
+    'bulk_job_delete': 10,
+}
+
+# The payload generator of every endpoint. The others answer with a
+# single element.
+_GENERATORS = {
+    'import_job': payloads.import_result,
+    'export_jobs': payloads.joblist,
+    'list_jobs': payloads.jobs,
+    'run_job': payloads.executions,
+    'execution_info': payloads.executions,
+    'job_executions_info': payloads.executions,
+    'running_executions': payloads.executions,
+    'system_info': payloads.system_info,
+    'job_definition': payloads.joblist,
+    'bulk_job_delete': payloads.delete_jobs,
+}
+
+_ERROR = ('<result error="true" apiversion="13"><error><message>{}'
+          '</message></error></result>')
+
+
+class MockRundeck(object):
+    """Serve the Rundeck API on a local port.
+
+    The server is started when used as a context manager, and its URL
+    is available as ``url``.
+
+    :param sizes: (optional) The number of elements of the responses,
+                  by endpoint name. *Default value:*
+                  :py:data:`DEFAULT_SIZES`.
+    :param latency: (optional) Seconds to wait before every response.
+                    *Default value:* ``0``.
+    :param jitter: (optional) The maximum number of seconds added at
+                   random to ``latency``. *Default value:* ``0``.
+    :param error_rate: (optional) The fraction of the requests answered
+                       with an error. *Default value:* ``0``.
+    :param error_statuses: (optional) The statuses of the errors, one
+                           chosen at random for every error. *Default
+                           value:* ``(500, 503)``.
+    :param seed: (optional) The seed of the random choices. *Default
+                 value:* ``0``.
+    :param keep_alive: (optional) Keep connections open between
+                       requests. *Default value:* ``True``.
+    :param port: (optional) The port to listen on. *Default value:* a
+                 free port.
+    """
+    def __init__(self, sizes=None, latency=0, jitter=0, error_rate=0,
+                 error_statuses=(500, 503), seed=0, keep_alive=True,
+                 port=0):
+        self.sizes = dict(DEFAULT_SIZES)
+        self.sizes.update(sizes or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._payloads = {}
+        self._stats = {}
+        self._server = StubServer(self._handle, keep_alive=keep_alive,
+                                  port=port)
+        self.url = self._server.url
+
+    def start(self):
+        self._server.start()
+
+    def stop(self):
+        self._server.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def payload(self, name):
+        """Return the encoded response of the endpoint ``name``. The
+        responses are generated on first use.
+        """
+        with self._lock:
+            payload = self._payloads.get(name)
+            if payload is None:
+                payload = _GENERATORS[name](self.sizes.get(name, 1))
+                payload = self._payloads[name] = payload.encode('utf-8')
+        return payload
+
+    def stats(self):
+        """Return the number of ``'requests'`` and ``'errors'`` served,
+        by endpoint name. Requests to unknown URLs are counted under
+        ``None``.
+        """
+        with self._lock:
+            return dict((name, dict(stats))
+                        for name, stats in self._stats.items())
+
+    def _handle(self, method, path, body):
+        endpoint = find_endpoint(method, path.split('?', 1)[0])
+        name = endpoint['name']
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            error = self._random.random() < self.error_rate
+            status = self._random.choice(self.error_statuses)
+            stats = self._stats.setdefault(name, {'requests': 0,
+                                                  'errors': 0})
+            stats['requests'] += 1
+            if error:
+                stats['errors'] += 1
+        if delay:
+            time.sleep(delay)
+        if name is None:
+            return 404, _ERROR.format('no such endpoint')
+        if error:
+            return status, _ERROR.format('injected error')
+        if name == 'delete_job':
+            return 204, ''
+        return 200, self.payload(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-p', '--port', type=int, default=4440)
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='seconds before every response')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0,
+                        help='maximum random seconds added to the latency')
+    parser.add_argument('-e', '--error-rate', type=float, default=0.0,
+                        help='fraction of the requests answered with 5xx')
+    parser.add_argument('-s', '--size', action='append', default=[],
+                        metavar='ENDPOINT=COUNT',
+                        help='elements of the responses of an endpoint')
+    args = parser.parse_args()
+    sizes = {}
+    for size in args.size:
+        name, _, count = size.partition('=')
+        sizes[name] = int(count)
+
+    server = MockRundeck(sizes, latency=args.latency, jitter=args.jitter,
+                         error_rate=args.error_rate, port=args.port)
+    server.start()
+    print('serving on {}'.format(server.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
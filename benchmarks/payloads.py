@@ -0,0 +1,238 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Synthetic Rundeck responses of any size, for the benchmarks.
+
+The documents have the shapes the server sends and the parser accepts:
+job listings, job definitions exported as a ``joblist``, execution
+listings, the results of importing and deleting jobs and the system
+information. Their contents vary from element to element, e.g. jobs
+have options, schedules and notifications, and the three kinds of
+commands, in proportions similar to a real project. The same arguments
+always give the same document.
+"""
+
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+from tests.stub_server import system_info_xml
+
+
+PROJECT = 'API_client_development'
+URL = 'http://rundeck.example.com:4440'
+
+_WORDS = ('deploy', 'backup', 'restart', 'report', 'nightly', 'cleanup',
+          'sync', 'rotate', 'logs', 'database', 'cache', 'frontend',
+          'worker', 'index', 'rebuild', 'migrate', 'ελέγχος', 'größe')
+
+
+def _uuid(rng):
+    return '{:08x}-{:04x}-{:04x}-{:04x}-{:012x}'.format(
+        rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16),
+        rng.getrandbits(16), rng.getrandbits(48))
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(_WORDS) for _ in range(count))
+
+
+def _job(rng, number):
+    description = escape(_words(rng, rng.randint(0, 12)))
+    options = ''
+    if rng.random() < 0.3:
+        options = '<options>{}</options>'.format(''.join(
+            '<option name="arg{}" value={} required="true">'
+            '<description>{}</description></option>'
+            .format(i, quoteattr(rng.choice(_WORDS)),
+                    escape(_words(rng, 4)))
+            for i in range(rng.randint(1, 4))))
+    return ('<job id="{id}"><name>{name}</name><group>{group}</group>'
+            '<project>{project}</project><description>{description}'
+            '</description>{options}</job>'
+            .format(id=_uuid(rng), name='job {} {}'.format(number,
+                                                           rng.choice(_WORDS)),
+                    group=rng.choice(_WORDS), project=PROJECT,
+                    description=description, options=options))
+
+
+def _command(rng):
+    kind = rng.random()
+    if kind < 0.6:
+        return '<command><exec>{}</exec></command>'.format(
+            escape('echo "{}" && sleep {}'.format(_words(rng, 3),
+                                                   rng.randint(1, 60))))
+    if kind < 0.9:
+        script = '\n'.join('echo {}'.format(_words(rng, 5))
+                           for _ in range(rng.randint(1, 20)))
+        return ('<command><script>{}</script><scriptargs>-v {}</scriptargs>'
+                '</command>'.format(escape(script), rng.choice(_WORDS)))
+    return ('<command><jobref group="{}" name="{}"><arg line="-x {}"/>'
+            '</jobref></command>'.format(rng.choice(_WORDS),
+                                         rng.choice(_WORDS),
+                                         rng.randint(1, 9)))
+
+
+def _job_definition(rng, number):
+    uuid = _uuid(rng)
+    extra = ''
+    if rng.random() < 0.4:
+        extra += ('<schedule><time hour="{:02d}" minute="{:02d}" seconds="0"/>'
+                  '<weekday day="*"/><month month="*"/><year year="*"/>'
+                  '</schedule>'.format(rng.randint(0, 23),
+                                       rng.randint(0, 59)))
+    if rng.random() < 0.2:
+        extra += ('<notification><onfailure><email recipients="ops@example.com"'
+                  ' subject="failed"/></onfailure></notification>')
+    if rng.random() < 0.5:
+        extra += ('<dispatch><threadcount>{}</threadcount>'
+                  '<keepgoing>false</keepgoing>'
+                  '<excludePrecedence>true</excludePrecedence>'
+                  '<rankOrder>ascending</rankOrder></dispatch>'
+                  '<nodefilters><filter>tags: {}</filter></nodefilters>'
+                  .format(rng.randint(1, 8), rng.choice(_WORDS)))
+    return ('<job><id>{uuid}</id><uuid>{uuid}</uuid><loglevel>INFO</loglevel>'
+            '<sequence keepgoing="false" strategy="node-first">{command}'
+            '</sequence><description>{description}</description>'
+            '<name>job {number}</name><group>{group}</group>'
+            '<context><project>{project}</project></context>{extra}</job>'
+            .format(uuid=uuid, command=_command(rng),
+                    description=escape(_words(rng, rng.randint(0, 12))),
+                    number=number, group=rng.choice(_WORDS),
+                    project=PROJECT, extra=extra))
+
+
+def _execution(rng, number):
+    started = 1437474661504 + number * 60000
+    ended = ''
+    status = rng.choice(('succeeded', 'succeeded', 'succeeded', 'failed',
+                         'running'))
+    if status != 'running':
+        ended = ('<date-ended unixtime="{}">2015-07-21T10:32:01Z'
+                 '</date-ended>'.format(started + rng.randint(100, 60000)))
+    nodes = ''.join('<node name="node{}"/>'.format(i)
+                    for i in range(rng.randint(1, 5)))
+    return ('<execution id="{number}" href="{url}/execution/follow/{number}" '
+            'status="{status}" project="{project}"><user>admin</user>'
+            '<date-started unixtime="{started}">2015-07-21T10:31:01Z'
+            '</date-started>{ended}{job}<description>{description}'
+            '</description><argstring>-arg1 {word}</argstring>'
+            '<successfulNodes>{nodes}</successfulNodes></execution>'
+            .format(number=number, url=URL, status=status, project=PROJECT,
+                    started=started, ended=ended,
+                    job=_job(rng, number),
+                    description=escape(_words(rng, 3)),
+                    word=rng.choice(_WORDS), nodes=nodes))
+
+
+def jobs(count, seed=0):
+    """Return the response of ``list_jobs`` with ``count`` jobs."""
+    rng = random.Random(seed)
+    return ('<result success="true" apiversion="13"><jobs count="{}">{}'
+            '</jobs></result>'.format(count, ''.join(_job(rng, i)
+                                                     for i in range(count))))
+
+
+def joblist(count, seed=0):
+    """Return the response of ``export_jobs`` with ``count`` job
+    definitions.
+    """
+    rng = random.Random(seed)
+    return '<joblist>{}</joblist>'.format(
+        ''.join(_job_definition(rng, i) for i in range(count)))
+
+
+def executions(count, seed=0):
+    """Return the response of ``execution_query`` with ``count``
+    executions.
+    """
+    rng = random.Random(seed)
+    return ('<result success="true" apiversion="13">'
+            '<executions count="{}">{}</executions></result>'
+            .format(count, ''.join(_execution(rng, i)
+                                   for i in range(count))))
+
+
+def delete_jobs(count, seed=0):
+    """Return the response of ``delete_jobs`` for ``count`` jobs, a
+    tenth of which could not be deleted.
+    """
+    rng = random.Random(seed)
+    failed = count // 10
+    succeeded = ''.join('<deleteJobResult id="{}"><message>Job was '
+                        'successfully deleted: {}</message>'
+                        '</deleteJobResult>'.format(_uuid(rng), i)
+                        for i in range(count - failed))
+    failures = ''.join('<deleteJobResult id="{}"><error>Job ID does not '
+                       'exist</error></deleteJobResult>'.format(_uuid(rng))
+                       for _ in range(failed))
+    return ('<result success="true" apiversion="13"><deleteJobs '
+            'requestCount="{}" allsuccessful="{}"><succeeded count="{}">{}'
+            '</succeeded><failed count="{}">{}</failed></deleteJobs>'
+            '</result>'.format(count, 'false' if failed else 'true',
+                               count - failed, succeeded, failed, failures))
+
+
+def import_result(count, seed=0):
+    """Return the response of ``import_job`` for ``count`` imported
+    jobs.
+    """
+    rng = random.Random(seed)
+    succeeded = ''.join('<job index="{0}" href="{1}/job/show/{2}"><id>{2}</id>'
+                        '<name>job {0}</name><group>{3}</group>'
+                        '<project>{4}</project></job>'
+                        .format(i, URL, _uuid(rng), rng.choice(_WORDS),
+                                PROJECT)
+                        for i in range(count))
+    return ('<result success="true" apiversion="13"><succeeded count="{}">{}'
+            '</succeeded><failed count="0"></failed><skipped count="0">'
+            '</skipped></result>'.format(count, succeeded))
+
+
+def system_info(count=None, seed=0):
+    """Return the response of ``system_info``, whose size does not
+    depend on ``count``.
+    """
+    rng = random.Random(seed)
+    return system_info_xml(load=round(rng.random() * 4, 2),
+                           processors=rng.choice((2, 4, 8, 16)),
+                           server_uuid=_uuid(rng))
+
+
+#: The generators by name. Each takes the number of elements of the
+#: document.
+PAYLOADS = {
+    'jobs': jobs,
+    'joblist': joblist,
+    'executions': executions,
+    'delete_jobs': delete_jobs,
+    'import_result': import_result,
+    'system_info': system_info,
+}
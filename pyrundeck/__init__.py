@@ -33,5 +33,28 @@
 __author__ = "Panagiotis Koutsourakis <kutsurak@ekt.gr>"
 __version__ = '0.3.7'
 
+import logging
+
+# pyrundeck does not configure logging; that is left to the application.
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 from .api import RundeckApiClient
-from .exceptions import RundeckException
+from .exceptions import (RundeckException, CircuitOpenError, ThrottledError,
+                         QueueFullError)
+from .retry import RetryPolicy, RetryBudget, CircuitBreaker
+from .throttle import RateLimiter
+from .adaptive import AdaptiveConcurrency
+from .scheduler import RequestScheduler
+from .dedup import LaunchDeduplicator
+from .launch_queue import LaunchQueue
+from .cache import ExecutionCache, ParseMemo, RefreshingCache
+from .shared_cache import SharedCache
+from .prefetch import JobPrefetcher
+from .transport import (RequestsTransport, Urllib3Transport,
+                        MemoryTransport)
+from .cassette import RecordingTransport, ReplayTransport
+from .cluster import RundeckClusterClient
+from .log import QueueLogging
+from .tracing import Tracer
+from .metrics import Metrics
+from . import fork
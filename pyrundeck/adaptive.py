@@ -0,0 +1,284 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Adaptive concurrency control.
+
+:py:class:`AdaptiveConcurrency` adjusts the number of requests a
+:py:class:`pyrundeck.api.RundeckApiClient` keeps in flight, so that
+batch work pushes the server as hard as it can take without tipping it
+over. It follows the AIMD scheme of TCP congestion control: the limit
+grows by one request per round trip while the server keeps up and is
+cut by a constant factor as soon as the server shows signs of
+overload.
+
+Two signals are used. The latency of every response is compared to
+the lowest latency observed recently; a response that takes more than
+``latency_tolerance`` times that long means requests are queueing up
+on the server. In addition the client periodically samples the
+``stats`` section of ``system_info`` and treats a high load average per
+processor, little free memory or too many active threads as overload.
+"""
+
+import logging
+import threading
+import time
+
+from pyrundeck import fork
+
+
+class AdaptiveConcurrency(object):
+    """An AIMD controller for the number of requests in flight.
+
+    See :doc:`usage` for examples.
+
+    :param initial_limit: (optional) The initial limit. *Default
+                          value:* ``4``.
+    :param min_limit: (optional) The limit never drops below this
+                      value. *Default value:* ``1``.
+    :param max_limit: (optional) The limit never grows above this
+                      value. *Default value:* ``64``.
+    :param backoff_ratio: (optional) The factor the limit is multiplied
+                          with on overload. *Default value:* ``0.7``.
+    :param latency_tolerance: (optional) How many times the baseline
+                              latency a response may take before the
+                              server is considered
+                              overloaded. *Default value:* ``2.0``.
+    :param load_threshold: (optional) The highest acceptable load
+                           average per processor. *Default value:*
+                           ``1.0``.
+    :param memory_threshold: (optional) The lowest acceptable fraction
+                             of free memory. *Default value:* ``0.05``.
+    :param threads_threshold: (optional) The highest acceptable number
+                              of active threads, or ``None`` to ignore
+                              it. *Default value:* ``None``.
+    :param sample_interval: (optional) Seconds between two samples of
+                            ``system_info``, or ``None`` to use the
+                            latency signal only. *Default value:*
+                            ``30.0``.
+    """
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+                 backoff_ratio=0.7, latency_tolerance=2.0,
+                 load_threshold=1.0, memory_threshold=0.05,
+                 threads_threshold=None, sample_interval=30.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.load_threshold = load_threshold
+        self.memory_threshold = memory_threshold
+        self.threads_threshold = threads_threshold
+        self.sample_interval = sample_interval
+
+        self.in_flight = 0
+        self.min_latency = None
+        self.smoothed_latency = None
+        self.server_overloaded = False
+        self.server_load = {}
+        self.decrease_count = 0
+
+        self._last_decrease = 0.0
+        self._last_sample = 0.0
+        self._sampling = False
+        self._probe = None
+        self._sampler = None
+        self._sample_wanted = threading.Event()
+        self._cond = threading.Condition()
+        self.logger = logging.getLogger(__name__)
+        fork.register(self)
+
+    def _after_fork(self):
+        # The requests in flight were sent by threads of the parent.
+        self.in_flight = 0
+        self._sampling = False
+        self._probe = None
+        self._sampler = None
+        self._sample_wanted = threading.Event()
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait until another request may be sent."""
+        with self._cond:
+            while self.in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency, failed=False):
+        """Report the outcome of a request sent after :py:meth:`acquire`.
+
+        :param latency: The time in seconds the request took.
+        :param failed: (optional) ``True`` if the server failed to
+                       handle the request.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._observe_latency(latency)
+
+            now = time.time()
+            overloaded = (failed or self.server_overloaded or
+                          self.smoothed_latency >
+                          self.latency_tolerance * self.min_latency)
+            if overloaded:
+                # Decrease at most once per round trip, all the
+                # requests of the same round saw the same overload.
+                if now - self._last_decrease > self.smoothed_latency:
+                    self.limit = max(self.min_limit,
+                                     self.limit * self.backoff_ratio)
+                    self._last_decrease = now
+                    self.decrease_count += 1
+            elif self.in_flight + 1 >= int(self.limit):
+                # Only grow a limit that is actually used
+                self.limit = min(self.max_limit,
+                                 self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        else:
+            # Let the baseline drift upwards slowly, so that a lucky
+            # early sample does not pin it forever.
+            self.min_latency += 0.001 * (latency - self.min_latency)
+
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += 0.2 * (latency - self.smoothed_latency)
+
+    def sample_due(self):
+        """Check whether ``system_info`` should be sampled.
+
+        A ``True`` result reserves the sample: it must be followed by a
+        call to :py:meth:`observe_system_info` or
+        :py:meth:`sample_failed`.
+        """
+        if self.sample_interval is None:
+            return False
+        with self._cond:
+            now = time.time()
+            if self._sampling or now - self._last_sample < \
+                    self.sample_interval:
+                return False
+            self._sampling = True
+            self._last_sample = now
+            return True
+
+    def request_sample(self, probe):
+        """Have ``system_info`` sampled if a sample is due.
+
+        The sample is taken by a single long-lived thread of the
+        controller, so the calling thread does not wait for it.
+
+        :param probe: A callable that returns the native result of
+                      ``system_info``. It must not go through the
+                      controller, which would make the sample wait
+                      behind the requests it is supposed to regulate.
+        """
+        if not self.sample_due():
+            return
+        with self._cond:
+            self._probe = probe
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample,
+                                                 name='pyrundeck-sampler')
+                self._sampler.daemon = True
+                self._sampler.start()
+        self._sample_wanted.set()
+
+    def _sample(self):
+        while True:
+            self._sample_wanted.wait()
+            self._sample_wanted.clear()
+            with self._cond:
+                probe, self._probe = self._probe, None
+            if probe is None:
+                continue
+            try:
+                self.observe_system_info(probe())
+            except Exception as ex:
+                self.logger.warning('could not sample server load: {}'
+                                    .format(ex))
+                self.sample_failed()
+
+    def sample_failed(self):
+        """Report that a sample of ``system_info`` could not be taken."""
+        with self._cond:
+            self._sampling = False
+
+    def observe_system_info(self, system_info):
+        """Update the server load from a ``system_info`` result.
+
+        :param system_info: The native result of
+                            :py:meth:`pyrundeck.endpoints.EndpointMixins.system_info`.
+        """
+        stats = system_info['system']['stats']
+        processors = max(1, int(stats['cpu']['processors']))
+        load = float(stats['cpu']['loadAverage']['load']) / processors
+        memory = stats['memory']
+        free_memory = float(memory['free']) / max(1.0, float(memory['max']))
+        active_threads = int(stats['threads']['active'])
+
+        overloaded = (load > self.load_threshold or
+                      free_memory < self.memory_threshold or
+                      (self.threads_threshold is not None and
+                       active_threads > self.threads_threshold))
+
+        with self._cond:
+            self.server_load = {
+                'load_per_processor': load,
+                'free_memory': free_memory,
+                'active_threads': active_threads,
+            }
+            self.server_overloaded = overloaded
+            self._sampling = False
+        self.logger.debug('server load = {}, overloaded = {}'
+                          .format(self.server_load, overloaded))
+
+    def stats(self):
+        """Return the state of the controller.
+
+        :return: A dictionary with the current ``'limit'``, the number
+                 of requests ``'in_flight'``, the ``'min_latency'`` and
+                 ``'smoothed_latency'`` in seconds, the number of
+                 times the limit was decreased (``'decreases'``) and the
+                 last ``'server_load'`` sampled.
+        """
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'min_latency': self.min_latency,
+                'smoothed_latency': self.smoothed_latency,
+                'decreases': self.decrease_count,
+                'server_overloaded': self.server_overloaded,
+                'server_load': dict(self.server_load),
+            }
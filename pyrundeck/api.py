@@ -36,20 +36,52 @@ The general idea is to abstract away all possible requests into three
 methods (``RundeckApiClient.get``, ``RundeckApiClient.post`` and
 ``RundeckApiClient.delete``), that call the same method
 ``RundeckApiClient._perform_request`` that performs the actual
-request.
+request through a transport (see :py:mod:`pyrundeck.transport`).
 """
 
+import copy
+import functools
+import hashlib
 import logging
-from lxml import etree
-import requests
+import time
 
-from pyrundeck.endpoints import EndpointMixins
+from pyrundeck.endpoints import (EndpointMixins, find_endpoint,
+                                 endpoint_by_name)
+from pyrundeck.exceptions import RundeckException
 from pyrundeck import __version__
-from pyrundeck.helpers import _transparent_params
+from pyrundeck.helpers import _transparent_params, _LazyModule
+from pyrundeck.rundeck_parser import parse
+from pyrundeck import tracing
+from pyrundeck.transport import RequestsTransport
+
+etree = _LazyModule('lxml.etree')
 
 __author__ = "Panagiotis Koutsourakis <kutsurak@ekt.gr>"
 
 
+def _partition(token):
+    """Derive the cache partition of a token, without revealing the
+    token in keys that may end up on disk.
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+
+
+def _response_body(response):
+    """Return the raw bytes of a response body."""
+    content = getattr(response, 'content', None)
+    if isinstance(content, bytes):
+        return content
+    return response.text.encode('utf-8')
+
+
+def _in_span(span, fn, *args):
+    """Call ``fn`` on a thread of the scheduler, in the span of the
+    caller.
+    """
+    with tracing.activate(span):
+        return fn(*args)
+
+
 class RundeckApiClient(EndpointMixins):
     """The Rundeck API wrapper. This class is used to interact with the
     Rundeck server. In order to instantiate it you need to provide at
@@ -65,16 +97,83 @@ class RundeckApiClient(EndpointMixins):
                         every request. This should be a dictionary,
                         notably containing a key
                         ``'headers'``. *Default value:* ``None``.
-    :param log_level: (optional) The level at which logging happens.
-                      *Default value:* ``logging.INFO``.
+    :param log_level: (optional) If given, the level of the logger of
+                      the client. The client never configures logging
+                      otherwise; see :py:mod:`pyrundeck.log` for
+                      writing its records without blocking the caller.
+                      *Default value:* ``None``.
+    :param retry_policy: (optional) A
+                         :py:class:`pyrundeck.retry.RetryPolicy` that
+                         decides how failed requests are retried. If
+                         ``None`` requests are never
+                         retried. *Default value:* ``None``.
+    :param rate_limiter: (optional) A
+                         :py:class:`pyrundeck.throttle.RateLimiter`
+                         that limits the rate and concurrency of the
+                         requests. It is shared by all the threads
+                         using this client. *Default value:* ``None``.
+    :param adaptive_concurrency: (optional) A
+                                 :py:class:`pyrundeck.adaptive.AdaptiveConcurrency`
+                                 controller that adjusts the number of
+                                 requests in flight to the load of the
+                                 server. *Default value:* ``None``.
+    :param scheduler: (optional) A
+                      :py:class:`pyrundeck.scheduler.RequestScheduler`
+                      whose workers perform the requests of this client
+                      in order of priority. *Default value:* ``None``.
+    :param launch_deduplicator: (optional) A
+                                :py:class:`pyrundeck.dedup.LaunchDeduplicator`
+                                that makes identical ``run_job`` calls
+                                share one execution. *Default value:*
+                                ``None``.
+    :param execution_cache: (optional) A
+                            :py:class:`pyrundeck.cache.ExecutionCache`
+                            for finished executions. *Default value:*
+                            ``None``.
+    :param parse_memo: (optional) A
+                       :py:class:`pyrundeck.cache.ParseMemo` that
+                       reuses the parse results of identical
+                       responses. *Default value:* ``None``.
+    :param refresh_cache: (optional) A
+                          :py:class:`pyrundeck.cache.RefreshingCache`
+                          that serves selected endpoints from memory and
+                          refreshes them in the background. *Default
+                          value:* ``None``.
+    :param shared_cache: (optional) A
+                         :py:class:`pyrundeck.shared_cache.SharedCache`
+                         that shares results of selected endpoints with
+                         the other processes of the host. *Default
+                         value:* ``None``.
+    :param prefetcher: (optional) A
+                       :py:class:`pyrundeck.prefetch.JobPrefetcher`
+                       that fetches the definitions of listed jobs in
+                       the background. *Default value:* ``None``.
+    :param transport: (optional) The
+                      :py:class:`pyrundeck.transport.Transport` that
+                      sends the requests. *Default value:* a new
+                      :py:class:`pyrundeck.transport.RequestsTransport`,
+                      with a :py:class:`pyrundeck.tls.ResumingSSLContext`
+                      for ``https`` URLs.
+    :param tracer: (optional) A :py:class:`pyrundeck.tracing.Tracer`
+                   that records the timings of every endpoint call.
+                   *Default value:* ``None``.
     """
     def __init__(self, token, root_url, pem_file_path=None,
-                 client_args=None, log_level=logging.INFO):
+                 client_args=None, log_level=None,
+                 retry_policy=None, rate_limiter=None,
+                 adaptive_concurrency=None, scheduler=None,
+                 launch_deduplicator=None, execution_cache=None,
+                 parse_memo=None, refresh_cache=None, shared_cache=None,
+                 prefetcher=None, transport=None, tracer=None):
         if root_url.endswith('/'):
             self.root_url = root_url[:-1]
         else:
             self.root_url = root_url
         self.token = token
+        #: A short hash of the token. Caches shared by clients with
+        #: different tokens (see :py:meth:`for_token`) keep the results
+        #: of every partition apart.
+        self.partition = _partition(token)
 
         default_headers = {'User-Agent': 'PyRundeck v ' + __version__}
 
@@ -92,23 +191,134 @@ class RundeckApiClient(EndpointMixins):
             else:
                 self.client_args['verify'] = True
 
-        # TODO pass this as an arg? Timestamp it?
-        logging.basicConfig(level=log_level, filename='pyrundeck.log')
         self.logger = logging.getLogger(__name__)
+        if log_level is not None:
+            self.logger.setLevel(log_level)
 
         self.pem_file_path = pem_file_path
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.adaptive_concurrency = adaptive_concurrency
+        self.scheduler = scheduler
+        self.launch_deduplicator = launch_deduplicator
+        self.execution_cache = execution_cache
+        self.parse_memo = parse_memo
+        self.refresh_cache = refresh_cache
+        self.shared_cache = shared_cache
+        self.prefetcher = prefetcher
+        self.tracer = tracer
+        if transport is None:
+            # The CA bundle is loaded once, instead of for every new
+            # connection. Without a pem_file_path requests picks the
+            # bundle, e.g. from REQUESTS_CA_BUNDLE, so it is left to it.
+            context = None
+            if self.root_url.startswith('https') and \
+                    pem_file_path is not None:
+                from pyrundeck.tls import ssl_context
+                context = ssl_context(pem_file_path)
+            transport = RequestsTransport(ssl_context=context)
+        self.transport = transport
+
+    def for_token(self, token):
+        """Return a client that authenticates with ``token`` and shares
+        everything else with this client: the transport and its
+        connections, the caches, the limits and the scheduler.
+
+        Cached results are kept apart per token, in the
+        :py:attr:`partition` of the client. Creating a client this way
+        is cheap, so a service acting for many users can create one per
+        call.
+
+        :param token: The Rundeck access token of the new client.
+        :return: A new client.
+        """
+        view = copy.copy(self)
+        view.token = token
+        view.partition = _partition(token)
+        view.client_args = dict(self.client_args)
+        headers = dict(self.client_args['headers'])
+        headers['X-Rundeck-Auth-Token'] = token
+        view.client_args['headers'] = headers
+        return view
+
+    def _find_endpoint(self, method, url):
+        """Find the description of the endpoint a request is sent to."""
+        if url.startswith(self.root_url):
+            url = url[len(self.root_url):]
+        return find_endpoint(method, url)
+
+    def _send(self, endpoint, method, url, requests_args):
+        """Send a single request, respecting the client side limits."""
+        if self.rate_limiter is None:
+            return self._send_adaptive(method, url, requests_args)
+
+        with self.rate_limiter.limit(endpoint['class']):
+            return self._send_adaptive(method, url, requests_args)
+
+    def _send_adaptive(self, method, url, requests_args):
+        span = tracing.current_span()
+        if span is not None:
+            span.requests += 1
+        controller = self.adaptive_concurrency
+        if controller is None:
+            return self.transport.request(method, url, **requests_args)
+
+        controller.acquire()
+        start = time.time()
+        failed = True
+        try:
+            response = self.transport.request(method, url, **requests_args)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            controller.release(time.time() - start, failed)
+            controller.request_sample(self._probe_server_load)
+
+    def _probe_server_load(self):
+        """Fetch ``system_info`` for the adaptive concurrency controller.
+
+        The request goes straight to the transport: it must neither
+        wait behind the limits it feeds nor be answered from a cache.
+        """
+        requests_args = dict(self.client_args)
+        requests_args['params'] = {}
+        response = self.transport.request(
+            'GET', '{}/api/1/system/info'.format(self.root_url),
+            **requests_args)
+        if response.status_code != 200:
+            raise RundeckException('system_info returned status {}'
+                                   .format(response.status_code))
+        return parse(etree.fromstring(response.text))
 
     def _perform_request(self, url, method='GET', params=None):
         """Perform the request.
 
-        This method uses the ``requests`` library to perform a request
-        to the Rundeck API.
+        This method uses the transport of the client to perform a
+        request to the Rundeck API. If the client has a scheduler, the request
+        is performed by one of its workers and the calling thread waits
+        for the result.
         """
-        self.logger.debug('params = {}'.format(params))
+        endpoint = self._find_endpoint(method, url)
+        if self.scheduler is not None and not self.scheduler.in_worker():
+            execute = self._execute_request
+            span = tracing.current_span()
+            if span is not None:
+                execute = functools.partial(_in_span, span, execute)
+            future = self.scheduler.submit(endpoint['priority'], execute,
+                                           endpoint, url, method, params)
+            return future.result()
+
+        return self._execute_request(endpoint, url, method, params)
+
+    def _execute_request(self, endpoint, url, method, params):
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug('params = {}'.format(params))
         params = params or {}
 
         params, files = _transparent_params(params)
-        self.logger.debug('params = {}'.format(params))
+        if debug:
+            self.logger.debug('params = {}'.format(params))
         requests_args = {}
         for key, val in self.client_args.items():
             requests_args[key] = val
@@ -121,21 +331,65 @@ class RundeckApiClient(EndpointMixins):
         else:
             requests_args['params'] = params
 
-        self.logger.debug('request args = {}'.format(requests_args))
+        if debug:
+            self.logger.debug('request args = {}'.format(requests_args))
+
+        def send():
+            return self._send(endpoint, method, url, requests_args)
 
-        response = requests.request(method, url, **requests_args)
+        if self.retry_policy is None:
+            response = send()
+        else:
+            response = self.retry_policy.call(endpoint, send)
+
+        if debug:
+            self.logger.debug('status = {}'.format(response.status_code))
+            self.logger.debug('text = {}'.format(response.text))
 
-        self.logger.debug('status = {}'.format(response.status_code))
-        self.logger.debug('text = {}'.format(response.text))
+        span = tracing.current_span()
+        if span is not None:
+            span.url = url
+            span.status = response.status_code
+            span.response_bytes = len(_response_body(response))
 
         if response.text != '':
             if params.get('format') == 'yaml':
                 return response.status_code, response.text
+            elif span is not None:
+                with span.timing('xml_parse'):
+                    return response.status_code, self._tree(response)
             else:
-                return response.status_code, etree.fromstring(response.text)
+                return response.status_code, self._tree(response)
         else:
             return response.status_code, None
 
+    def _tree(self, response):
+        """Parse the XML body of a response."""
+        if self.parse_memo is not None:
+            return self.parse_memo.tree(_response_body(response))
+        return etree.fromstring(response.text)
+
+    def submit(self, endpoint, priority=None, **params):
+        """Call an endpoint asynchronously on the scheduler.
+
+        :param endpoint: The name of the endpoint method, e.g.
+                         ``'export_jobs'``.
+        :param priority: (optional) The priority class of the call. If
+                         ``None`` the default class of the endpoint is
+                         used (see
+                         :py:data:`pyrundeck.endpoints.ENDPOINTS`).
+        :param params: The arguments of the endpoint method.
+        :return: A ``concurrent.futures.Future`` that resolves to the
+                 result of the endpoint method.
+        :raises RundeckException: If the client has no scheduler.
+        """
+        if self.scheduler is None:
+            raise RundeckException('submit requires a scheduler')
+        if priority is None:
+            priority = endpoint_by_name(endpoint)['priority']
+        return self.scheduler.submit(priority, getattr(self, endpoint),
+                                     **params)
+
     def get(self, url, params=None):
         """Perform a GET request to the specified url passing the specified
         params.
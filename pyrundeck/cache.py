@@ -0,0 +1,629 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Caches for the results of the Rundeck API.
+
+An execution that has finished never changes again, so once it has
+been downloaded it does not have to be downloaded again. An
+:py:class:`ExecutionCache` attached to a
+:py:class:`pyrundeck.api.RundeckApiClient` keeps finished executions in
+memory, spilling them to disk if a directory is given, and
+``execution_info`` only queries the server for executions that are
+still running or that it has not seen yet.
+
+Health checks and dashboards call a few cheap endpoints constantly. A
+:py:class:`RefreshingCache` serves their last result immediately and
+refreshes it in the background once it gets old.
+
+Pollers tend to receive the same response over and over. A
+:py:class:`ParseMemo` remembers the XML tree and the native result
+built for a response body, so that an identical body is neither parsed
+nor converted again.
+"""
+
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.helpers import _LazyModule
+from pyrundeck.rundeck_parser import parse
+
+etree = _LazyModule('lxml.etree')
+
+
+TERMINAL_STATUSES = frozenset(['succeeded', 'failed', 'aborted'])
+
+
+def is_terminal(execution):
+    """Check whether an execution has finished for good.
+
+    :param execution: A native execution, as found in the result of
+                      ``execution_info``.
+    """
+    return (execution.get('status') in TERMINAL_STATUSES and
+            'date-ended' in execution)
+
+
+class LRUCache(object):
+    """A thread safe, size bounded, least recently used cache.
+
+    :param max_entries: The maximum number of entries.
+    :param on_evict: (optional) A callable that is passed the key and
+                     the value of every entry that is evicted.
+    """
+    def __init__(self, max_entries, on_evict=None):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value of ``key``, or ``default`` if it is not
+        cached.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache ``value`` under ``key``, evicting the least recently
+        used entry if the cache is full.
+        """
+        evicted = []
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        if self.on_evict is not None:
+            for k, v in evicted:
+                self.on_evict(k, v)
+
+    def setdefault(self, key, value):
+        """Return the value of ``key``, caching ``value`` under it first
+        if it is not cached, evicting the least recently used entry if
+        the cache is full.
+        """
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                existing = self._entries.pop(key)
+                self._entries[key] = existing
+                return existing
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        if self.on_evict is not None:
+            for k, v in evicted:
+                self.on_evict(k, v)
+        return value
+
+    def pop(self, key, default=None):
+        """Remove ``key`` from the cache and return its value."""
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        """Remove all the entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self):
+        """Return the keys, from the least to the most recently used."""
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class ExecutionCache(object):
+    """A cache for finished executions.
+
+    The cache stores the result ``execution_info`` would return for
+    every finished execution it sees, whether it comes from
+    ``execution_info`` itself or from a history scan with
+    ``job_executions_info``.
+
+    See :doc:`usage` for examples.
+
+    :param max_entries: (optional) The maximum number of executions
+                        kept in memory. *Default value:* ``10000``.
+    :param spill_dir: (optional) A directory where executions evicted
+                      from memory are stored, or ``None`` to discard
+                      them. *Default value:* ``None``.
+    :param max_spilled: (optional) The maximum number of executions
+                        stored in ``spill_dir``; the ones stored first
+                        are deleted to make room. *Default value:*
+                        ``100000``.
+
+    A failure to store an execution on disk, e.g. because the disk is
+    full, is logged and counted; the execution is then simply no longer
+    cached.
+
+    Clients with different tokens may see different executions, so
+    :py:meth:`get` and :py:meth:`store` take the ``partition`` of the
+    client (see :py:attr:`pyrundeck.api.RundeckApiClient.partition`).
+    """
+    def __init__(self, max_entries=10000, spill_dir=None,
+                 max_spilled=100000):
+        self.spill_dir = spill_dir
+        self.max_spilled = max_spilled
+        self.spill_hits = 0
+        self.spill_errors = 0
+        self.logger = logging.getLogger(__name__)
+        on_evict = self._spill if spill_dir is not None else None
+        self._memory = LRUCache(max_entries, on_evict=on_evict)
+        # The names of the spilled files, from the oldest to the newest.
+        self._spilled = collections.OrderedDict()
+        self._spill_lock = threading.Lock()
+        if spill_dir is not None:
+            if not os.path.isdir(spill_dir):
+                os.makedirs(spill_dir)
+            self._spilled.update((name, None)
+                                 for name in self._spilled_files())
+        fork.register(self)
+
+    def _after_fork(self):
+        self._spill_lock = threading.Lock()
+
+    def _spilled_files(self):
+        """Return the names of the spilled files, oldest first."""
+        files = []
+        for name in os.listdir(self.spill_dir):
+            if name.endswith('.json'):
+                try:
+                    mtime = os.path.getmtime(os.path.join(self.spill_dir,
+                                                          name))
+                except OSError:
+                    continue
+                files.append((mtime, name))
+        return [name for _, name in sorted(files)]
+
+    def _spill_path(self, execution_id):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(execution_id))
+        return os.path.join(self.spill_dir, name + '.json')
+
+    def _spill(self, execution_id, result):
+        # Write to a temporary file first, so that readers never see a
+        # partially written execution.
+        path = self._spill_path(execution_id)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.spill_dir)
+            with os.fdopen(fd, 'w') as fl:
+                json.dump(result, fl)
+            os.rename(tmp_path, path)
+        except (IOError, OSError, TypeError, ValueError) as ex:
+            self.spill_errors += 1
+            self.logger.warning('could not spill execution {}: {}'
+                                .format(execution_id, ex))
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+
+        name = os.path.basename(path)
+        with self._spill_lock:
+            self._spilled.pop(name, None)
+            self._spilled[name] = None
+            expired = []
+            while len(self._spilled) > self.max_spilled:
+                expired.append(self._spilled.popitem(last=False)[0])
+        for name in expired:
+            try:
+                os.remove(os.path.join(self.spill_dir, name))
+            except OSError:
+                pass
+
+    def _key(self, execution_id, partition):
+        if partition is None:
+            return str(execution_id)
+        return '{}-{}'.format(partition, execution_id)
+
+    def get(self, execution_id, partition=None):
+        """Return the cached ``execution_info`` result of an execution.
+
+        :return: A copy of the result, or ``None`` if the execution is
+                 not cached.
+        """
+        execution_id = self._key(execution_id, partition)
+        result = self._memory.get(execution_id)
+        if result is None and self.spill_dir is not None:
+            try:
+                with open(self._spill_path(execution_id)) as fl:
+                    result = json.load(fl)
+            except (IOError, OSError, ValueError):
+                return None
+            self.spill_hits += 1
+            self._memory.set(execution_id, result)
+        return copy.deepcopy(result)
+
+    def store(self, result, partition=None):
+        """Cache the finished executions of a native result.
+
+        :param result: The native result of ``execution_info`` or
+                       ``job_executions_info``.
+        :param partition: (optional) The partition of the client that
+                          received the result. *Default value:*
+                          ``None``.
+        """
+        executions = result.get('executions')
+        if not isinstance(executions, dict):
+            return
+        envelope = dict((k, v) for k, v in result.items()
+                        if k != 'executions')
+        for execution in executions.get('list', []):
+            if is_terminal(execution):
+                single = dict(envelope)
+                single['executions'] = {
+                    'count': 1,
+                    'list': [copy.deepcopy(execution)],
+                }
+                self._memory.set(self._key(execution['id'], partition),
+                                 single)
+
+    def clear(self):
+        """Remove all the executions from memory and disk."""
+        self._memory.clear()
+        if self.spill_dir is not None:
+            with self._spill_lock:
+                self._spilled.clear()
+            for name in os.listdir(self.spill_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.spill_dir, name))
+
+    def stats(self):
+        """Return the counters of the cache.
+
+        :return: A dictionary with the number of executions in memory
+                 (``'entries'``) and on disk (``'spilled'``), the number
+                 of ``'hits'``, ``'misses'`` and hits served from disk
+                 (``'spill_hits'``), and the number of executions that
+                 could not be stored on disk (``'spill_errors'``).
+        """
+        return {
+            'entries': len(self._memory),
+            'spilled': len(self._spilled),
+            'hits': self._memory.hits + self.spill_hits,
+            'misses': self._memory.misses - self.spill_hits,
+            'spill_hits': self.spill_hits,
+            'spill_errors': self.spill_errors,
+        }
+
+
+class _MemoEntry(object):
+    __slots__ = ('tree', 'native')
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.native = None
+
+
+class ParseMemo(object):
+    """Reuse the parse results of identical response bodies.
+
+    Bodies are identified by their SHA-1 digest. For a body that was
+    seen before, :py:meth:`tree` returns the same ``lxml.etree`` object
+    instead of parsing the body again, and :py:meth:`native` returns
+    the native result already built from that tree.
+
+    .. warning:: Trees and native results are shared by every caller
+                 that receives the same body, so they must be treated
+                 as read-only.
+
+    See :doc:`usage` for examples.
+
+    :param max_entries: (optional) The maximum number of distinct
+                        bodies remembered. *Default value:* ``128``.
+    """
+    def __init__(self, max_entries=128):
+        self.native_hits = 0
+        self._entries = LRUCache(max_entries, on_evict=self._evicted)
+        # Maps id(tree) to the entry holding the tree. The entry keeps
+        # the tree alive, so the id cannot be reused while it is here.
+        self._by_tree = {}
+        self._lock = threading.Lock()
+
+    def _evicted(self, key, entry):
+        with self._lock:
+            if self._by_tree.get(id(entry.tree)) is entry:
+                del self._by_tree[id(entry.tree)]
+
+    def tree(self, body):
+        """Return the XML tree of a response body.
+
+        :param body: The raw bytes of the response body.
+        :return: The ``lxml.etree`` object for the body.
+        """
+        key = hashlib.sha1(body).digest()
+        entry = self._entries.get(key)
+        if entry is None:
+            parsed = _MemoEntry(etree.fromstring(body))
+            # Registered before it can be evicted, so that _evicted
+            # always finds it.
+            with self._lock:
+                self._by_tree[id(parsed.tree)] = parsed
+            # Another thread may have parsed the same body meanwhile;
+            # its entry is kept and never replaced.
+            entry = self._entries.setdefault(key, parsed)
+            if entry is not parsed:
+                self._evicted(key, parsed)
+        return entry.tree
+
+    def native(self, tree):
+        """Return the native result of a tree.
+
+        Trees returned by :py:meth:`tree` are converted only once;
+        other trees are simply passed to
+        :py:func:`pyrundeck.rundeck_parser.parse`.
+        """
+        with self._lock:
+            entry = self._by_tree.get(id(tree))
+        if entry is None or entry.tree is not tree:
+            return parse(tree)
+        if entry.native is None:
+            entry.native = parse(tree)
+        else:
+            self.native_hits += 1
+        return entry.native
+
+    def stats(self):
+        """Return the counters of the memo.
+
+        :return: A dictionary with the number of bodies remembered
+                 (``'entries'``), the number of bodies that did not
+                 have to be parsed (``'hits'``) or had to be parsed
+                 (``'misses'``) and the number of native results that
+                 were reused (``'native_hits'``).
+        """
+        return {
+            'entries': len(self._entries),
+            'hits': self._entries.hits,
+            'misses': self._entries.misses,
+            'native_hits': self.native_hits,
+        }
+
+
+class _RefreshEntry(object):
+    __slots__ = ('value', 'fetched', 'refreshing', 'failures', 'failed_at')
+
+    def __init__(self, value, fetched):
+        self.value = value
+        self.fetched = fetched
+        self.refreshing = False
+        self.failures = 0
+        self.failed_at = None
+
+
+class RefreshingCache(object):
+    """A stale-while-revalidate cache for selected endpoints.
+
+    The endpoints and their time limits are given as a dictionary from
+    the endpoint name to a dictionary with the keys ``'soft_ttl'`` and
+    ``'hard_ttl'`` (in seconds)::
+
+        RefreshingCache({
+            'system_info': {'soft_ttl': 10, 'hard_ttl': 300},
+            'list_jobs': {'soft_ttl': 30, 'hard_ttl': 600},
+        })
+
+    A result younger than its soft TTL is served from the cache. An
+    older result is still served immediately, while a background
+    thread fetches a new one. Only a result older than its hard TTL,
+    or a missing one, makes the caller wait for the server; callers
+    that miss the same result at the same time share a single call.
+    Failed refreshes keep the old result and are counted. After a
+    failure the next refresh waits for the soft TTL, doubled for every
+    further failure in a row.
+
+    Only results with status ``200`` are cached. Results are shared by
+    all the callers with the same token, so they must be treated as
+    read-only.
+
+    See :doc:`usage` for examples.
+
+    :param endpoints: The cached endpoints and their time limits.
+    :param workers: (optional) The number of threads refreshing
+                    entries. *Default value:* ``2``.
+    :param max_entries: (optional) The maximum number of results kept,
+                        over all the endpoints, tokens and parameters;
+                        the least recently used are dropped. *Default
+                        value:* ``1024``.
+    """
+    def __init__(self, endpoints, workers=2, max_entries=1024):
+        self.endpoints = endpoints
+        self.workers = workers
+        self.logger = logging.getLogger(__name__)
+        self._entries = LRUCache(max_entries)
+        self._stats = dict((name, {'hits': 0, 'stale_hits': 0, 'misses': 0,
+                                   'refreshes': 0, 'refresh_errors': 0,
+                                   'last_error': None})
+                           for name in endpoints)
+        self._executor = None
+        # The calls in flight for missing results, by key.
+        self._fetching = {}
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def _after_fork(self):
+        # The refreshing threads of the parent do not exist in a child.
+        self._executor = None
+        self._fetching = {}
+        self._lock = threading.Lock()
+        for key in self._entries.keys():
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refreshing = False
+
+    def handles(self, name):
+        """Check whether the endpoint ``name`` is cached."""
+        return name in self.endpoints
+
+    def call(self, name, args, params, fetch, partition=None):
+        """Return the result of an endpoint call, from the cache if
+        possible.
+
+        :param name: The name of the endpoint.
+        :param args: The positional arguments of the call.
+        :param params: The keyword arguments of the call.
+        :param fetch: A callable without arguments that performs the
+                      call.
+        :param partition: (optional) The partition of the calling
+                          client. *Default value:* ``None``.
+        """
+        key = (name, partition, repr(args),
+               repr(sorted(params.items())))
+        limits = self.endpoints[name]
+        stats = self._stats[name]
+        now = time.time()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and \
+                    now - entry.fetched < limits['hard_ttl']:
+                if now - entry.fetched < limits['soft_ttl']:
+                    stats['hits'] += 1
+                else:
+                    stats['stale_hits'] += 1
+                    if not entry.refreshing and (
+                            entry.failed_at is None or
+                            now - entry.failed_at >= limits['soft_ttl'] *
+                            2 ** (entry.failures - 1)):
+                        entry.refreshing = refresh = True
+                value = entry.value
+            else:
+                if entry is not None:
+                    self._entries.pop(key)
+                stats['misses'] += 1
+                value = None
+                future = self._fetching.get(key)
+                fetching = future is None
+                if fetching:
+                    future = self._fetching[key] = Future()
+
+        if value is None:
+            if not fetching:
+                return future.result()
+            return self._fetch(key, fetch, future)
+        if refresh:
+            if self._executor is None:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(self.workers)
+            self._executor.submit(self._refresh, name, key, fetch)
+        return value
+
+    def _fetch(self, key, fetch, future):
+        try:
+            value = fetch()
+        except BaseException as ex:
+            with self._lock:
+                del self._fetching[key]
+            future.set_exception(ex)
+            raise
+        with self._lock:
+            if value[0] == 200:
+                self._entries.set(key, _RefreshEntry(value, time.time()))
+            del self._fetching[key]
+        future.set_result(value)
+        return value
+
+    def _refresh(self, name, key, fetch):
+        stats = self._stats[name]
+        try:
+            value = fetch()
+            if value[0] != 200:
+                raise ValueError('status {}'.format(value[0]))
+        except Exception as ex:
+            self.logger.warning('refresh of {} failed: {}'.format(name, ex))
+            with self._lock:
+                stats['refresh_errors'] += 1
+                stats['last_error'] = (time.time(), str(ex))
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+                    entry.failures += 1
+                    entry.failed_at = time.time()
+            return
+
+        with self._lock:
+            stats['refreshes'] += 1
+            self._entries.set(key, _RefreshEntry(value, time.time()))
+
+    def invalidate(self, name=None):
+        """Drop the cached results of the endpoint ``name``, or of all
+        the endpoints if ``name`` is ``None``.
+        """
+        with self._lock:
+            for key in self._entries.keys():
+                if name is None or key[0] == name:
+                    self._entries.pop(key)
+
+    def stats(self):
+        """Return the counters of the cache.
+
+        :return: A dictionary from endpoint name to a dictionary with
+                 the number of fresh ``'hits'``, ``'stale_hits'``,
+                 ``'misses'``, background ``'refreshes'`` and
+                 ``'refresh_errors'``, and the time and message of the
+                 ``'last_error'``.
+        """
+        with self._lock:
+            return dict((name, dict(stats))
+                        for name, stats in self._stats.items())
@@ -0,0 +1,396 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Recording the exchanges of a client with Rundeck, and replaying
+them.
+
+A :py:class:`RecordingTransport` sends the requests of a client
+through another transport and writes every request and its response
+to a cassette file. A :py:class:`ReplayTransport` answers the requests
+of a client from a cassette, without a server, and :py:func:`replay`
+makes the recorded calls again through a client, at the original pace
+or faster. Together they turn the traffic of a real application into a
+repeatable benchmark.
+
+A cassette is a file of JSON lines, compressed with gzip if its name
+ends with ``.gz``. Every line is either a response body, stored once
+however many responses have it, or an exchange: the offset from the
+start of the recording, the method, URL, ``params``, ``data`` and
+uploaded files of the request, and the status, content type, body and
+duration of the response, or the error raised instead. The headers of
+the requests, which hold the token, are not recorded.
+"""
+
+import base64
+import collections
+import gzip
+import hashlib
+import io
+import json
+import logging
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.endpoints import find_endpoint
+from pyrundeck.helpers import _LazyModule
+from pyrundeck.transport import (Transport, RequestsTransport, Response,
+                                 _api_path)
+
+requests = _LazyModule('requests')
+
+
+VERSION = 1
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    return open(path, mode + 'b')
+
+
+def _lines(path):
+    """Yield the lines of the cassette at ``path``."""
+    pending = b''
+    with _open(path, 'r') as f:
+        # read1 returns the data decompressed so far before the end of
+        # an interrupted cassette is reached. Python 2 files lack it.
+        read = getattr(f, 'read1', f.read)
+        while True:
+            try:
+                chunk = read(65536)
+            except (EOFError, IOError, OSError):
+                # The end of a compressed cassette that was not closed.
+                break
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line
+    if pending:
+        yield pending
+
+
+def _body_of(response):
+    content = getattr(response, 'content', None)
+    if isinstance(content, bytes):
+        return content
+    return response.text.encode('utf-8')
+
+
+def _key(method, url, params, data):
+    """Return the key that tells a request apart from others."""
+    fields = sorted((str(k), str(v))
+                    for values in (params, data) if values
+                    for k, v in values.items())
+    return method, _api_path(url), tuple(fields)
+
+
+def load(path):
+    """Return the exchanges recorded in the cassette at ``path``.
+
+    A cassette whose recording was interrupted is read up to the last
+    complete exchange.
+
+    :return: A list of dictionaries, in the order the requests were
+             sent, with the ``'at'`` offset of the request in seconds,
+             the ``'method'``, ``'url'``, ``'params'``, ``'data'`` and
+             ``'files'`` (a dictionary from field to file name and
+             content) of the request, and either the ``'status'``,
+             ``'content_type'``, ``'body'`` and ``'elapsed'`` seconds of
+             the response, or the ``'error'`` raised, as a pair of the
+             name of the ``requests`` exception and its message.
+    """
+    bodies = {}
+    exchanges = []
+    for line in _lines(path):
+        try:
+            record = json.loads(line.decode('utf-8'))
+        except ValueError:
+            # A line cut short by an interrupted recording.
+            break
+        if 'cassette' in record:
+            continue
+        if 'id' in record:
+            if 'base64' in record:
+                body = base64.b64decode(record['base64'])
+            else:
+                body = record['text'].encode('utf-8')
+            bodies[record['id']] = body
+            continue
+        if 'body' in record:
+            record['body'] = bodies[record['body']]
+        record['files'] = dict(
+            (name, (filename, bodies[body]))
+            for name, (filename, body) in record.get('files', {}).items())
+        exchanges.append(record)
+    return exchanges
+
+
+class RecordingTransport(Transport):
+    """Send requests through another transport and record them to a
+    cassette.
+
+    The cassette is complete once :py:meth:`close` is called. A forked
+    child process sends its requests without recording them.
+
+    :param path: The path of the cassette. It is compressed if it ends
+                 with ``.gz``.
+    :param transport: (optional) The transport that sends the requests.
+                      *Default value:* a new
+                      :py:class:`pyrundeck.transport.RequestsTransport`.
+    """
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport if transport is not None \
+            else RequestsTransport()
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._bodies = set()
+        self._start = None
+        self._file = _open(path, 'w')
+        self._write({'cassette': VERSION, 'recorded': time.time()})
+        fork.register(self)
+
+    def _after_fork(self):
+        # The file belongs to the parent, which goes on writing to it.
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, sort_keys=True)
+                         .encode('utf-8') + b'\n')
+
+    def _body_id(self, body):
+        """Write ``body`` unless already written, and return its id."""
+        body_id = hashlib.sha1(body).hexdigest()[:16]
+        if body_id not in self._bodies:
+            self._bodies.add(body_id)
+            record = {'id': body_id}
+            try:
+                record['text'] = body.decode('utf-8')
+            except UnicodeDecodeError:
+                record['base64'] = base64.b64encode(body).decode('ascii')
+            self._write(record)
+        return body_id
+
+    def request(self, method, url, **kwargs):
+        files = {}
+        if kwargs.get('files'):
+            # The files are read for the cassette, and sent from memory.
+            sent = {}
+            for name, f in kwargs['files'].items():
+                content = f.read()
+                if not isinstance(content, bytes):
+                    content = content.encode('utf-8')
+                copy = io.BytesIO(content)
+                copy.name = getattr(f, 'name', name)
+                sent[name] = copy
+                files[name] = (copy.name, content)
+            kwargs = dict(kwargs, files=sent)
+
+        start = time.time()
+        response = error = None
+        try:
+            response = self.transport.request(method, url, **kwargs)
+        except Exception as ex:
+            error = ex
+            raise
+        finally:
+            elapsed = time.time() - start
+            try:
+                self._record(start, elapsed, method, url, kwargs, files,
+                             response, error)
+            except Exception:
+                self.logger.exception('recording {} {} failed'
+                                      .format(method, url))
+        return response
+
+    def _record(self, start, elapsed, method, url, kwargs, files, response,
+                error):
+        with self._lock:
+            if self._file is None:
+                return
+            if self._start is None:
+                self._start = start
+            record = {
+                'at': start - self._start,
+                'elapsed': elapsed,
+                'method': method,
+                'url': url,
+                'params': kwargs.get('params') or {},
+                'data': kwargs.get('data') or {},
+            }
+            if files:
+                record['files'] = dict(
+                    (name, (filename, self._body_id(content)))
+                    for name, (filename, content) in files.items())
+            if error is not None:
+                record['error'] = (type(error).__name__, str(error))
+            else:
+                record['status'] = response.status_code
+                record['content_type'] = response.headers.get('Content-Type')
+                record['body'] = self._body_id(_body_of(response))
+            self._write(record)
+
+    def close(self):
+        """Complete the cassette and close the connections of the
+        transport.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self.transport.close()
+
+    def pool_stats(self):
+        return self.transport.pool_stats()
+
+
+class ReplayTransport(Transport):
+    """Answer requests from a cassette, without a server.
+
+    A request is answered with the response recorded for the same
+    method, path and arguments; the host and the root path of the URL
+    may differ. A request recorded several times gets the recorded
+    responses in turn, and the last one after that. A request that
+    was not recorded gets status ``404``. A recorded error is raised
+    again as the same ``requests`` exception.
+
+    :param path: The path of the cassette.
+    :param speed: (optional) Take the recorded time of every response,
+                  divided by ``speed``, to answer, or answer right away
+                  if ``None``. *Default value:* ``None``.
+    """
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+        self.exchanges = load(path)
+        self._lock = threading.Lock()
+        self._answers = {}
+        for exchange in self.exchanges:
+            key = _key(exchange['method'], exchange['url'],
+                       exchange['params'], exchange['data'])
+            self._answers.setdefault(key, collections.deque()).append(exchange)
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        answers = self._answers.get(_key(method, url, params, data))
+        if answers is None:
+            return Response(404)
+        with self._lock:
+            exchange = answers.popleft() if len(answers) > 1 else answers[0]
+        if self.speed:
+            time.sleep(exchange['elapsed'] / self.speed)
+        if 'error' in exchange:
+            name, message = exchange['error']
+            exceptions = requests.exceptions
+            error = getattr(exceptions, name, None)
+            if not isinstance(error, type) or \
+                    not issubclass(error, exceptions.RequestException):
+                error = exceptions.RequestException
+            raise error(message)
+        headers = {}
+        if exchange.get('content_type'):
+            headers['Content-Type'] = exchange['content_type']
+        return Response(exchange['status'], exchange['body'], headers)
+
+
+def _call_of(exchange):
+    """Return the name of the endpoint method that sent the request of
+    ``exchange`` and the arguments to call it with, or ``None`` and the
+    path if the request is not one of an endpoint method.
+    """
+    path = _api_path(exchange['url'])
+    endpoint = find_endpoint(exchange['method'], path)
+    if endpoint['name'] is None:
+        return None, path
+    params = dict(exchange['params'])
+    params.update(exchange['data'])
+    template = endpoint['path']
+    if '{id}' in template:
+        prefix, suffix = template.split('{id}')
+        params['id'] = path[len(prefix):len(path) - len(suffix)]
+    for name, (filename, content) in exchange['files'].items():
+        f = io.BytesIO(content)
+        f.name = filename
+        params[name] = f
+    return endpoint['name'], params
+
+
+def replay(client, path, speed=1.0, workers=8):
+    """Make the calls recorded in a cassette again through ``client``.
+
+    Every request of the cassette is turned back into a call of the
+    endpoint method that sent it, and the calls are made at the offsets
+    they were recorded at, divided by ``speed``, by a pool of
+    ``workers`` threads. The client can send the requests to a server,
+    or answer them with a :py:class:`ReplayTransport`.
+
+    :param client: The :py:class:`pyrundeck.api.RundeckApiClient` to
+                   call.
+    :param path: The path of the cassette.
+    :param speed: (optional) How many times faster than recorded to
+                  make the calls, or ``None`` to make them as fast as
+                  possible. *Default value:* ``1.0``.
+    :param workers: (optional) The number of threads making the calls.
+                    *Default value:* ``8``.
+    :return: A list with a dictionary per call, in the recorded order:
+             the ``'endpoint'`` name, the ``'status'`` or the
+             ``'error'`` raised, the ``'seconds'`` the call took, and
+             how many seconds ``'late'`` it started. Requests that are
+             not calls of an endpoint method are left out.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = [_call_of(exchange) + (exchange['at'],)
+             for exchange in load(path)]
+    calls = [call for call in calls if call[0] is not None]
+    start = time.time()
+
+    def make(name, params, at):
+        due = start + (at / speed if speed else 0)
+        wait = due - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        began = time.time()
+        result = {'endpoint': name, 'late': max(0.0, began - due),
+                  'status': None, 'error': None}
+        try:
+            result['status'] = getattr(client, name)(**params)[0]
+        except Exception as ex:
+            result['error'] = ex
+        result['seconds'] = time.time() - began
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(make, *call) for call in calls]
+        return [future.result() for future in futures]
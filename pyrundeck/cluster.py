@@ -0,0 +1,308 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""A client for Rundeck clusters.
+
+In cluster mode several Rundeck nodes share one database, so most
+requests can be answered by any of them. A
+:py:class:`RundeckClusterClient` spreads its requests over the nodes,
+sending each one to the healthy node with the fewest requests in
+flight, and stops using nodes that fail until they have had time to
+recover.
+
+Some requests are better served by a particular node: a job that is
+owned by a node (its ``serverNodeUUID``) is launched there, and an
+execution started through the client is looked up on the node that
+started it.
+"""
+
+import re
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.api import RundeckApiClient
+from pyrundeck.cache import LRUCache
+from pyrundeck.endpoints import find_endpoint
+from pyrundeck.helpers import _LazyModule
+from pyrundeck.retry import _never_sent
+
+etree = _LazyModule('lxml.etree')
+requests = _LazyModule('requests')
+
+
+_job_path = re.compile(r'^/api/\d+/job/([^/]+)/run$')
+_execution_path = re.compile(r'^/api/\d+/execution/([^/]+)$')
+
+
+class _Node(object):
+    def __init__(self, url):
+        self.url = url[:-1] if url.endswith('/') else url
+        self.server_uuid = None
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.consecutive_ejections = 0
+        self.ejected_until = None
+
+
+class RundeckClusterClient(RundeckApiClient):
+    """A :py:class:`pyrundeck.api.RundeckApiClient` for several nodes
+    of a Rundeck cluster.
+
+    A node that fails ``max_failures`` requests in a row, with a
+    connection error or a ``5xx`` status, is ejected for
+    ``eject_time`` seconds, doubled for every further ejection up to
+    ``max_eject_time``. Then one request at a time is sent to it, and
+    the node is readmitted after the first success. If every node is
+    ejected, the one that was going to be readmitted first is used.
+
+    A request that fails with a connection error, or with one of the
+    ``failover_statuses``, is sent to another node right away if it is
+    idempotent or never reached the server.
+
+    See :doc:`usage` for examples.
+
+    :param token: The Rundeck API authentication token.
+    :param root_urls: The base URLs of the nodes.
+    :param max_failures: (optional) Consecutive failures that eject a
+                         node. *Default value:* ``3``.
+    :param eject_time: (optional) Seconds a node is ejected for the
+                       first time. *Default value:* ``10.0``.
+    :param max_eject_time: (optional) The longest ejection in seconds.
+                           *Default value:* ``300.0``.
+    :param failover_statuses: (optional) Statuses that make idempotent
+                              requests go to another node. *Default
+                              value:* ``(502, 503, 504)``.
+    :param max_tracked: (optional) The number of executions and jobs
+                        whose node is remembered. *Default value:*
+                        ``10000``.
+    :param kwargs: The other arguments of
+                   :py:class:`pyrundeck.api.RundeckApiClient`.
+    """
+    def __init__(self, token, root_urls, max_failures=3, eject_time=10.0,
+                 max_eject_time=300.0, failover_statuses=(502, 503, 504),
+                 max_tracked=10000, **kwargs):
+        if not root_urls:
+            raise ValueError('at least one root URL is required')
+        super(RundeckClusterClient, self).__init__(token, root_urls[0],
+                                                   **kwargs)
+        self.nodes = [_Node(url) for url in root_urls]
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self.failover_statuses = failover_statuses
+
+        self._execution_nodes = LRUCache(max_tracked)
+        self._job_owners = LRUCache(max_tracked)
+        self._discovered = False
+        self._next = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        fork.register(self)
+
+    def _after_fork(self):
+        for node in self.nodes:
+            node.outstanding = 0
+        self._lock = threading.Lock()
+
+    def _owner(self, endpoint, path):
+        """Return the node that should serve a request, if any."""
+        if endpoint['name'] == 'execution_info':
+            match = _execution_path.match(path)
+            if match:
+                return self._execution_nodes.get(match.group(1))
+        elif endpoint['name'] == 'run_job':
+            match = _job_path.match(path)
+            uuid = match and self._job_owners.get(match.group(1))
+            if uuid:
+                for node in self.nodes:
+                    if node.server_uuid == uuid:
+                        return node
+        return None
+
+    def _available(self, node, now):
+        if node.ejected_until is None:
+            return True
+        # Ejected nodes are tried again one request at a time.
+        return node.ejected_until <= now and node.outstanding == 0
+
+    def _choose(self, endpoint, path, tried):
+        """Pick the node for the next attempt of a request and count
+        the request as outstanding on it.
+        """
+        now = time.time()
+        with self._lock:
+            node = getattr(self._local, 'pinned', None)
+            if node is None:
+                candidates = [n for n in self.nodes
+                              if n not in tried and self._available(n, now)]
+                owner = self._owner(endpoint, path)
+                if owner in candidates:
+                    node = owner
+                elif candidates:
+                    # Ties are broken in turns, so that idle nodes share
+                    # sequential requests.
+                    least = min(n.outstanding for n in candidates)
+                    ties = [n for n in candidates if n.outstanding == least]
+                    self._next += 1
+                    node = ties[self._next % len(ties)]
+                else:
+                    remaining = [n for n in self.nodes if n not in tried]
+                    if not remaining:
+                        return None
+                    node = min(remaining, key=lambda n: n.ejected_until)
+            node.outstanding += 1
+            node.requests += 1
+            return node
+
+    def _record(self, node, failed):
+        """Count the end of a request on ``node``, which ``failed`` or
+        not, or says nothing about the node if ``failed`` is ``None``.
+        """
+        with self._lock:
+            node.outstanding -= 1
+            if failed is None:
+                return
+            if not failed:
+                node.consecutive_failures = 0
+                node.consecutive_ejections = 0
+                node.ejected_until = None
+                return
+            node.failures += 1
+            node.consecutive_failures += 1
+            if (node.ejected_until is not None or
+                    node.consecutive_failures >= self.max_failures):
+                delay = min(self.eject_time * 2 ** node.consecutive_ejections,
+                            self.max_eject_time)
+                node.ejections += 1
+                node.consecutive_ejections += 1
+                node.ejected_until = time.time() + delay
+                self.logger.warning('ejected {} for {} seconds'
+                                    .format(node.url, delay))
+
+    def _send(self, endpoint, method, url, requests_args):
+        path = url[len(self.root_url):]
+        if endpoint['name'] == 'run_job' and not self._discovered and \
+                len(self._job_owners):
+            self.discover()
+
+        tried = set()
+        while True:
+            node = self._choose(endpoint, path, tried)
+            tried.add(node)
+            self._local.node = node
+            more = (getattr(self._local, 'pinned', None) is None and
+                    len(tried) < len(self.nodes))
+            try:
+                response = super(RundeckClusterClient, self)._send(
+                    endpoint, method, node.url + path, requests_args
+                )
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as ex:
+                self._record(node, True)
+                if more and (endpoint['idempotent'] or _never_sent(ex)):
+                    self.logger.info('{} failed on {}, trying another node'
+                                     .format(path, node.url))
+                    continue
+                raise
+            except Exception:
+                self._record(node, None)
+                raise
+
+            self._record(node, response.status_code >= 500)
+            if (more and endpoint['idempotent'] and
+                    response.status_code in self.failover_statuses):
+                continue
+            return response
+
+    def _execute_request(self, endpoint, url, method, params):
+        self._local.node = None
+        status, result = super(RundeckClusterClient, self)._execute_request(
+            endpoint, url, method, params
+        )
+        node = getattr(self._local, 'node', None)
+        if status == 200 and node is not None and \
+                isinstance(result, etree._Element):
+            if endpoint['name'] == 'run_job':
+                for execution in result.iter('execution'):
+                    self._execution_nodes.set(execution.get('id'), node)
+            elif endpoint['name'] == 'list_jobs':
+                for job in result.iter('job'):
+                    owner = job.get('serverNodeUUID')
+                    if owner:
+                        self._job_owners.set(job.get('id'), owner)
+        return status, result
+
+    def discover(self):
+        """Ask every node for its ``serverUUID``.
+
+        This is done automatically before the first launch of a job
+        whose owner is known.
+        """
+        url = '{}/api/1/system/info'.format(self.root_url)
+        endpoint = find_endpoint('GET', '/api/1/system/info')
+        for node in self.nodes:
+            self._local.pinned = node
+            try:
+                status, tree = self._execute_request(endpoint, url, 'GET',
+                                                     None)
+                if status == 200 and tree is not None:
+                    node.server_uuid = tree.findtext(
+                        'system/rundeck/serverUUID'
+                    )
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as ex:
+                self.logger.warning('could not reach {}: {}'
+                                    .format(node.url, ex))
+            finally:
+                self._local.pinned = None
+        self._discovered = True
+
+    def stats(self):
+        """Return the state of every node.
+
+        :return: A list with a dictionary per node, with its ``'url'``,
+                 ``'server_uuid'``, the number of ``'outstanding'``
+                 requests, of ``'requests'`` sent and ``'failures'``,
+                 the number of ``'ejections'`` and whether it is
+                 currently ``'ejected'``.
+        """
+        now = time.time()
+        with self._lock:
+            return [{'url': n.url, 'server_uuid': n.server_uuid,
+                     'outstanding': n.outstanding, 'requests': n.requests,
+                     'failures': n.failures, 'ejections': n.ejections,
+                     'ejected': (n.ejected_until is not None and
+                                 n.ejected_until > now)}
+                    for n in self.nodes]
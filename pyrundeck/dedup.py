@@ -0,0 +1,168 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Deduplication of job launches.
+
+Retries and fan-out in orchestration code often launch the same job
+with the same arguments several times within a few seconds. A
+:py:class:`LaunchDeduplicator` attached to a
+:py:class:`pyrundeck.api.RundeckApiClient` makes such launches share a
+single execution: the first launch is sent to the server, and
+identical launches issued while it is in flight, or within ``window``
+seconds after it succeeded, get its response instead of starting a new
+execution.
+"""
+
+import shlex
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.helpers import _transparent_params
+
+
+def launch_key(job_id, params):
+    """Build the key that identifies a launch of a job.
+
+    Parameters are normalized the way they are sent to the server, and
+    ``argstring`` is split into arguments the way a shell would, so
+    launches that only differ in the whitespace between their arguments
+    are considered identical. Whitespace inside quoted arguments is
+    kept. An ``argstring`` that cannot be split, e.g. because of an
+    unbalanced quote, is compared as is.
+
+    :param job_id: The id of the job.
+    :param params: The parameters of the launch.
+    :return: A hashable key.
+    """
+    normalized, _ = _transparent_params(params)
+    if 'argstring' in normalized:
+        try:
+            normalized['argstring'] = tuple(
+                shlex.split(str(normalized['argstring'])))
+        except ValueError:
+            pass
+    return (str(job_id),
+            tuple(sorted((k, str(v)) for k, v in normalized.items())))
+
+
+class _Launch(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires = None
+
+
+class LaunchDeduplicator(object):
+    """Single-flight job launches within a time window.
+
+    See :doc:`usage` for examples.
+
+    :param window: (optional) Seconds after a successful launch during
+                   which identical launches get its response. *Default
+                   value:* ``5.0``.
+    """
+    def __init__(self, window=5.0):
+        self.window = window
+        self.launch_count = 0
+        self.deduplicated_count = 0
+        self._launches = {}
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def _after_fork(self):
+        # Launches of the parent are not shared with its children.
+        self._launches = {}
+        self._lock = threading.Lock()
+
+    def launch(self, key, send):
+        """Launch a job unless an identical launch exists.
+
+        :param key: The key of the launch, see :py:func:`launch_key`.
+        :param send: A callable without arguments that launches the job
+                     and returns a ``(status, response)`` pair.
+        :return: The ``(status, response)`` pair of the launch that
+                 was actually sent.
+        """
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            launch = self._launches.get(key)
+            if launch is None:
+                launch = _Launch()
+                self._launches[key] = launch
+                self.launch_count += 1
+                owner = True
+            else:
+                self.deduplicated_count += 1
+                owner = False
+
+        if not owner:
+            launch.done.wait()
+            if launch.error is not None:
+                raise launch.error
+            return launch.result
+
+        try:
+            launch.result = send()
+        except Exception as ex:
+            launch.error = ex
+            raise
+        finally:
+            with self._lock:
+                if launch.result is not None and launch.result[0] == 200:
+                    launch.expires = time.time() + self.window
+                elif self._launches.get(key) is launch:
+                    # Failed launches are not remembered, so that the
+                    # next attempt reaches the server.
+                    del self._launches[key]
+            launch.done.set()
+        return launch.result
+
+    def _expire(self, now):
+        expired = [k for k, v in self._launches.items()
+                   if v.expires is not None and v.expires <= now]
+        for k in expired:
+            del self._launches[k]
+
+    def stats(self):
+        """Return the counters of the deduplicator.
+
+        :return: A dictionary with the number of launches sent to the
+                 server (``'launched'``) and the number of launches
+                 answered with the response of an identical one
+                 (``'deduplicated'``).
+        """
+        with self._lock:
+            return {'launched': self.launch_count,
+                    'deduplicated': self.deduplicated_count}
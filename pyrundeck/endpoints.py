@@ -36,13 +36,124 @@ class ``EndpointMixins``. The class ``RundeckApiClient`` subclasses
 this class in order to inherit the defined methods.
 """
 
+import functools
+import re
+
+from pyrundeck.dedup import launch_key
 from pyrundeck.exceptions import RundeckException
+from pyrundeck.helpers import _LazyModule
 from pyrundeck.rundeck_parser import parse
-import yaml
+from pyrundeck.tracing import current_span
+
+yaml = _LazyModule('yaml')
 
 __author__ = "Panagiotis Koutsourakis <kutsurak@ekt.gr>"
 
 
+# Description of every endpoint implemented in ``EndpointMixins``. The
+# client consults this table in order to decide how a request may be
+# treated. ``'idempotent'`` marks the endpoints that can safely be
+# sent more than once: ``run_job`` is a ``GET`` request, but repeating
+# it starts a new execution. ``'class'`` is one of ``'read'``,
+# ``'write'`` and ``'heavy'`` and selects the limits that apply to the
+# endpoint (see :py:class:`pyrundeck.throttle.RateLimiter`).
+# ``'priority'`` is the default priority class of the endpoint in the
+# :py:class:`pyrundeck.scheduler.RequestScheduler`: ``'interactive'``
+# lookups are dispatched ahead of ``'bulk'`` transfers.
+ENDPOINTS = [
+    {'name': 'import_job', 'method': 'POST',
+     'path': '/api/1/jobs/import', 'idempotent': False,
+     'class': 'write', 'priority': 'bulk'},
+    {'name': 'export_jobs', 'method': 'GET',
+     'path': '/api/1/jobs/export', 'idempotent': True,
+     'class': 'heavy', 'priority': 'bulk'},
+    {'name': 'list_jobs', 'method': 'GET',
+     'path': '/api/1/jobs', 'idempotent': True,
+     'class': 'read', 'priority': 'interactive'},
+    {'name': 'run_job', 'method': 'GET',
+     'path': '/api/1/job/{id}/run', 'idempotent': False,
+     'class': 'write', 'priority': 'interactive'},
+    {'name': 'execution_info', 'method': 'GET',
+     'path': '/api/1/execution/{id}', 'idempotent': True,
+     'class': 'read', 'priority': 'interactive'},
+    {'name': 'delete_job', 'method': 'DELETE',
+     'path': '/api/1/job/{id}', 'idempotent': True,
+     'class': 'write', 'priority': 'interactive'},
+    {'name': 'job_executions_info', 'method': 'GET',
+     'path': '/api/1/job/{id}/executions', 'idempotent': True,
+     'class': 'read', 'priority': 'bulk'},
+    {'name': 'running_executions', 'method': 'POST',
+     'path': '/api/1/executions/running', 'idempotent': True,
+     'class': 'read', 'priority': 'interactive'},
+    {'name': 'system_info', 'method': 'GET',
+     'path': '/api/1/system/info', 'idempotent': True,
+     'class': 'read', 'priority': 'interactive'},
+    {'name': 'job_definition', 'method': 'GET',
+     'path': '/api/1/job/{id}', 'idempotent': True,
+     'class': 'read', 'priority': 'interactive'},
+    {'name': 'bulk_job_delete', 'method': 'DELETE',
+     'path': '/api/5/jobs/delete', 'idempotent': True,
+     'class': 'write', 'priority': 'bulk'},
+]
+
+_endpoint_patterns = [
+    (re.compile('^' + re.escape(e['path']).replace(r'\{id\}', '[^/]+') +
+                '$'), e)
+    for e in ENDPOINTS
+]
+
+
+_endpoints_by_name = dict((e['name'], e) for e in ENDPOINTS)
+
+
+def find_endpoint(method, path):
+    """Find the entry of :py:data:`ENDPOINTS` that corresponds to a
+    request.
+
+    Requests that do not match any known endpoint are described by a
+    generic entry with name ``None``. Such requests are considered
+    idempotent reads only if they are ``GET`` requests and writes
+    otherwise.
+
+    :param method: The HTTP method of the request.
+    :param path: The path of the request URL, without the root URL of
+                 the server.
+    :return: The endpoint description dictionary.
+    """
+    for pattern, endpoint in _endpoint_patterns:
+        if endpoint['method'] == method and pattern.match(path):
+            return endpoint
+
+    read = method == 'GET'
+    return {'name': None, 'method': method, 'path': path,
+            'idempotent': read, 'class': 'read' if read else 'write',
+            'priority': 'interactive'}
+
+
+def endpoint_by_name(name):
+    """Find the entry of :py:data:`ENDPOINTS` for the method ``name`` of
+    ``EndpointMixins``.
+
+    :raises RundeckException: If there is no such endpoint.
+    """
+    try:
+        return _endpoints_by_name[name]
+    except KeyError:
+        raise RundeckException('unknown endpoint {}'.format(name))
+
+
+def _endpoint(fn):
+    """Route the calls of an endpoint method through
+    :py:meth:`EndpointMixins._call_endpoint`.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **params):
+        return self._call_endpoint(name, fn, args, params)
+    return wrapper
+
+
 class EndpointMixins(object):
     """This class contains all the API endpoints in order not to clutter
     the :class:`pyrundeck.api.RundeckApiClient`.  Note that
@@ -59,6 +170,48 @@ class EndpointMixins(object):
                  runtime errors.
     """
 
+    def _call_endpoint(self, name, fn, args, params):
+        """Call the endpoint method ``fn`` named ``name``.
+
+        Every endpoint method passes through here, which makes this the
+        place for behavior that applies to whole endpoint calls rather
+        than to single requests.
+        """
+        def call():
+            return fn(self, *args, **params)
+
+        shared = self.shared_cache
+        if shared is not None and shared.handles(name):
+            call = functools.partial(shared.call, name, args, params, call,
+                                     self.partition)
+        cache = self.refresh_cache
+        if cache is not None and cache.handles(name):
+            call = functools.partial(cache.call, name, args, params, call,
+                                     self.partition)
+        prefetcher = self.prefetcher
+        if prefetcher is not None and prefetcher.handles(name):
+            call = functools.partial(prefetcher.call, self, name, args,
+                                     params, call)
+        tracer = self.tracer
+        if tracer is not None:
+            with tracer.span(endpoint_by_name(name)):
+                return call()
+        return call()
+
+    def _parse(self, xml):
+        """Convert an XML response to native objects, reusing the
+        result of an identical response if the client has a
+        :py:class:`pyrundeck.cache.ParseMemo`.
+        """
+        parse_xml = parse if self.parse_memo is None \
+            else self.parse_memo.native
+        span = current_span()
+        if span is None:
+            return parse_xml(xml)
+        with span.timing('native'):
+            return parse_xml(xml)
+
+    @_endpoint
     def import_job(self, native=True, **params):
         """Implements `import job`_
 
@@ -67,10 +220,11 @@ class EndpointMixins(object):
         status, xml = self.post('{}/api/1/jobs/import'.format(self.root_url),
                                 params)
         if native:
-            return status, parse(xml)
+            return status, self._parse(xml)
         else:
             return status, xml
 
+    @_endpoint
     def export_jobs(self, native=True, **params):
         """Implements `export jobs`_
 
@@ -83,10 +237,11 @@ class EndpointMixins(object):
             return status, yaml.load(res)
         else:
             if native:
-                return status, parse(res)
+                return status, self._parse(res)
             else:
                 return status, res
 
+    @_endpoint
     def list_jobs(self, native=True, **params):
         """Implements `list jobs`_
 
@@ -94,40 +249,65 @@ class EndpointMixins(object):
         """
         status, xml = self.get('{}/api/1/jobs'.format(self.root_url), params)
         if native:
-            return status, parse(xml)
+            return status, self._parse(xml)
         else:
             return status, xml
 
+    @_endpoint
     def run_job(self, native=True, **params):
         """Implements `run job`_
 
+        If the client has a
+        :py:class:`pyrundeck.dedup.LaunchDeduplicator`, identical
+        launches within its window return the response of the first
+        one.
+
         .. _run job: http://rundeck.org/docs/api/index.html#running-a-job
         """
         try:
             job_id = params.pop('id')
+            url = '{}/api/1/job/{}/run'.format(self.root_url, job_id)
 
-            status, xml = self.get('{}/api/1/job/{}/run'
-                                   .format(self.root_url, job_id), params)
+            if self.launch_deduplicator is None:
+                status, xml = self.get(url, params)
+            else:
+                status, xml = self.launch_deduplicator.launch(
+                    (self.partition, launch_key(job_id, params)),
+                    lambda: self.get(url, params)
+                )
             if native:
-                return status, parse(xml)
+                return status, self._parse(xml)
             else:
                 return status, xml
         except KeyError:
             raise RundeckException("job id is required for job execution")
 
+    @_endpoint
     def execution_info(self, native=True, **params):
         """Implements `execution info`_
 
+        If the client has a :py:class:`pyrundeck.cache.ExecutionCache`,
+        native results for finished executions are served from it.
+
         .. _execution info: http://rundeck.org/docs/api/index.html#execution-info
         """
         try:
             execution_id = params.pop('id')
 
+            cache = self.execution_cache
+            if native and cache is not None and not params:
+                result = cache.get(execution_id, self.partition)
+                if result is not None:
+                    return 200, result
+
             status, xml = self.get('{}/api/1/execution/{}'
                                    .format(self.root_url, execution_id),
                                    params)
             if native:
-                return status, parse(xml)
+                result = self._parse(xml)
+                if cache is not None and status == 200:
+                    cache.store(result, self.partition)
+                return status, result
             else:
                 return status, xml
 
@@ -135,6 +315,7 @@ class EndpointMixins(object):
             raise RundeckException("execution id is required for "
                                    "execution info")
 
+    @_endpoint
     def delete_job(self, **params):
         """Implements `delete job`_
 
@@ -149,9 +330,13 @@ class EndpointMixins(object):
         except KeyError:
             raise RundeckException("job id is required for job deletion")
 
+    @_endpoint
     def job_executions_info(self, native=True, **params):
         """Implements `Job executions`_
 
+        If the client has a :py:class:`pyrundeck.cache.ExecutionCache`,
+        the finished executions of native results are added to it.
+
         .. _Job executions: http://rundeck.org/docs/api/#getting-executions-for-a-job
         """
 
@@ -162,13 +347,17 @@ class EndpointMixins(object):
                                    .format(self.root_url, job_id), params)
 
             if native:
-                return status, parse(xml)
+                result = self._parse(xml)
+                if self.execution_cache is not None and status == 200:
+                    self.execution_cache.store(result, self.partition)
+                return status, result
             else:
                 return status, xml
 
         except KeyError:
             raise RundeckException("job id is required for job executions")
 
+    @_endpoint
     def running_executions(self, native=True, **params):
         """Implements `List Running Executions`_
 
@@ -179,10 +368,11 @@ class EndpointMixins(object):
                                 params)
 
         if native:
-            return status, parse(xml)
+            return status, self._parse(xml)
         else:
             return status, xml
 
+    @_endpoint
     def system_info(self, native=True, **params):
         """Implements `System Info`_
 
@@ -192,10 +382,11 @@ class EndpointMixins(object):
                                params)
 
         if native:
-            return status, parse(xml)
+            return status, self._parse(xml)
         else:
             return status, xml
 
+    @_endpoint
     def job_definition(self, native=True, **params):
         """Implements `Getting a Job Definition`_
 
@@ -210,12 +401,13 @@ class EndpointMixins(object):
                 return status, yaml.load(res)
             else:
                 if native:
-                    return status, parse(res)
+                    return status, self._parse(res)
                 else:
                     return status, res
         except KeyError:
             raise RundeckException("job id is required for job definition")
 
+    @_endpoint
     def bulk_job_delete(self, native=True, **params):
         """Implements `Bulk Job Delete`_
 
@@ -226,6 +418,6 @@ class EndpointMixins(object):
                                   params)
 
         if native:
-            return status, parse(xml)
+            return status, self._parse(xml)
         else:
             return status, xml
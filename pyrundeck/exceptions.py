@@ -36,3 +36,27 @@ __author__ = 'kutsurak'
 class RundeckException(Exception):
     def __init__(self, *args, **kwargs):
         super(RundeckException, self).__init__(*args, **kwargs)
+
+
+class CircuitOpenError(RundeckException):
+    def __init__(self, *args, **kwargs):
+        """Raised instead of sending a request while the circuit breaker
+        considers the Rundeck server unhealthy.
+        """
+        super(CircuitOpenError, self).__init__(*args, **kwargs)
+
+
+class ThrottledError(RundeckException):
+    def __init__(self, *args, **kwargs):
+        """Raised when a request could not get past the client side
+        limits within the configured timeout.
+        """
+        super(ThrottledError, self).__init__(*args, **kwargs)
+
+
+class QueueFullError(RundeckException):
+    def __init__(self, *args, **kwargs):
+        """Raised when a launch could not be queued because the queue
+        stayed full for the configured timeout.
+        """
+        super(QueueFullError, self).__init__(*args, **kwargs)
@@ -0,0 +1,103 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Support for servers that fork worker processes.
+
+A process that forks after creating a client passes its state to the
+child: open connections that parent and child would then both use,
+counters of requests that were in flight in threads the child does not
+have, and locks that such threads may have held. Objects of pyrundeck
+with such state are registered with :py:func:`register` and reset
+themselves in the child, through ``os.register_at_fork``.
+
+:py:func:`freeze` helps the parent share as much memory as possible
+with its children.
+"""
+
+import gc
+import os
+import threading
+import weakref
+
+
+_registry = weakref.WeakSet()
+_registry_lock = threading.Lock()
+
+
+def register(obj):
+    """Have ``obj._after_fork()`` called in every child process forked
+    after this call. The registry does not keep ``obj`` alive.
+    """
+    with _registry_lock:
+        _registry.add(obj)
+
+
+def _after_fork_in_child():
+    global _registry_lock
+    # The lock may have been held by another thread of the parent.
+    _registry_lock = threading.Lock()
+    for obj in list(_registry):
+        obj._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def freeze():
+    """Prepare the calling process to be forked.
+
+    The parse tables and the parser are built, the modules that
+    pyrundeck imports on first use are imported, and every object that
+    exists at this point is moved out of reach of the garbage
+    collector with ``gc.freeze``. Otherwise the collector of every
+    child writes to these objects, which makes the child copy the
+    memory pages it shares with the parent.
+
+    Call this in the parent, right before forking the workers, e.g. in
+    the ``pre_fork`` hook of gunicorn with ``preload_app``. For the
+    best results also call ``gc.disable()`` early in the parent and
+    ``gc.enable()`` in the children.
+
+    :return: The number of frozen objects, or ``None`` if this version
+             of Python cannot freeze objects.
+    """
+    # Import now what the children would otherwise each import on
+    # first use.
+    import lxml.etree  # noqa
+    import requests  # noqa
+    import yaml  # noqa
+    from pyrundeck.rundeck_parser import get_parser
+    get_parser()
+    if not hasattr(gc, 'freeze'):
+        return None
+    gc.freeze()
+    return gc.get_freeze_count()
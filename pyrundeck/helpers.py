@@ -30,6 +30,8 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import importlib
+
 # The following code is copied shamelessly from twython (https://github.com/ryanmcgrath/twython)
 
 basestring = (str, bytes)
@@ -56,3 +58,21 @@ def _transparent_params(_params):
         else:
             continue  # pragma: no cover
     return params, files
+
+
+class _LazyModule(object):
+    """Stand in for the module ``name`` until one of its attributes is
+    used, and only then import it.
+
+    Importing ``requests``, ``lxml`` and ``yaml`` takes longer than
+    most short lived scripts spend talking to Rundeck, so the modules
+    of pyrundeck refer to them through this class.
+    """
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self.__name), attr)
+        # Later uses of the attribute do not reach __getattr__.
+        setattr(self, attr, value)
+        return value
@@ -0,0 +1,454 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""A durable queue of job launches.
+
+Event handlers that call ``run_job`` directly either block while
+Rundeck is slow or lose launches while it is down. A
+:py:class:`LaunchQueue` stores launches in a sqlite database instead
+and returns immediately with a ticket. Drainer threads submit the
+queued launches at a controlled rate, and the ticket can later be
+resolved to the id of the execution.
+
+The queue survives process restarts. A drainer holds a launch it
+submits for a limited time, its lease; a launch that was being
+submitted when its process died is submitted again once the lease
+expires, by any process sharing the database. The same happens to a
+launch whose outcome could not be written to the database, e.g.
+because it was locked; other database errors only make the drainer
+wait a moment before it carries on. A launch is thus performed *at
+least* once.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from pyrundeck.dedup import launch_key
+from pyrundeck.exceptions import (RundeckException, QueueFullError,
+                                  CircuitOpenError, ThrottledError)
+from pyrundeck.helpers import _LazyModule
+from pyrundeck.retry import _never_sent
+from pyrundeck.throttle import TokenBucket
+
+requests = _LazyModule('requests')
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS launches (
+           ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+           launch_key TEXT NOT NULL,
+           job_id TEXT NOT NULL,
+           params TEXT NOT NULL,
+           state TEXT NOT NULL,
+           attempts INTEGER NOT NULL DEFAULT 0,
+           not_before REAL NOT NULL DEFAULT 0,
+           lease REAL NOT NULL DEFAULT 0,
+           execution_id TEXT,
+           error TEXT,
+           created REAL NOT NULL,
+           updated REAL NOT NULL
+       )""",
+    """CREATE INDEX IF NOT EXISTS launches_state
+       ON launches (state, ticket)""",
+    """CREATE INDEX IF NOT EXISTS launches_key
+       ON launches (launch_key, state)""",
+]
+
+
+def execution_id(result):
+    """Extract the execution id from the native result of ``run_job``."""
+    return result['executions']['list'][0]['id']
+
+
+class LaunchQueue(object):
+    """A sqlite backed queue in front of ``run_job``.
+
+    Identical launches (see :py:func:`pyrundeck.dedup.launch_key`) that
+    are waiting in the queue are stored once: enqueueing a duplicate
+    returns the ticket of the waiting launch.
+
+    If more than ``max_pending`` launches are waiting, :py:meth:`enqueue`
+    blocks until the drainers catch up, for at most ``enqueue_timeout``
+    seconds.
+
+    Launches that are rejected with a ``5xx`` status, or that never
+    reached the server, are retried up to ``max_attempts`` times.
+
+    See :doc:`usage` for examples.
+
+    :param client: The :py:class:`pyrundeck.api.RundeckApiClient` used
+                   to launch the jobs.
+    :param path: The path of the sqlite database.
+    :param workers: (optional) The number of drainer threads. *Default
+                    value:* ``2``.
+    :param rate: (optional) The maximum number of launches per second,
+                 or ``None`` for no limit. *Default value:* ``None``.
+    :param max_pending: (optional) The maximum number of waiting
+                        launches, or ``None`` for no limit. *Default
+                        value:* ``None``.
+    :param enqueue_timeout: (optional) Seconds :py:meth:`enqueue` waits
+                            for room in a full queue, or ``None`` to
+                            wait as long as needed. *Default value:*
+                            ``None``.
+    :param max_attempts: (optional) The maximum number of times a
+                         launch is submitted. *Default value:* ``5``.
+    :param retry_delay: (optional) Seconds before a rejected launch is
+                        submitted again. *Default value:* ``5.0``.
+    :param lease: (optional) Seconds a launch being submitted is
+                  reserved for the drainer that took it. It must be
+                  longer than a ``run_job`` call, retries included.
+                  *Default value:* ``300.0``.
+    :param poll_interval: (optional) Seconds between checks of the
+                          database by idle drainers and waiting
+                          callers. *Default value:* ``0.5``.
+    :param start: (optional) Start the drainers right away. *Default
+                  value:* ``True``.
+    """
+    def __init__(self, client, path, workers=2, rate=None, max_pending=None,
+                 enqueue_timeout=None, max_attempts=5, retry_delay=5.0,
+                 lease=300.0, poll_interval=0.5, start=True):
+        self.client = client
+        self.path = path
+        self.workers = workers
+        self.bucket = TokenBucket(rate) if rate is not None else None
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(__name__)
+
+        self._local = threading.local()
+        self._connections = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+
+        db = self._db()
+        for statement in _SCHEMA:
+            db.execute(statement)
+        columns = [row[1] for row in db.execute('PRAGMA table_info(launches)')]
+        if 'lease' not in columns:
+            # Launches left running in a database of an older version
+            # have an expired lease.
+            db.execute('ALTER TABLE launches '
+                       'ADD COLUMN lease REAL NOT NULL DEFAULT 0')
+
+        if start:
+            self.start()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # Every connection is used by a single thread, but
+            # :py:meth:`close` closes them all.
+            db = sqlite3.connect(self.path, timeout=30,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+            with self._cond:
+                self._connections.append(db)
+        return db
+
+    def _pending_count(self, db):
+        return db.execute('SELECT COUNT(*) FROM launches WHERE state = ?',
+                          (PENDING,)).fetchone()[0]
+
+    def enqueue(self, **params):
+        """Queue a launch of a job.
+
+        :param params: The parameters of ``run_job``, including the job
+                       ``id``.
+        :return: The ticket of the launch, to be passed to
+                 :py:meth:`result` or :py:meth:`status`.
+        :raises QueueFullError: If the queue stayed full for
+                                ``enqueue_timeout`` seconds.
+        """
+        try:
+            job_id = params.pop('id')
+        except KeyError:
+            raise RundeckException("job id is required for job execution")
+        params.pop('native', None)
+        key = json.dumps(launch_key(job_id, params))
+        encoded = json.dumps(params)
+
+        deadline = (None if self.enqueue_timeout is None
+                    else time.time() + self.enqueue_timeout)
+        db = self._db()
+        while True:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT ticket FROM launches '
+                                 'WHERE launch_key = ? AND state IN (?, ?)',
+                                 (key, PENDING, RUNNING)).fetchone()
+                if row is not None:
+                    db.execute('COMMIT')
+                    return row[0]
+
+                if (self.max_pending is None or
+                        self._pending_count(db) < self.max_pending):
+                    now = time.time()
+                    cursor = db.execute(
+                        'INSERT INTO launches (launch_key, job_id, params, '
+                        'state, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                        (key, str(job_id), encoded, PENDING, now, now)
+                    )
+                    db.execute('COMMIT')
+                    with self._cond:
+                        self._cond.notify_all()
+                    return cursor.lastrowid
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    raise QueueFullError('launch queue is full')
+            with self._cond:
+                self._cond.wait(wait)
+
+    def status(self, ticket):
+        """Return the state of a launch.
+
+        :return: A dictionary with the ``'state'`` of the launch (one of
+                 ``'pending'``, ``'running'``, ``'done'`` and
+                 ``'failed'``), the number of ``'attempts'``, the
+                 ``'execution_id'`` and the last ``'error'``.
+        :raises RundeckException: If there is no such ticket.
+        """
+        row = self._db().execute(
+            'SELECT state, attempts, execution_id, error FROM launches '
+            'WHERE ticket = ?', (ticket,)
+        ).fetchone()
+        if row is None:
+            raise RundeckException('unknown ticket {}'.format(ticket))
+        return {'state': row[0], 'attempts': row[1], 'execution_id': row[2],
+                'error': row[3]}
+
+    def result(self, ticket, timeout=None):
+        """Wait for a launch and return the id of its execution.
+
+        :param ticket: The ticket returned by :py:meth:`enqueue`.
+        :param timeout: (optional) The maximum number of seconds to
+                        wait, or ``None`` to wait as long as needed.
+        :return: The execution id, or ``None`` if the timeout expired
+                 or if the job was launched but the id of its execution
+                 could not be read (:py:meth:`status` has the error).
+        :raises RundeckException: If the launch failed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            status = self.status(ticket)
+            if status['state'] == DONE:
+                return status['execution_id']
+            if status['state'] == FAILED:
+                raise RundeckException('launch failed: {}'
+                                       .format(status['error']))
+
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return None
+            with self._cond:
+                self._cond.wait(wait)
+
+    def _claim(self, db):
+        """Mark the oldest launch that is due, or whose lease expired,
+        as running and return it.
+        """
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = db.execute('SELECT ticket, job_id, params, attempts '
+                             'FROM launches WHERE (state = ? AND '
+                             'not_before <= ?) OR (state = ? AND lease < ?) '
+                             'ORDER BY ticket LIMIT 1',
+                             (PENDING, now, RUNNING, now)).fetchone()
+            if row is not None:
+                db.execute('UPDATE launches SET state = ?, lease = ?, '
+                           'updated = ? WHERE ticket = ?',
+                           (RUNNING, now + self.lease, now, row[0]))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return row
+
+    def _finish(self, db, ticket, state, attempts, execution=None,
+                error=None, not_before=0):
+        db.execute('UPDATE launches SET state = ?, attempts = ?, '
+                   'execution_id = ?, error = ?, not_before = ?, '
+                   'updated = ? WHERE ticket = ?',
+                   (state, attempts, execution, error, not_before,
+                    time.time(), ticket))
+        with self._cond:
+            self._cond.notify_all()
+
+    def _drain(self):
+        db = self._db()
+        while not self._stopping:
+            try:
+                row = self._claim(db)
+            except sqlite3.Error as ex:
+                self.logger.warning('could not take a launch from the '
+                                    'queue: {}'.format(ex))
+                row = None
+            if row is None:
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+                continue
+
+            ticket, job_id, params, attempts = row
+            attempts += 1
+            if self.bucket is not None:
+                self.bucket.acquire()
+            state, execution, error, not_before = self._submit(
+                ticket, job_id, params, attempts)
+            try:
+                self._finish(db, ticket, state, attempts, execution=execution,
+                             error=error, not_before=not_before)
+            except sqlite3.Error as ex:
+                # The launch keeps its lease and is taken again once the
+                # lease expires. An accepted launch is then submitted a
+                # second time, as the queue only promises to perform a
+                # launch at least once.
+                self.logger.warning('could not record the outcome of launch '
+                                    '{}: {}'.format(ticket, ex))
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+
+    def _submit(self, ticket, job_id, params, attempts):
+        """Submit a launch and return the state, execution id, error
+        and ``not_before`` time to record for it.
+        """
+        retry = False
+        try:
+            status, result = self.client.run_job(id=job_id,
+                                                 **json.loads(params))
+            if status == 200:
+                try:
+                    return DONE, execution_id(result), None, 0
+                except Exception as ex:
+                    # The job was launched, submitting it again would
+                    # run it twice.
+                    error = 'unknown execution id: {}'.format(
+                        str(ex) or type(ex).__name__)
+                    self.logger.warning('launch {} of job {}: {}'
+                                        .format(ticket, job_id, error))
+                    return DONE, None, error, 0
+            error = 'status {}'.format(status)
+            retry = status >= 500
+        except (CircuitOpenError, ThrottledError) as ex:
+            error = str(ex) or type(ex).__name__
+            retry = True
+        except requests.exceptions.RequestException as ex:
+            error = str(ex) or type(ex).__name__
+            retry = _never_sent(ex)
+        except Exception as ex:
+            error = str(ex) or type(ex).__name__
+
+        self.logger.warning('launch {} of job {} failed: {}'
+                            .format(ticket, job_id, error))
+        if retry and attempts < self.max_attempts:
+            return PENDING, None, error, time.time() + self.retry_delay
+        return FAILED, None, error, 0
+
+    def start(self):
+        """Start the drainer threads."""
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._drain,
+                                      name='pyrundeck-launch-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait=True):
+        """Stop the drainer threads. Queued launches stay in the
+        database.
+
+        :param wait: (optional) Wait for the launches in flight to
+                     finish. *Default value:* ``True``.
+        """
+        self._stopping = True
+        with self._cond:
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def close(self):
+        """Stop the drainer threads and close the connections to the
+        database. Queued launches stay in the database.
+        """
+        self.stop()
+        with self._cond:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for db in connections:
+            db.close()
+
+    def purge(self, older_than):
+        """Delete finished launches.
+
+        :param older_than: The age in seconds above which finished
+                           launches are deleted.
+        :return: The number of launches deleted.
+        """
+        cursor = self._db().execute(
+            'DELETE FROM launches WHERE state IN (?, ?) AND updated < ?',
+            (DONE, FAILED, time.time() - older_than)
+        )
+        return cursor.rowcount
+
+    def stats(self):
+        """Return the number of launches in each state."""
+        ret = dict((s, 0) for s in (PENDING, RUNNING, DONE, FAILED))
+        for state, count in self._db().execute(
+                'SELECT state, COUNT(*) FROM launches GROUP BY state'):
+            ret[state] = count
+        return ret
@@ -0,0 +1,211 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Writing the log records of pyrundeck without blocking the caller.
+
+pyrundeck never configures logging: its records go to the loggers under
+``pyrundeck`` and from there to whatever handlers the application
+installed. A handler that writes to a file or a socket does so on the
+thread that logged the record, which adds the latency of the disk to
+the API call.
+
+:py:class:`QueueLogging` moves that work to a background thread. The
+records of the ``pyrundeck`` loggers are put in a bounded queue and
+written by the given handlers on a ``QueueListener`` thread. When the
+handlers cannot keep up and the queue is full, records are dropped
+rather than making the caller wait, and counted.
+"""
+
+import copy
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pyrundeck import fork
+
+
+NEWEST = 'newest'
+OLDEST = 'oldest'
+
+
+class _DroppingQueueHandler(logging.Handler):
+    """A ``logging.handlers.QueueHandler`` that drops records when its
+    queue is full.
+
+    ``logging.handlers`` is only imported when the listener starts, as
+    importing it takes longer than importing pyrundeck.
+    """
+    def __init__(self, records, drop):
+        logging.Handler.__init__(self)
+        self.queue = records
+        self.drop = drop
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # As QueueHandler does: format the message now, and drop what
+        # cannot be passed to another thread.
+        message = self.format(record)
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.drop == OLDEST:
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        with self._dropped_lock:
+            self.dropped += 1
+
+
+class QueueLogging(object):
+    """Write the records of the ``pyrundeck`` loggers on a background
+    thread.
+
+    While started, the records of ``logger`` go only to ``handlers``
+    and no longer propagate to the handlers of the parent loggers.
+
+    See :doc:`usage` for examples.
+
+    :param handlers: The handlers that write the records, e.g. a
+                     ``logging.FileHandler``.
+    :param max_records: (optional) The number of records the queue
+                        holds. *Default value:* ``10000``.
+    :param drop: (optional) Which record is dropped when the queue is
+                 full: the record being logged (``'newest'``) or the
+                 oldest queued one (``'oldest'``). *Default value:*
+                 ``'newest'``.
+    :param logger: (optional) The name of the logger whose records are
+                   queued. *Default value:* ``'pyrundeck'``.
+    :param level: (optional) If given, the level of ``logger``.
+                  *Default value:* ``None``.
+    """
+    def __init__(self, handlers, max_records=10000, drop=NEWEST,
+                 logger='pyrundeck', level=None):
+        if drop not in (NEWEST, OLDEST):
+            raise ValueError('drop must be {!r} or {!r}'
+                             .format(NEWEST, OLDEST))
+        self.handlers = list(handlers)
+        self.max_records = max_records
+        self.drop = drop
+        self.logger = logging.getLogger(logger)
+        self.level = level
+        self._handler = None
+        self._listener = None
+        self._propagate = None
+        self._dropped = 0
+        fork.register(self)
+
+    def start(self):
+        """Start queueing the records and writing them on a background
+        thread.
+
+        :return: ``self``, so that it can be used as a context manager.
+        """
+        if self._listener is not None:
+            return self
+        self._propagate = self.logger.propagate
+        if self.level is not None:
+            self.logger.setLevel(self.level)
+        self._listen()
+        self.logger.propagate = False
+        return self
+
+    def _listen(self):
+        from logging.handlers import QueueListener
+        records = queue.Queue(self.max_records)
+        self._handler = _DroppingQueueHandler(records, self.drop)
+        self._listener = QueueListener(records, *self.handlers,
+                                       respect_handler_level=True)
+        self._listener.start()
+        self.logger.addHandler(self._handler)
+
+    def _unlisten(self):
+        self.logger.removeHandler(self._handler)
+        self._dropped += self._handler.dropped
+        self._handler = None
+        self._listener = None
+
+    def stop(self):
+        """Write the queued records, stop the background thread and
+        let the records propagate again.
+        """
+        if self._listener is None:
+            return
+        # Records logged after the listener stopped would be lost.
+        self.logger.removeHandler(self._handler)
+        self._listener.stop()
+        self._unlisten()
+        self.logger.propagate = self._propagate
+
+    def _after_fork(self):
+        # The thread of the listener does not exist in a child, and
+        # the lock of the queue may have been held by it.
+        if self._listener is not None:
+            self._unlisten()
+            self._listen()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """Return the number of ``'queued'`` records waiting to be
+        written and the number of ``'dropped'`` ones.
+        """
+        handler = self._handler
+        if handler is None:
+            return {'queued': 0, 'dropped': self._dropped}
+        return {'queued': handler.queue.qsize(),
+                'dropped': self._dropped + handler.dropped}
@@ -0,0 +1,435 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Latency histograms and counters of endpoint calls.
+
+:py:class:`Metrics` is a hook of a :py:class:`pyrundeck.tracing.Tracer`.
+It keeps, for every endpoint method, a :py:class:`Histogram` of the
+call durations per status class, and counters of the time spent in
+each phase of the calls, of the requests sent and of the bytes sent,
+received and parsed. The clients given to :py:meth:`Metrics.watch` also
+have the hit ratios of their caches and the state of their connection
+pools read when the metrics are exported, either as a dictionary or in
+the Prometheus text format.
+"""
+
+import math
+import threading
+import weakref
+
+from pyrundeck import fork
+from pyrundeck.tracing import PHASES
+
+
+#: The default upper bounds of the Prometheus histogram buckets, in
+#: seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+#: The caches of a client whose hit ratios are exported.
+CACHES = ('execution_cache', 'parse_memo', 'refresh_cache',
+          'shared_cache', 'prefetcher')
+
+
+class Histogram(object):
+    """A histogram of positive values with a bounded relative error.
+
+    Every power of two between ``lowest`` and ``highest`` is split in
+    ``sub_buckets`` buckets of equal width, as HDR histograms do, so
+    the buckets are narrow for small values and wide for large ones.
+    Recording a value is a few arithmetic operations, the memory used
+    is fixed and a percentile is within ``1 / sub_buckets`` of the
+    recorded value. Values outside the range are counted in the first
+    or the last bucket. The count, sum and maximum are exact.
+
+    A histogram is not thread safe by itself.
+
+    :param sub_buckets: (optional) The number of buckets per power of
+                        two. *Default value:* 32.
+    :param lowest: (optional) The lowest value told apart from zero.
+                   *Default value:* a microsecond.
+    :param highest: (optional) The highest value told apart from
+                    larger ones. *Default value:* an hour.
+    """
+    def __init__(self, sub_buckets=32, lowest=1e-6, highest=3600):
+        self.sub_buckets = sub_buckets
+        self._min_exp = math.frexp(lowest)[1]
+        max_exp = math.frexp(highest)[1]
+        self._counts = [0] * ((max_exp - self._min_exp + 1) * sub_buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= 0:
+            return 0
+        mantissa, exp = math.frexp(value)
+        index = ((exp - self._min_exp) * self.sub_buckets +
+                 int((mantissa - 0.5) * 2 * self.sub_buckets))
+        return min(max(index, 0), len(self._counts) - 1)
+
+    def _upper(self, index):
+        if index == len(self._counts) - 1:
+            # The last bucket holds every value above the range.
+            return float('inf')
+        exp, sub = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 1) / (2.0 * self.sub_buckets),
+                          exp + self._min_exp)
+
+    def record(self, value):
+        """Count ``value``."""
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Return the value below which ``q`` percent of the recorded
+        values fall, or 0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(self.count * q / 100.0)))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """Return the number of values at most each of ``bounds``, in
+        ascending order.
+
+        A bucket is counted under a bound when all of it is below the
+        bound, so a value close below a bound may be counted under the
+        next one.
+        """
+        counts = [0] * len(bounds)
+        position = 0
+        seen = 0
+        for index, count in enumerate(self._counts):
+            if not count:
+                continue
+            upper = self._upper(index)
+            while position < len(bounds) and bounds[position] < upper:
+                counts[position] = seen
+                position += 1
+            seen += count
+        for position in range(position, len(bounds)):
+            counts[position] = seen
+        return counts
+
+    def snapshot(self):
+        """Return the ``'count'``, ``'sum'`` and ``'max'`` of the
+        values, and their 50th, 90th and 99th percentiles (``'p50'``,
+        ``'p90'``, ``'p99'``).
+        """
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+def _status_class(span):
+    if span.error is not None:
+        return 'error'
+    if not span.requests or span.status is None:
+        return 'cached'
+    return '{}xx'.format(span.status // 100)
+
+
+def _new_counters():
+    return {
+        'phases': dict.fromkeys(PHASES, 0.0),
+        'requests': 0,
+        'request_bytes': 0,
+        'response_bytes': 0,
+        'parsed_bytes': 0,
+        'parse_seconds': 0.0,
+    }
+
+
+def _cache_stats(cache):
+    stats = cache.stats()
+    if 'hits' in stats:
+        hits, misses = stats['hits'], stats['misses']
+    else:
+        # A RefreshingCache counts per endpoint, and serves stale
+        # results as well.
+        hits = sum(s['hits'] + s['stale_hits'] for s in stats.values())
+        misses = sum(s['misses'] for s in stats.values())
+    calls = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': float(hits) / calls if calls else 0.0,
+    }
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(name, _escape(labels[name]))
+                          for name in sorted(labels)) + '}'
+
+
+class Metrics(object):
+    """Latency histograms and counters of the endpoint calls of the
+    clients traced by a :py:class:`pyrundeck.tracing.Tracer`.
+
+    Add the metrics as a hook of the tracer; every finished span is
+    counted under its endpoint method and status class: ``'2xx'``,
+    ``'4xx'`` and so on for the status of the last response,
+    ``'cached'`` for calls answered without a request and ``'error'``
+    for calls that raised an exception.
+
+    See :doc:`usage` for examples.
+
+    :param buckets: (optional) The upper bounds, in seconds, of the
+                    buckets of the exported Prometheus histograms.
+                    *Default value:* :py:data:`DEFAULT_BUCKETS`.
+    :param namespace: (optional) The prefix of the Prometheus metric
+                      names. *Default value:* ``'rundeck_client'``.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace='rundeck_client'):
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._endpoints = {}
+        self._clients = weakref.WeakSet()
+        fork.register(self)
+
+    def _after_fork(self):
+        # The child starts counting its own calls.
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._endpoints = {}
+
+    def __call__(self, span):
+        key = (span.name, _status_class(span))
+        timings = span.timings
+        with self._lock:
+            histogram = self._calls.get(key)
+            if histogram is None:
+                histogram = self._calls[key] = Histogram()
+            histogram.record(span.duration)
+            counters = self._endpoints.get(span.name)
+            if counters is None:
+                counters = self._endpoints[span.name] = _new_counters()
+            phases = counters['phases']
+            for phase in PHASES:
+                phases[phase] += timings[phase]
+            counters['requests'] += span.requests
+            counters['request_bytes'] += span.request_bytes
+            counters['response_bytes'] += span.response_bytes
+            if timings['xml_parse']:
+                counters['parsed_bytes'] += span.response_bytes
+                counters['parse_seconds'] += (timings['xml_parse'] +
+                                              timings['native'])
+
+    def watch(self, client):
+        """Export the cache hit ratios and the connection pools of
+        ``client`` as well. The metrics do not keep ``client`` alive.
+        """
+        self._clients.add(client)
+
+    def _caches(self):
+        caches = {}
+        seen = set()
+        for client in list(self._clients):
+            for name in CACHES:
+                cache = getattr(client, name, None)
+                # Clients made with for_token share their caches.
+                if cache is None or id(cache) in seen:
+                    continue
+                seen.add(id(cache))
+                stats = _cache_stats(cache)
+                total = caches.setdefault(name, {'hits': 0, 'misses': 0})
+                total['hits'] += stats['hits']
+                total['misses'] += stats['misses']
+        for total in caches.values():
+            calls = total['hits'] + total['misses']
+            total['hit_ratio'] = (float(total['hits']) / calls
+                                  if calls else 0.0)
+        return caches
+
+    def _pools(self):
+        pools = []
+        seen = set()
+        for client in list(self._clients):
+            transport = getattr(client, 'transport', None)
+            if transport is None or id(transport) in seen:
+                continue
+            seen.add(id(transport))
+            pools.extend(transport.pool_stats())
+        return pools
+
+    def snapshot(self):
+        """Return the metrics as a dictionary.
+
+        :return: A dictionary with:
+
+                 ``'calls'``
+                     From endpoint name to a dictionary from status
+                     class to the :py:meth:`Histogram.snapshot` of the
+                     durations of its calls.
+                 ``'endpoints'``
+                     From endpoint name to the seconds spent in each
+                     phase (``'phases'``), the number of
+                     ``'requests'``, the ``'request_bytes'`` and
+                     ``'response_bytes'``, and the ``'parsed_bytes'``,
+                     ``'parse_seconds'`` and ``'parse_bytes_per_second'``
+                     of the responses parsed.
+                 ``'caches'``
+                     From cache attribute name, e.g.
+                     ``'execution_cache'``, to the ``'hits'``,
+                     ``'misses'`` and ``'hit_ratio'`` of the caches of
+                     the watched clients.
+                 ``'pools'``
+                     The
+                     :py:meth:`pyrundeck.transport.Transport.pool_stats`
+                     of the transports of the watched clients.
+        """
+        calls = {}
+        endpoints = {}
+        with self._lock:
+            for (name, status), histogram in self._calls.items():
+                calls.setdefault(name, {})[status] = histogram.snapshot()
+            for name, counters in self._endpoints.items():
+                counters = dict(counters, phases=dict(counters['phases']))
+                seconds = counters['parse_seconds']
+                counters['parse_bytes_per_second'] = (
+                    counters['parsed_bytes'] / seconds if seconds else 0.0)
+                endpoints[name] = counters
+        return {
+            'calls': calls,
+            'endpoints': endpoints,
+            'caches': self._caches(),
+            'pools': self._pools(),
+        }
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format,
+        e.g. to serve as the body of a ``/metrics`` endpoint.
+        """
+        lines = []
+        prefix = self.namespace + '_'
+
+        def family(name, kind, description):
+            lines.append('# HELP {}{} {}'.format(prefix, name, description))
+            lines.append('# TYPE {}{} {}'.format(prefix, name, kind))
+
+        def sample(name, labels, value):
+            lines.append('{}{}{} {!r}'.format(prefix, name, labels,
+                                              float(value)))
+
+        with self._lock:
+            calls = sorted((key, histogram.cumulative(self.buckets),
+                            histogram.count, histogram.sum)
+                           for key, histogram in self._calls.items())
+            endpoints = sorted((name, dict(counters,
+                                           phases=dict(counters['phases'])))
+                               for name, counters in self._endpoints.items())
+
+        family('call_duration_seconds', 'histogram',
+               'Duration of the endpoint calls.')
+        for (name, status), cumulative, count, total in calls:
+            for bound, seen in zip(self.buckets, cumulative):
+                sample('call_duration_seconds_bucket',
+                       _labels(endpoint=name, status=status,
+                               le=repr(float(bound))), seen)
+            sample('call_duration_seconds_bucket',
+                   _labels(endpoint=name, status=status, le='+Inf'), count)
+            sample('call_duration_seconds_sum',
+                   _labels(endpoint=name, status=status), total)
+            sample('call_duration_seconds_count',
+                   _labels(endpoint=name, status=status), count)
+
+        family('phase_seconds_total', 'counter',
+               'Time spent in each phase of the endpoint calls.')
+        for name, counters in endpoints:
+            for phase in PHASES:
+                sample('phase_seconds_total',
+                       _labels(endpoint=name, phase=phase),
+                       counters['phases'][phase])
+        for metric, key, description in (
+                ('http_requests_total', 'requests',
+                 'HTTP requests sent by the endpoint calls.'),
+                ('request_bytes_total', 'request_bytes',
+                 'Bytes of the request bodies sent.'),
+                ('response_bytes_total', 'response_bytes',
+                 'Bytes of the response bodies received.'),
+                ('parsed_bytes_total', 'parsed_bytes',
+                 'Bytes of the response bodies parsed.'),
+                ('parse_seconds_total', 'parse_seconds',
+                 'Time spent parsing the response bodies.')):
+            family(metric, 'counter', description)
+            for name, counters in endpoints:
+                sample(metric, _labels(endpoint=name), counters[key])
+
+        caches = sorted(self._caches().items())
+        family('cache_hits_total', 'counter', 'Calls answered by a cache.')
+        for name, stats in caches:
+            sample('cache_hits_total', _labels(cache=name), stats['hits'])
+        family('cache_misses_total', 'counter',
+               'Calls a cache could not answer.')
+        for name, stats in caches:
+            sample('cache_misses_total', _labels(cache=name),
+                   stats['misses'])
+
+        pools = self._pools()
+        family('pool_connections', 'gauge',
+               'Connections of the connection pools.')
+        for pool in pools:
+            for state in ('in_use', 'idle'):
+                sample('pool_connections',
+                       _labels(pool=pool['pool'], state=state), pool[state])
+        family('pool_max_connections', 'gauge',
+               'Connections kept by the connection pools.')
+        for pool in pools:
+            sample('pool_max_connections', _labels(pool=pool['pool']),
+                   pool['max'])
+        family('pool_connections_opened_total', 'counter',
+               'Connections opened by the connection pools.')
+        for pool in pools:
+            sample('pool_connections_opened_total',
+                   _labels(pool=pool['pool']), pool['opened'])
+        return '\n'.join(lines) + '\n'
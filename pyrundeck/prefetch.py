@@ -0,0 +1,261 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Speculative prefetching of job definitions.
+
+User interfaces usually follow ``list_jobs`` with ``job_definition``
+calls for the jobs they show, each of them a separate round trip. A
+:py:class:`JobPrefetcher` starts fetching those definitions in the
+background as soon as ``list_jobs`` returns, so that the following
+``job_definition`` calls find them ready.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import logging
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.cache import LRUCache
+from pyrundeck.helpers import _LazyModule
+
+etree = _LazyModule('lxml.etree')
+
+
+FIRST = 'first'
+RECENT = 'recent'
+
+
+def job_ids(result):
+    """Return the ids of the jobs in a ``list_jobs`` result, native or
+    ``etree``, in the order they are listed.
+    """
+    if isinstance(result, etree._Element):
+        return [job.get('id') for job in result.iter('job')]
+    return [job['id'] for job in result['jobs']['list']]
+
+
+class _Prefetch(object):
+    def __init__(self, future):
+        self.future = future
+        self.created = time.time()
+        self.used = False
+
+
+class JobPrefetcher(object):
+    """Fetches the definitions of listed jobs before they are asked
+    for.
+
+    After every successful ``list_jobs`` call, the definitions of up to
+    ``top_n`` of the listed jobs are fetched by a pool of ``workers``
+    threads. With the ``'first'`` strategy these are the first listed
+    jobs; with the ``'recent'`` strategy they are the listed jobs whose
+    definitions were asked for most recently.
+
+    A ``job_definition`` call for a prefetched job, without parameters
+    other than ``id`` and ``native``, is answered with the prefetched
+    definition, waiting for it if it is still being fetched. Prefetched
+    definitions older than ``ttl`` seconds are not used.
+
+    Set :py:attr:`enabled` to ``False`` to stop prefetching, e.g. when
+    :py:meth:`stats` shows that few prefetched definitions are used.
+
+    See :doc:`usage` for examples.
+
+    :param top_n: (optional) The number of definitions fetched after
+                  every ``list_jobs`` call. *Default value:* ``10``.
+    :param strategy: (optional) ``'first'`` or ``'recent'``. *Default
+                     value:* ``'first'``.
+    :param max_entries: (optional) The maximum number of prefetched
+                        definitions kept. *Default value:* ``256``.
+    :param ttl: (optional) Seconds a prefetched definition is used
+                for. *Default value:* ``30.0``.
+    :param workers: (optional) The number of threads fetching
+                    definitions. *Default value:* ``4``.
+    """
+    def __init__(self, top_n=10, strategy=FIRST, max_entries=256, ttl=30.0,
+                 workers=4):
+        if strategy not in (FIRST, RECENT):
+            raise ValueError('unknown prefetch strategy {}'.format(strategy))
+        self.top_n = top_n
+        self.strategy = strategy
+        self.ttl = ttl
+        self.workers = workers
+        self.enabled = True
+        self.logger = logging.getLogger(__name__)
+
+        self._entries = LRUCache(max_entries, on_evict=self._evicted)
+        self._recent = LRUCache(max_entries)
+        self._executor = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Held while an entry is checked and then used or replaced.
+        self._entries_lock = threading.Lock()
+        self._stats = {'prefetched': 0, 'hits': 0, 'misses': 0, 'unused': 0}
+        fork.register(self)
+
+    def _after_fork(self):
+        # Prefetches in flight in the parent never finish in a child.
+        self._executor = None
+        self._lock = threading.Lock()
+        self._entries_lock = threading.Lock()
+        self._entries = LRUCache(self._entries.max_entries,
+                                 on_evict=self._evicted)
+
+    def handles(self, name):
+        """Check whether calls to the endpoint ``name`` are of interest
+        to the prefetcher.
+        """
+        return name in ('list_jobs', 'job_definition')
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _evicted(self, key, prefetch):
+        if not prefetch.used:
+            self._count('unused')
+
+    def call(self, client, name, args, params, fetch):
+        """Perform an endpoint call, prefetching after ``list_jobs`` and
+        serving ``job_definition`` from the prefetched definitions.
+
+        :param client: The :py:class:`pyrundeck.api.RundeckApiClient`
+                       making the call.
+        :param name: The name of the endpoint.
+        :param args: The positional arguments of the call.
+        :param params: The keyword arguments of the call.
+        :param fetch: A callable without arguments that performs the
+                      call.
+        """
+        if getattr(self._local, 'prefetching', False):
+            return fetch()
+        if name == 'list_jobs':
+            result = fetch()
+            if result[0] == 200 and self.enabled:
+                self._prefetch(client, job_ids(result[1]))
+            return result
+
+        job_id = params.get('id')
+        if args or job_id is None or set(params) - set(['id', 'native']):
+            return fetch()
+        # Definitions are kept apart per token, see
+        # RundeckApiClient.partition.
+        key = (client.partition, job_id)
+        self._recent.set(key, True)
+        result = self._lookup(key)
+        if result is None:
+            self._count('misses')
+            return fetch()
+
+        self._count('hits')
+        status, tree = result
+        if params.get('native', True):
+            return status, client._parse(tree)
+        return status, copy.deepcopy(tree)
+
+    def _lookup(self, key):
+        # The entry stays in place while its definition is awaited, so
+        # that other calls for the same job wait for it as well and
+        # _prefetch does not fetch it again.
+        with self._entries_lock:
+            prefetch = self._entries.get(key)
+            if prefetch is None:
+                return None
+            expired = time.time() - prefetch.created > self.ttl
+            if expired:
+                self._entries.pop(key)
+            else:
+                prefetch.used = True
+        if expired:
+            self._evicted(key, prefetch)
+            return None
+        try:
+            result = prefetch.future.result()
+        except Exception:
+            return None
+        if result[0] != 200:
+            return None
+        return result
+
+    def _choose(self, partition, ids):
+        if self.strategy == RECENT:
+            listed = set(ids)
+            ids = [job_id for p, job_id in reversed(self._recent.keys())
+                   if p == partition and job_id in listed]
+        return ids[:self.top_n]
+
+    def _prefetch(self, client, ids):
+        now = time.time()
+        for job_id in self._choose(client.partition, ids):
+            key = (client.partition, job_id)
+            with self._entries_lock:
+                prefetch = self._entries.get(key)
+                if prefetch is not None and \
+                        now - prefetch.created <= self.ttl:
+                    continue
+                if prefetch is not None and not prefetch.used:
+                    self._count('unused')
+                if self._executor is None:
+                    with self._lock:
+                        if self._executor is None:
+                            self._executor = ThreadPoolExecutor(self.workers)
+                self._entries.set(key, _Prefetch(self._executor.submit(
+                    self._fetch, client, job_id
+                )))
+            self._count('prefetched')
+
+    def _fetch(self, client, job_id):
+        self._local.prefetching = True
+        try:
+            return client.job_definition(id=job_id, native=False)
+        except Exception as ex:
+            self.logger.debug('prefetch of job {} failed: {}'
+                              .format(job_id, ex))
+            raise
+        finally:
+            self._local.prefetching = False
+
+    def stats(self):
+        """Return the counters of the prefetcher.
+
+        :return: A dictionary with the number of definitions
+                 ``'prefetched'``, of ``job_definition`` calls served
+                 from them (``'hits'``) or not (``'misses'``), of
+                 prefetched definitions dropped without being used
+                 (``'unused'``), and the ``'hit_ratio'`` of the calls.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / calls if calls else 0.0
+        return stats
@@ -0,0 +1,360 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Retry policy and circuit breaker for the requests performed by
+:py:class:`pyrundeck.api.RundeckApiClient`.
+
+A :py:class:`RetryPolicy` retries requests that failed because the
+server was overloaded (a ``5xx`` status or a connection error), waiting
+for an exponentially growing, randomly jittered interval between
+attempts. Retries are limited by a :py:class:`RetryBudget`, so that the
+client never multiplies the load of a struggling server, and a
+:py:class:`CircuitBreaker` stops sending requests altogether while the
+server keeps failing.
+"""
+
+import collections
+import logging
+import random
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.exceptions import CircuitOpenError
+from pyrundeck.helpers import _LazyModule
+
+requests = _LazyModule('requests')
+urllib3 = _LazyModule('urllib3')
+
+# Tells a policy built without a breaker from one built with
+# ``breaker=None``, which disables it.
+_DEFAULT_BREAKER = object()
+
+
+class RetryBudget(object):
+    """Limit the number of retries to a fraction of the requests.
+
+    Over a sliding window of ``window`` seconds, the number of retries
+    may not exceed ``ratio`` times the number of requests plus a
+    minimum allowance of ``min_per_second`` retries per second.
+
+    :param ratio: (optional) Fraction of the requests that may be
+                  retried. *Default value:* ``0.2``.
+    :param min_per_second: (optional) Retries allowed per second
+                           regardless of the request rate. *Default
+                           value:* ``1.0``.
+    :param window: (optional) The length of the sliding window in
+                   seconds. *Default value:* ``10.0``.
+    """
+    def __init__(self, ratio=0.2, min_per_second=1.0, window=10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests = collections.deque()
+        self._retries = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        limit = now - self.window
+        for events in (self._requests, self._retries):
+            while events and events[0] < limit:
+                events.popleft()
+
+    def record_request(self):
+        """Record a request that is not a retry."""
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            self._requests.append(now)
+
+    def try_withdraw(self):
+        """Withdraw a retry from the budget.
+
+        :return: ``True`` if the retry is allowed, ``False`` if the
+                 budget is exhausted.
+        """
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            allowed = (self.ratio * len(self._requests) +
+                       self.min_per_second * self.window)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker(object):
+    """Fail fast while the server is unhealthy.
+
+    The breaker starts *closed*. After ``failure_threshold``
+    consecutive failures it *opens* and every request is rejected with
+    a :py:class:`pyrundeck.exceptions.CircuitOpenError` without
+    reaching the server. After ``reset_timeout`` seconds the breaker
+    becomes *half open* and lets a single probe request through: if
+    the probe succeeds the breaker closes, otherwise it opens again.
+
+    :param failure_threshold: (optional) Consecutive failures that
+                              open the breaker. *Default value:* ``5``.
+    :param reset_timeout: (optional) Seconds the breaker stays open
+                          before a probe is allowed. *Default value:*
+                          ``30.0``.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_count = 0
+        self.fast_failed_count = 0
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_started = None
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def _after_fork(self):
+        # A probe in flight was sent by a thread of the parent.
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Check whether a request may be sent.
+
+        :raises CircuitOpenError: If the breaker is open or a probe
+                                  request is already in flight.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self._opened_at < self.reset_timeout:
+                    self.fast_failed_count += 1
+                    raise CircuitOpenError('circuit breaker is open')
+                self.state = self.HALF_OPEN
+                self._probing = False
+
+            if self.state == self.HALF_OPEN:
+                # A probe that never reported back (e.g. it raised an
+                # unrelated exception) must not block the breaker
+                # forever.
+                if (self._probing and
+                        time.time() - self._probe_started <
+                        self.reset_timeout):
+                    self.fast_failed_count += 1
+                    raise CircuitOpenError('circuit breaker is half open')
+                self._probing = True
+                self._probe_started = time.time()
+
+    def record_success(self):
+        """Record a request that the server handled."""
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        """Record a request that failed because of the server."""
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if (self.state == self.HALF_OPEN or
+                    self._failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    self.opened_count += 1
+                self.state = self.OPEN
+                self._opened_at = time.time()
+
+
+def _never_sent(exc):
+    """Check whether a request exception happened before the request
+    reached the server.
+    """
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        if not exc.args:
+            return False
+        reason = getattr(exc.args[0], 'reason', exc.args[0])
+        # Includes NameResolutionError of urllib3 2.
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class RetryPolicy(object):
+    """Decide whether and when a failed request is retried.
+
+    A request is retried if the server answered with one of the
+    ``retry_statuses`` or if the connection failed. Requests to
+    endpoints that are not idempotent (see
+    :py:data:`pyrundeck.endpoints.ENDPOINTS`) are only retried if the
+    connection could not be established, so that e.g. ``run_job`` never
+    starts the same job twice.
+
+    The delay before retry ``n`` (starting at 0) is chosen uniformly at
+    random between 0 and ``min(backoff_max, backoff_base * 2 ** n)``. A
+    ``Retry-After`` header sent by the server is honored, up to
+    ``backoff_max`` seconds.
+
+    See :doc:`usage` for examples.
+
+    :param max_attempts: (optional) The maximum number of times a
+                         request is sent. *Default value:* ``3``.
+    :param backoff_base: (optional) The base delay in
+                         seconds. *Default value:* ``0.5``.
+    :param backoff_max: (optional) The maximum delay in
+                        seconds. *Default value:* ``30.0``.
+    :param retry_statuses: (optional) The status codes that are
+                           considered server failures. *Default
+                           value:* ``(500, 502, 503, 504)``.
+    :param budget: (optional) A :py:class:`RetryBudget`. *Default
+                   value:* ``RetryBudget()``.
+    :param breaker: (optional) A :py:class:`CircuitBreaker`, or
+                    ``None`` to disable it. *Default value:*
+                    ``CircuitBreaker()``.
+    """
+    def __init__(self, max_attempts=3, backoff_base=0.5, backoff_max=30.0,
+                 retry_statuses=(500, 502, 503, 504), budget=None,
+                 breaker=_DEFAULT_BREAKER):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = frozenset(retry_statuses)
+        self.budget = budget if budget is not None else RetryBudget()
+        self.breaker = CircuitBreaker() if breaker is _DEFAULT_BREAKER \
+            else breaker
+        self.retry_count = 0
+        self.budget_exhausted_count = 0
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def backoff(self, attempt, retry_after=None):
+        """Compute the delay before a retry.
+
+        :param attempt: The number of the retry, starting at 0.
+        :param retry_after: (optional) The value of the ``Retry-After``
+                            header of the failed response.
+        :return: The delay in seconds.
+        """
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass  # HTTP dates are not worth parsing here
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _may_retry(self, attempt):
+        if attempt + 1 >= self.max_attempts:
+            return False
+        if not self.budget.try_withdraw():
+            with self._lock:
+                self.budget_exhausted_count += 1
+            return False
+        with self._lock:
+            self.retry_count += 1
+        return True
+
+    def call(self, endpoint, send):
+        """Send a request, retrying it according to the policy.
+
+        :param endpoint: The endpoint description of the request (see
+                         :py:func:`pyrundeck.endpoints.find_endpoint`).
+        :param send: A callable without arguments that sends the
+                     request and returns the response.
+        :return: The last response received.
+        :raises CircuitOpenError: If the circuit breaker rejected the
+                                  request.
+        """
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_request()
+
+            retry_after = None
+            try:
+                response = send()
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as ex:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                if not ((endpoint['idempotent'] or _never_sent(ex)) and
+                        self._may_retry(attempt)):
+                    raise
+                self.logger.info('retrying {} after error: {}'
+                                 .format(endpoint['name'], ex))
+            else:
+                if response.status_code not in self.retry_statuses:
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    return response
+
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                if not (endpoint['idempotent'] and self._may_retry(attempt)):
+                    return response
+                headers = getattr(response, 'headers', None) or {}
+                retry_after = headers.get('Retry-After')
+                self.logger.info('retrying {} after status {}'
+                                 .format(endpoint['name'],
+                                         response.status_code))
+
+            time.sleep(self.backoff(attempt, retry_after))
+            attempt += 1
+
+    def stats(self):
+        """Return the counters of the policy.
+
+        :return: A dictionary with the number of retries performed
+                 (``'retries'``), retries refused because the budget
+                 was exhausted (``'budget_exhausted'``), times the
+                 circuit breaker opened (``'breaker_opened'``),
+                 requests rejected by the open breaker
+                 (``'fast_failed'``) and the current state of the
+                 breaker (``'breaker_state'``). The counters of the
+                 breaker are left out if it is disabled.
+        """
+        with self._lock:
+            ret = {
+                'retries': self.retry_count,
+                'budget_exhausted': self.budget_exhausted_count,
+            }
+        if self.breaker is not None:
+            ret.update({
+                'breaker_opened': self.breaker.opened_count,
+                'fast_failed': self.breaker.fast_failed_count,
+                'breaker_state': self.breaker.state,
+            })
+        return ret
@@ -29,8 +29,6 @@
 # THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
-import logging
-
 from pyrundeck.xml2native import ParserEngine
 
 __author__ = "Panagiotis Koutsourakis <kutsurak@ekt.gr>"
@@ -43,7 +41,7 @@ class RundeckParser(object):
     :py:class:`pyrundeck.xml2native.ParserEngine` for more details.
 
     """
-    def __init__(self, log_level=logging.INFO):
+    def __init__(self, log_level=None):
         self.error_parse_table = {
             'tag': 'error',
             'type': 'composite',
@@ -522,11 +520,27 @@ class RundeckParser(object):
         # ... and call it
         return cb(xml_tree, parse_table)
 
-# The entry point for this module
-_parser = RundeckParser()
+# The entry point for this module. The parser is built by the first
+# call to parse, so that importing pyrundeck stays cheap.
+_parser = None
+
+
+def get_parser():
+    """Return the parser used by :py:func:`parse`, building it on the
+    first call.
+    """
+    global _parser
+    if _parser is None:
+        _parser = RundeckParser()
+    return _parser
+
 
+def parse(xml_tree, cb_type='alternatives', parse_table=None):
+    """Main entry point to the parser
 
-def parse(xml_tree, cb_type='alternatives',
-          parse_table=_parser.start_symbol):
-    """Main entry point to the parser"""
-    return _parser.parse(xml_tree, cb_type, parse_table)
+    ``parse_table`` defaults to the start symbol of the parser.
+    """
+    parser = get_parser()
+    if parse_table is None:
+        parse_table = parser.start_symbol
+    return parser.parse(xml_tree, cb_type, parse_table)
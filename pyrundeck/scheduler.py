@@ -0,0 +1,211 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""A priority scheduler for the requests of a client.
+
+When a :py:class:`RequestScheduler` is attached to a
+:py:class:`pyrundeck.api.RundeckApiClient`, every request is performed
+by one of a fixed number of worker threads. Waiting requests are
+dispatched in the order of their priority class, so interactive
+lookups do not queue up behind bulk transfers, while aging guarantees
+that the lower classes still make progress.
+"""
+
+import collections
+from concurrent.futures import Future
+import logging
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.exceptions import RundeckException
+
+
+class RequestScheduler(object):
+    """Dispatch calls to a fixed pool of worker threads by priority.
+
+    A waiting call is normally dispatched only when no call of a higher
+    priority class is waiting. A call that has been waiting for more
+    than ``max_wait`` seconds is dispatched ahead of everything else, so
+    that a steady stream of interactive requests cannot starve the bulk
+    work.
+
+    See :doc:`usage` for examples.
+
+    :param workers: (optional) The number of worker threads. *Default
+                    value:* ``4``.
+    :param classes: (optional) The priority classes, highest priority
+                    first. *Default value:* ``('interactive', 'bulk')``.
+    :param max_wait: (optional) The number of seconds after which a
+                     waiting call is dispatched regardless of its
+                     priority. *Default value:* ``5.0``.
+    """
+    def __init__(self, workers=4, classes=('interactive', 'bulk'),
+                 max_wait=5.0):
+        self.classes = tuple(classes)
+        self.max_wait = max_wait
+        self.logger = logging.getLogger(__name__)
+
+        self._queues = dict((c, collections.deque()) for c in self.classes)
+        self._stats = dict((c, {'dispatched': 0, 'total_wait': 0.0,
+                                'max_wait': 0.0})
+                           for c in self.classes)
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._shutdown = False
+        self._workers = []
+        self._start(workers)
+        fork.register(self)
+
+    def _start(self, workers):
+        for i in range(workers):
+            worker = threading.Thread(target=self._work,
+                                      name='pyrundeck-scheduler-{}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _after_fork(self):
+        # Only the forking thread exists in the child. The calls that
+        # were waiting belong to threads of the parent.
+        self._cond = threading.Condition()
+        for queue in self._queues.values():
+            queue.clear()
+        workers = len(self._workers)
+        self._workers = []
+        if not self._shutdown:
+            self._start(workers)
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """Schedule ``fn(*args, **kwargs)`` to run on a worker thread.
+
+        :param priority: The priority class of the call.
+        :return: A ``concurrent.futures.Future`` that resolves to the
+                 result of the call.
+        :raises RundeckException: If the priority class is unknown or
+                                  the scheduler is shut down.
+        """
+        if priority not in self._queues:
+            raise RundeckException('unknown priority class {}'
+                                   .format(priority))
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RundeckException('the scheduler is shut down')
+            self._queues[priority].append((time.time(), future, fn, args,
+                                           kwargs))
+            self._cond.notify()
+        return future
+
+    def in_worker(self):
+        """Check whether the calling thread is one of the workers."""
+        return getattr(self._local, 'worker', False)
+
+    def _next(self):
+        """Pick the next call to dispatch. Must hold ``self._cond``."""
+        now = time.time()
+        oldest = None
+        for c in self.classes:
+            queue = self._queues[c]
+            if queue and now - queue[0][0] > self.max_wait:
+                if oldest is None or queue[0][0] < self._queues[oldest][0][0]:
+                    oldest = c
+        if oldest is not None:
+            return oldest, self._queues[oldest].popleft()
+
+        for c in self.classes:
+            if self._queues[c]:
+                return c, self._queues[c].popleft()
+        return None, None
+
+    def _work(self):
+        self._local.worker = True
+        while True:
+            with self._cond:
+                priority, item = self._next()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    priority, item = self._next()
+
+                enqueued, future, fn, args, kwargs = item
+                wait = time.time() - enqueued
+                stats = self._stats[priority]
+                stats['dispatched'] += 1
+                stats['total_wait'] += wait
+                stats['max_wait'] = max(stats['max_wait'], wait)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as ex:
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait=True):
+        """Stop the workers once the waiting calls are done.
+
+        :param wait: (optional) Wait for the workers to
+                     exit. *Default value:* ``True``.
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def stats(self):
+        """Return the queue statistics per priority class.
+
+        :return: A dictionary from priority class to a dictionary with
+                 the number of calls waiting (``'queued'``), the number
+                 of calls dispatched (``'dispatched'``) and the mean and
+                 maximum time in seconds the dispatched calls waited
+                 (``'mean_wait'``, ``'max_wait'``).
+        """
+        ret = {}
+        with self._cond:
+            for c in self.classes:
+                stats = self._stats[c]
+                dispatched = stats['dispatched']
+                ret[c] = {
+                    'queued': len(self._queues[c]),
+                    'dispatched': dispatched,
+                    'mean_wait': (stats['total_wait'] / dispatched
+                                  if dispatched else 0.0),
+                    'max_wait': stats['max_wait'],
+                }
+        return ret
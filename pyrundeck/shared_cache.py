@@ -0,0 +1,280 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""A cache of endpoint results shared by the processes of one host.
+
+Pre-forking servers run many worker processes, and every one of them
+would otherwise fetch and parse the same ``list_jobs`` and
+``job_definition`` results. A :py:class:`SharedCache` keeps those
+results in a sqlite database that all the workers open, so a result
+fetched by one worker is reused by the others.
+
+Results are stored compressed: native results as JSON, ``etree``
+results as serialized XML. Every read returns a new copy, so callers
+are free to modify what they get.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from pyrundeck import fork
+from pyrundeck.helpers import _LazyModule
+
+etree = _LazyModule('lxml.etree')
+
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS entries (
+           key TEXT PRIMARY KEY,
+           endpoint TEXT NOT NULL,
+           status INTEGER NOT NULL,
+           kind TEXT NOT NULL,
+           value BLOB NOT NULL,
+           stored REAL NOT NULL,
+           accessed REAL NOT NULL
+       )""",
+    """CREATE INDEX IF NOT EXISTS entries_accessed
+       ON entries (accessed)""",
+]
+
+JSON = 'json'
+XML = 'xml'
+
+
+def _encode(value):
+    if isinstance(value, etree._Element):
+        return XML, zlib.compress(etree.tostring(value))
+    return JSON, zlib.compress(json.dumps(value, separators=(',', ':'))
+                               .encode('utf-8'))
+
+
+def _decode(kind, blob):
+    data = zlib.decompress(blob)
+    if kind == XML:
+        return etree.fromstring(data)
+    return json.loads(data.decode('utf-8'))
+
+
+class SharedCache(object):
+    """A sqlite backed cache of endpoint results, shared between
+    processes.
+
+    Every process creates its own :py:class:`SharedCache` with the same
+    ``path``. Entries older than ``ttl`` seconds are not served. When
+    there are more than ``max_entries`` entries, the least recently
+    used ones are evicted.
+
+    Only results with status ``200`` are cached. Errors of the database
+    are logged and make the cache behave as if it were empty, so the
+    endpoints keep working if it is unavailable.
+
+    See :doc:`usage` for examples.
+
+    :param path: The path of the sqlite database.
+    :param endpoints: (optional) The names of the cached endpoints.
+                      *Default value:* ``('list_jobs',
+                      'job_definition')``.
+    :param ttl: (optional) Seconds an entry is served for. *Default
+                value:* ``60.0``.
+    :param max_entries: (optional) The maximum number of entries.
+                        *Default value:* ``1000``.
+    """
+    def __init__(self, path, endpoints=('list_jobs', 'job_definition'),
+                 ttl=60.0, max_entries=1000):
+        self.path = path
+        self.endpoints = frozenset(endpoints)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                       'errors': 0}
+
+        db = self._db()
+        for statement in _SCHEMA:
+            db.execute(statement)
+        fork.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _db(self):
+        # Connections must not be used across a fork, so a forked child
+        # opens its own.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            db = sqlite3.connect(self.path, timeout=30,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = pid
+        return self._local.db
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def handles(self, name):
+        """Check whether the endpoint ``name`` is cached."""
+        return name in self.endpoints
+
+    def key(self, name, args, params, partition=None):
+        """Return the key of the entry of an endpoint call."""
+        return json.dumps([name, partition, list(args),
+                           sorted(params.items())], default=repr)
+
+    def call(self, name, args, params, fetch, partition=None):
+        """Return the result of an endpoint call, from the cache if
+        possible.
+
+        :param name: The name of the endpoint.
+        :param args: The positional arguments of the call.
+        :param params: The keyword arguments of the call.
+        :param fetch: A callable without arguments that performs the
+                      call.
+        :param partition: (optional) The partition of the calling
+                          client, which keeps the results of clients
+                          with different tokens apart. *Default
+                          value:* ``None``.
+        """
+        key = self.key(name, args, params, partition)
+        result = self.get(key)
+        if result is not None:
+            self._count('hits')
+            return result
+        self._count('misses')
+        result = fetch()
+        if result[0] == 200:
+            self.set(key, name, result)
+        return result
+
+    def get(self, key):
+        """Return the ``(status, value)`` stored under ``key``, or
+        ``None``.
+        """
+        now = time.time()
+        try:
+            db = self._db()
+            row = db.execute('SELECT status, kind, value, accessed '
+                             'FROM entries WHERE key = ? AND stored > ?',
+                             (key, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            # Recording every read would turn readers into writers, so
+            # the access time is only updated once a second.
+            if row[3] < now - 1.0:
+                db.execute('UPDATE entries SET accessed = ? WHERE key = ?',
+                           (now, key))
+            return row[0], _decode(row[1], row[2])
+        except (sqlite3.Error, ValueError, zlib.error,
+                etree.XMLSyntaxError) as ex:
+            self.logger.warning('shared cache read failed: {}'.format(ex))
+            self._count('errors')
+            return None
+
+    def set(self, key, name, result):
+        """Store the ``(status, value)`` pair ``result`` of the endpoint
+        ``name`` under ``key``.
+        """
+        try:
+            kind, blob = _encode(result[1])
+        except (TypeError, ValueError) as ex:
+            self.logger.debug('result of {} not cached: {}'.format(name, ex))
+            return
+
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute('INSERT OR REPLACE INTO entries (key, endpoint, '
+                           'status, kind, value, stored, accessed) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (key, name, result[0], kind,
+                            sqlite3.Binary(blob), now, now))
+                evicted = self._evict(db, now)
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as ex:
+            self.logger.warning('shared cache write failed: {}'.format(ex))
+            self._count('errors')
+            return
+        self._count('stores')
+        self._count('evictions', evicted)
+
+    def _evict(self, db, now):
+        evicted = db.execute('DELETE FROM entries WHERE stored <= ?',
+                             (now - self.ttl,)).rowcount
+        excess = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0] \
+            - self.max_entries
+        if excess > 0:
+            evicted += db.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                'ORDER BY accessed LIMIT ?)', (excess,)
+            ).rowcount
+        return evicted
+
+    def invalidate(self, name=None):
+        """Drop the entries of the endpoint ``name``, or all the entries
+        if ``name`` is ``None``, in every process.
+        """
+        db = self._db()
+        if name is None:
+            db.execute('DELETE FROM entries')
+        else:
+            db.execute('DELETE FROM entries WHERE endpoint = ?', (name,))
+
+    def stats(self):
+        """Return the counters of this process and the size of the
+        cache.
+
+        :return: A dictionary with the number of ``'hits'``,
+                 ``'misses'``, ``'stores'``, ``'evictions'`` and
+                 database ``'errors'`` in this process, and the number
+                 of ``'entries'`` and their compressed ``'bytes'``.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        row = self._db().execute('SELECT COUNT(*), '
+                                 'COALESCE(SUM(LENGTH(value)), 0) '
+                                 'FROM entries').fetchone()
+        stats['entries'], stats['bytes'] = row
+        return stats
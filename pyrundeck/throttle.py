@@ -0,0 +1,285 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Client side rate and concurrency limits.
+
+A :py:class:`RateLimiter` is shared by every thread that uses the same
+:py:class:`pyrundeck.api.RundeckApiClient` instance. It keeps a
+separate token bucket and in-flight limit for each endpoint class
+(``'read'``, ``'write'`` and ``'heavy'``, see
+:py:data:`pyrundeck.endpoints.ENDPOINTS`), so that e.g. a mass export
+cannot use up the allowance of the interactive reads.
+"""
+
+import contextlib
+import threading
+import time
+
+from pyrundeck import fork
+from pyrundeck.exceptions import ThrottledError
+
+
+class TokenBucket(object):
+    """A thread safe token bucket.
+
+    Tokens are added at ``rate`` tokens per second, up to ``burst``
+    tokens. Every request consumes one token.
+
+    :param rate: The number of tokens added per second.
+    :param burst: (optional) The capacity of the bucket. *Default
+                  value:* ``max(1, rate)``.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._last)
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._last = now
+
+    def reserve(self):
+        """Take a token, borrowing it from the future if necessary.
+
+        This method never blocks. It is meant for callers that cannot
+        block the calling thread (e.g. an event loop), which should
+        wait for the returned delay before sending the request.
+
+        :return: The number of seconds until the token is available.
+        """
+        with self._lock:
+            self._refill(time.time())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting until one is available.
+
+        :param timeout: (optional) The maximum number of seconds to
+                        wait. If ``None`` wait as long as needed.
+        :return: ``True`` if a token was taken, ``False`` if the
+                 timeout expired.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class ConcurrencyLimit(object):
+    """Limit the number of requests in flight.
+
+    :param max_in_flight: The maximum number of concurrent requests.
+    """
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        fork.register(self)
+
+    def _after_fork(self):
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        """Take a slot if one is free, without blocking.
+
+        :return: ``True`` if a slot was taken.
+        """
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self, timeout=None):
+        """Take a slot, waiting until one is free.
+
+        :param timeout: (optional) The maximum number of seconds to
+                        wait. If ``None`` wait as long as needed.
+        :return: ``True`` if a slot was taken, ``False`` if the timeout
+                 expired.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.in_flight >= self.max_in_flight:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """Free a slot taken with :py:meth:`acquire`."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class RateLimiter(object):
+    """Rate and concurrency limits per endpoint class.
+
+    The limits are given as a dictionary from the endpoint class to a
+    dictionary with the (optional) keys ``'rate'`` (requests per
+    second), ``'burst'`` (see :py:class:`TokenBucket`) and
+    ``'max_in_flight'``. Classes without an entry are not limited::
+
+        RateLimiter({
+            'read': {'rate': 20, 'burst': 40, 'max_in_flight': 8},
+            'write': {'rate': 5, 'max_in_flight': 2},
+            'heavy': {'rate': 0.2, 'max_in_flight': 1},
+        })
+
+    See :doc:`usage` for examples.
+
+    :param limits: The limits per endpoint class.
+    :param timeout: (optional) The maximum number of seconds a request
+                    may wait for the limits. If ``None`` requests wait
+                    as long as needed. *Default value:* ``None``.
+    """
+    def __init__(self, limits, timeout=None):
+        self.timeout = timeout
+        self.buckets = {}
+        self.concurrency = {}
+        self.throttled_count = {}
+        self._lock = threading.Lock()
+        for endpoint_class, limit in limits.items():
+            if limit.get('rate') is not None:
+                self.buckets[endpoint_class] = TokenBucket(limit['rate'],
+                                                           limit.get('burst'))
+            if limit.get('max_in_flight') is not None:
+                self.concurrency[endpoint_class] = \
+                    ConcurrencyLimit(limit['max_in_flight'])
+            self.throttled_count[endpoint_class] = 0
+        fork.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def acquire(self, endpoint_class):
+        """Wait until a request of ``endpoint_class`` may be sent.
+
+        Every successful call must be paired with a call to
+        :py:meth:`release`.
+
+        :raises ThrottledError: If the timeout expired.
+        """
+        start = time.time()
+        bucket = self.buckets.get(endpoint_class)
+        if bucket is not None and not bucket.acquire(self.timeout):
+            self._throttled(endpoint_class)
+
+        limit = self.concurrency.get(endpoint_class)
+        if limit is not None:
+            timeout = self.timeout
+            if timeout is not None:
+                timeout = max(0.0, timeout - (time.time() - start))
+            if not limit.acquire(timeout):
+                self._throttled(endpoint_class)
+
+    def reserve(self, endpoint_class):
+        """Non blocking counterpart of :py:meth:`acquire`.
+
+        If a slot is free, it is taken and the returned delay is the
+        time the caller has to wait for the rate limit before sending
+        the request. Call :py:meth:`release` after the request, as with
+        :py:meth:`acquire`.
+
+        :return: The delay in seconds, or ``None`` if all the slots of
+                 the class are in use; nothing is taken in that case.
+        """
+        limit = self.concurrency.get(endpoint_class)
+        if limit is not None and not limit.try_acquire():
+            return None
+        bucket = self.buckets.get(endpoint_class)
+        return bucket.reserve() if bucket is not None else 0.0
+
+    def release(self, endpoint_class):
+        """Release the slot taken for a request of ``endpoint_class``."""
+        limit = self.concurrency.get(endpoint_class)
+        if limit is not None:
+            limit.release()
+
+    @contextlib.contextmanager
+    def limit(self, endpoint_class):
+        """Context manager that holds a slot of ``endpoint_class``."""
+        self.acquire(endpoint_class)
+        try:
+            yield
+        finally:
+            self.release(endpoint_class)
+
+    def _throttled(self, endpoint_class):
+        with self._lock:
+            self.throttled_count[endpoint_class] += 1
+        raise ThrottledError('request of class {} throttled'
+                             .format(endpoint_class))
+
+    def stats(self):
+        """Return the current state of the limits.
+
+        :return: A dictionary from endpoint class to a dictionary with
+                 the number of requests in flight (``'in_flight'``)
+                 and the number of requests that timed out
+                 (``'throttled'``).
+        """
+        ret = {}
+        with self._lock:
+            for endpoint_class, throttled in self.throttled_count.items():
+                limit = self.concurrency.get(endpoint_class)
+                ret[endpoint_class] = {
+                    'in_flight': limit.in_flight if limit else 0,
+                    'throttled': throttled,
+                }
+        return ret
@@ -0,0 +1,186 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""TLS settings shared by all the connections of a client.
+
+When ``verify`` is the path of a CA bundle, ``requests`` and
+``urllib3`` load the bundle again for every new connection. A
+:py:class:`ResumingSSLContext` is built once, with the bundle already
+loaded, and is then used for every connection of the transport. It
+also remembers the TLS session of every server, so that new
+connections resume it instead of performing a full handshake.
+"""
+
+import os
+import ssl
+import threading
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pyrundeck import fork
+from pyrundeck.transport import _checked_verify
+
+
+class _ResumingSocket(ssl.SSLSocket):
+    """Hands its TLS session back to the context when it is closed.
+
+    With TLS 1.3 the resumable session arrives after the handshake, so
+    it can only be taken from a socket that has been used.
+    """
+    def close(self):
+        key = getattr(self, '_resume_key', None)
+        if key is not None:
+            self.context._remember(key, self)
+        super(_ResumingSocket, self).close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """An ``SSLContext`` for clients that resumes the TLS sessions of
+    earlier connections to the same server.
+
+    Use :py:func:`ssl_context` to create one.
+    """
+    sslsocket_class = _ResumingSocket
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self._sessions = {}
+        self._session_lock = threading.Lock()
+        self._counts = {'handshakes': 0, 'resumed': 0}
+        fork.register(self)
+
+    def _after_fork(self):
+        self._sessions = {}
+        self._session_lock = threading.Lock()
+
+    def _remember(self, key, sock):
+        # A socket that is already closed has no session any more.
+        session = sock.session
+        with self._session_lock:
+            if session is None:
+                session = self._sessions.get(key, (None, None))[0]
+            self._sessions[key] = (session, weakref.ref(sock))
+
+    def _session(self, key):
+        with self._session_lock:
+            session, ref = self._sessions.get(key, (None, None))
+        # A connection that is still open may have received a newer
+        # session since it was remembered.
+        sock = ref() if ref is not None else None
+        if sock is not None:
+            session = sock.session or session
+        return session
+
+    def wrap_socket(self, sock, server_side=False,
+                    do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if server_side:
+            return super(ResumingSSLContext, self).wrap_socket(
+                sock, server_side, do_handshake_on_connect,
+                suppress_ragged_eofs, server_hostname, session
+            )
+        try:
+            key = (server_hostname, sock.getpeername()[1])
+        except (OSError, IndexError):
+            key = (server_hostname, None)
+        if session is None:
+            session = self._session(key)
+
+        wrapped = super(ResumingSSLContext, self).wrap_socket(
+            sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+            server_hostname, session
+        )
+        wrapped._resume_key = key
+        if do_handshake_on_connect:
+            with self._session_lock:
+                self._counts['handshakes'] += 1
+                if wrapped.session_reused:
+                    self._counts['resumed'] += 1
+            self._remember(key, wrapped)
+        return wrapped
+
+    def stats(self):
+        """Return the number of ``'handshakes'`` performed with this
+        context and how many of them ``'resumed'`` an earlier session.
+        """
+        with self._session_lock:
+            return dict(self._counts)
+
+
+class _SSLContextAdapter(HTTPAdapter):
+    """An ``HTTPAdapter`` that uses the same ``SSLContext`` for all its
+    connections.
+    """
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super(_SSLContextAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super(_SSLContextAdapter, self).init_poolmanager(*args,
+                                                               **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super(_SSLContextAdapter, self).proxy_manager_for(*args,
+                                                                **kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify,
+                                             cert=None):
+        verify = _checked_verify(self.ssl_context, verify)
+        return super(_SSLContextAdapter, self) \
+            .build_connection_pool_key_attributes(request, verify, cert)
+
+    def cert_verify(self, conn, url, verify, cert):
+        super(_SSLContextAdapter, self).cert_verify(conn, url, verify, cert)
+        if url.lower().startswith('https'):
+            _checked_verify(self.ssl_context, verify)
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+def ssl_context(cafile=None):
+    """Create a :py:class:`ResumingSSLContext` that verifies servers
+    against the CA bundle ``cafile``, or against the bundle of
+    ``requests`` if ``cafile`` is ``None``.
+
+    As with the ``verify`` argument of ``requests``, ``cafile`` may
+    also be a directory of CA certificates, named by their hash.
+    """
+    if cafile is None:
+        cafile = requests.certs.where()
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    if os.path.isdir(cafile):
+        context.load_verify_locations(capath=cafile)
+    else:
+        context.load_verify_locations(cafile=cafile)
+    return context
@@ -0,0 +1,224 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Timing of endpoint calls.
+
+A client with a :py:class:`Tracer` records a :py:class:`Span` for every
+call of an endpoint method and passes it to the hooks of the tracer
+when the call returns. The span tells where the time of the call went:
+
+``'connect'``
+    Opening new connections to the server, including the TLS
+    handshake. Zero when a pooled connection was reused.
+``'ttfb'``
+    From sending the request until the response headers arrived,
+    without the time spent connecting.
+``'download'``
+    Reading the response body.
+``'xml_parse'``
+    Building the ``lxml.etree`` tree of the response.
+``'native'``
+    Converting the tree to native objects.
+
+The network timings are recorded by the transports of
+:py:mod:`pyrundeck.transport`; other transports only get the status and
+the size of the response recorded. When a request is retried, or sent
+to another node of a cluster, the timings of all the attempts add up.
+
+:py:class:`OpenTelemetryHook` turns the spans into spans of an
+OpenTelemetry tracer.
+"""
+
+import contextlib
+import logging
+import threading
+import time
+
+
+#: The phases of an endpoint call, in the order they happen.
+PHASES = ('connect', 'ttfb', 'download', 'xml_parse', 'native')
+
+_local = threading.local()
+
+
+def current_span():
+    """Return the span of the endpoint call in progress on this thread,
+    or ``None``.
+    """
+    return getattr(_local, 'span', None)
+
+
+@contextlib.contextmanager
+def activate(span):
+    """Make ``span`` the current span of this thread for the duration
+    of the ``with`` block.
+    """
+    previous = getattr(_local, 'span', None)
+    _local.span = span
+    try:
+        yield span
+    finally:
+        _local.span = previous
+
+
+class Span(object):
+    """The record of one call of an endpoint method.
+
+    :ivar name: The name of the endpoint method.
+    :ivar path: The URL template of the endpoint, e.g.
+                ``'/api/1/job/{id}/run'``.
+    :ivar method: The HTTP method of the endpoint.
+    :ivar url: The URL of the last request sent, or ``None`` if the
+               call was answered without sending a request, e.g. from a
+               cache.
+    :ivar status: The status of the last response, or ``None``.
+    :ivar requests: The number of requests sent.
+    :ivar request_bytes: The size of the request bodies.
+    :ivar response_bytes: The size of the last response body.
+    :ivar timings: The seconds spent in each of the :py:data:`PHASES`.
+    :ivar start: The time the call started, as given by ``time.time``.
+    :ivar duration: The duration of the call in seconds.
+    :ivar error: The exception raised by the call, or ``None``.
+    """
+    def __init__(self, name, path, method):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.url = None
+        self.status = None
+        self.requests = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def add(self, phase, seconds):
+        """Add ``seconds`` to the time spent in ``phase``."""
+        self.timings[phase] += seconds
+
+    @contextlib.contextmanager
+    def timing(self, phase):
+        """Add the time taken by the ``with`` block to ``phase``."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.time() - start
+
+    def __repr__(self):
+        return '<Span {} status={} duration={}>'.format(self.name,
+                                                        self.status,
+                                                        self.duration)
+
+
+class Tracer(object):
+    """Record a :py:class:`Span` for every endpoint call of the clients
+    it is given to, and pass the finished spans to ``hooks``.
+
+    A hook is a callable that takes the span. Hooks are called on the
+    thread that made the call, so they should return quickly. An
+    exception raised by a hook is logged and otherwise ignored.
+
+    See :doc:`usage` for examples.
+
+    :param hooks: (optional) The initial hooks. *Default value:* no
+                  hooks.
+    """
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.logger = logging.getLogger(__name__)
+
+    def add_hook(self, hook):
+        """Call ``hook`` with every finished span."""
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def span(self, endpoint):
+        """Record the span of a call of ``endpoint``, an entry of
+        :py:data:`pyrundeck.endpoints.ENDPOINTS`, made by the ``with``
+        block.
+        """
+        span = Span(endpoint['name'], endpoint['path'], endpoint['method'])
+        try:
+            with activate(span):
+                yield span
+        except Exception as ex:
+            span.error = ex
+            raise
+        finally:
+            span.duration = time.time() - span.start
+            for hook in self.hooks:
+                try:
+                    hook(span)
+                except Exception:
+                    self.logger.exception('tracing hook {!r} failed'
+                                          .format(hook))
+
+
+class OpenTelemetryHook(object):
+    """A :py:class:`Tracer` hook that ends an OpenTelemetry span for
+    every span of the client.
+
+    ``tracer`` is an OpenTelemetry tracer, e.g. the result of
+    ``opentelemetry.trace.get_tracer(__name__)``, or any object with a
+    compatible ``start_span(name, start_time=..., attributes=...)``
+    method. Its spans are named ``'rundeck <name>'`` and carry the
+    HTTP method, URL template, status and body sizes under the
+    OpenTelemetry semantic convention names, and the timings in
+    milliseconds as ``rundeck.<phase>_ms``.
+
+    :param tracer: The OpenTelemetry tracer.
+    """
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def __call__(self, span):
+        attributes = {
+            'http.request.method': span.method,
+            'url.template': span.path,
+            'http.request.body.size': span.request_bytes,
+            'http.response.body.size': span.response_bytes,
+            'rundeck.requests': span.requests,
+        }
+        if span.status is not None:
+            attributes['http.response.status_code'] = span.status
+        for phase in PHASES:
+            attributes['rundeck.{}_ms'.format(phase)] = \
+                span.timings[phase] * 1000
+        start = int(span.start * 1e9)
+        otel_span = self.tracer.start_span('rundeck {}'.format(span.name),
+                                           start_time=start,
+                                           attributes=attributes)
+        if span.error is not None:
+            otel_span.record_exception(span.error)
+        otel_span.end(end_time=start + int(span.duration * 1e9))
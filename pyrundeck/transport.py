@@ -0,0 +1,510 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Transports that send the HTTP requests of the client.
+
+:py:class:`pyrundeck.api.RundeckApiClient` hands every request to a
+transport, which returns a response with ``status_code``, ``content``,
+``text`` and ``headers`` attributes. The arguments of a request are
+those of ``requests.request``: ``params``, ``data``, ``files``,
+``headers``, ``verify`` and ``timeout``, plus whatever else is in the
+``client_args`` of the client.
+
+Three transports are available:
+
+* :py:class:`RequestsTransport`, the default, sends requests through a
+  ``requests.Session`` that keeps connections open between requests.
+* :py:class:`Urllib3Transport` uses ``urllib3`` directly, skipping the
+  per request work that ``requests`` does.
+* :py:class:`MemoryTransport` answers from canned responses without
+  any network traffic, for tests and benchmarks.
+
+:py:mod:`pyrundeck.cassette` adds transports that record the exchanges
+of a client with the server to a file and answer from such a file.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+try:
+    from urllib.parse import urlencode, urlsplit
+except ImportError:
+    from urllib import urlencode
+    from urlparse import urlsplit
+
+from pyrundeck import fork
+from pyrundeck.endpoints import find_endpoint, endpoint_by_name
+from pyrundeck.helpers import _LazyModule
+from pyrundeck.tracing import current_span
+
+requests = _LazyModule('requests')
+urllib3 = _LazyModule('urllib3')
+
+
+class Response(object):
+    """A response of the :py:class:`Urllib3Transport` and the
+    :py:class:`MemoryTransport`.
+
+    :param status_code: The HTTP status of the response.
+    :param content: (optional) The body of the response, as bytes or
+                    text. *Default value:* ``b''``.
+    :param headers: (optional) A dictionary of response headers.
+                    *Default value:* ``None``.
+    """
+    def __init__(self, status_code, content=b'', headers=None):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers if headers is not None else {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+class Transport(object):
+    """The interface of the transports."""
+
+    def request(self, method, url, **kwargs):
+        """Send a request and return its response.
+
+        :param method: The HTTP method.
+        :param url: The URL of the request, without the query string.
+        :param kwargs: The arguments of the request, as for
+                       ``requests.request``.
+        :raises requests.exceptions.RequestException: If the request
+                                                      failed.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Close the open connections."""
+
+    def pool_stats(self):
+        """Return the state of the connection pools.
+
+        :return: A list with a dictionary per pool: the ``'pool'``
+                 (scheme, host and port), the ``'max'`` number of
+                 pooled connections, the connections ``'in_use'`` and
+                 ``'idle'``, and the number of connections ever
+                 ``'opened'`` and ``'requests'`` sent by the pool.
+        """
+        return []
+
+
+def _pool_stats(manager):
+    """Return :py:meth:`Transport.pool_stats` for the pools of a
+    ``urllib3.PoolManager``.
+    """
+    stats = []
+    for key in manager.pools.keys():
+        pool = manager.pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        # The queue holds an idle connection, or None, for every
+        # connection that is not in use.
+        slots = list(pool.pool.queue)
+        stats.append({
+            'pool': '{}://{}:{}'.format(pool.scheme, pool.host, pool.port),
+            'max': pool.pool.maxsize,
+            'in_use': max(0, pool.pool.maxsize - len(slots)),
+            'idle': sum(1 for conn in slots if conn is not None),
+            'opened': pool.num_connections,
+            'requests': pool.num_requests,
+        })
+    return stats
+
+
+def _timed_connect(connect):
+    def timed_connect(self):
+        span = current_span()
+        if span is None:
+            return connect(self)
+        with span.timing('connect'):
+            return connect(self)
+    return timed_connect
+
+
+_timed_pool_classes = {}
+
+
+def _timed_pools():
+    """Return the ``pool_classes_by_scheme`` of a ``urllib3.PoolManager``
+    whose connections add the time they take to connect to the current
+    :py:class:`pyrundeck.tracing.Span`.
+    """
+    if not _timed_pool_classes:
+        from urllib3.connectionpool import (HTTPConnectionPool,
+                                            HTTPSConnectionPool)
+        for scheme, pool in [('http', HTTPConnectionPool),
+                             ('https', HTTPSConnectionPool)]:
+            connection = pool.ConnectionCls
+            timed = type('Timed' + connection.__name__, (connection,),
+                         {'connect': _timed_connect(connection.connect)})
+            _timed_pool_classes[scheme] = type('Timed' + pool.__name__,
+                                               (pool,),
+                                               {'ConnectionCls': timed})
+    return dict(_timed_pool_classes)
+
+
+def _trace_response(span, start, connect, headers):
+    """Add the time to the first byte and the download time of a
+    response whose headers arrived at ``headers`` and whose body has
+    just been read to ``span``.
+
+    :param connect: The connect time of ``span`` before the request.
+    """
+    span.add('ttfb', headers - start - (span.timings['connect'] - connect))
+    span.add('download', time.time() - headers)
+
+
+@contextlib.contextmanager
+def _requests_errors():
+    """Raise the exceptions of ``urllib3`` as those of ``requests``."""
+    try:
+        yield
+    except urllib3.exceptions.NewConnectionError as ex:
+        raise requests.exceptions.ConnectionError(ex)
+    except urllib3.exceptions.ConnectTimeoutError as ex:
+        raise requests.exceptions.ConnectTimeout(ex)
+    except urllib3.exceptions.ReadTimeoutError as ex:
+        raise requests.exceptions.ReadTimeout(ex)
+    except urllib3.exceptions.SSLError as ex:
+        raise requests.exceptions.SSLError(ex)
+    except urllib3.exceptions.HTTPError as ex:
+        raise requests.exceptions.ConnectionError(ex)
+
+
+def _api_path(url):
+    """Return the path of ``url`` from ``/api/`` on, without the path
+    of the root URL of the server.
+    """
+    path = urlsplit(url).path
+    start = path.find('/api/')
+    if start > 0:
+        path = path[start:]
+    return path
+
+
+def _no_cookies():
+    """Return a cookie policy that accepts no cookies."""
+    try:
+        from http.cookiejar import DefaultCookiePolicy
+    except ImportError:
+        from cookielib import DefaultCookiePolicy
+    return DefaultCookiePolicy(allowed_domains=[])
+
+
+def _checked_verify(ssl_context, verify):
+    """Return the ``verify`` argument to use with ``ssl_context``.
+
+    The context already holds the CA certificates, so a CA bundle path
+    is replaced by ``True`` in order not to load it again.
+    """
+    if ssl_context is None:
+        return verify
+    if not verify:
+        raise ValueError('verify cannot be disabled for a transport '
+                         'with an ssl_context')
+    return True
+
+
+class RequestsTransport(Transport):
+    """Send requests through a ``requests.Session``.
+
+    Connections to the server are kept open and reused by later
+    requests. A forked child process does not reuse the connections of
+    its parent. Cookies are not kept, since the client authenticates
+    every request with its token.
+
+    :param session: (optional) The session to use. A forked child
+                    process uses a new session with the same settings
+                    instead. *Default value:* a new session.
+    :param pool_connections: (optional) The number of hosts connections
+                             are kept for. *Default value:* ``10``.
+    :param pool_maxsize: (optional) The number of connections kept per
+                         host. *Default value:* ``10``.
+    :param ssl_context: (optional) The ``SSLContext`` of all the HTTPS
+                        connections, usually created with
+                        :py:func:`pyrundeck.tls.ssl_context`. It
+                        decides which servers are trusted, so a CA
+                        bundle given as the ``verify`` argument of the
+                        requests is not used. *Default value:*
+                        ``None``.
+    """
+    def __init__(self, session=None, pool_connections=10, pool_maxsize=10,
+                 ssl_context=None):
+        self.ssl_context = ssl_context
+        self._pool_args = {'pool_connections': pool_connections,
+                           'pool_maxsize': pool_maxsize}
+        self._own_session = session is None
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(_no_cookies())
+            self._mount(session)
+        self.session = session
+        fork.register(self)
+
+    def _mount(self, session):
+        if self.ssl_context is not None:
+            from pyrundeck.tls import _SSLContextAdapter
+            https = _SSLContextAdapter(self.ssl_context, **self._pool_args)
+        else:
+            https = requests.adapters.HTTPAdapter(**self._pool_args)
+        for prefix, adapter in [
+                ('http://', requests.adapters.HTTPAdapter(**self._pool_args)),
+                ('https://', https)]:
+            adapter.poolmanager.pool_classes_by_scheme = _timed_pools()
+            session.mount(prefix, adapter)
+
+    def _after_fork(self):
+        # The pooled connections belong to the parent. Fresh adapters
+        # leave them alone, while closing them could block on a lock
+        # held by a thread of the parent.
+        if not self._own_session:
+            # The session of the caller is left untouched; the child
+            # goes on with a session of its own with the same settings.
+            session = requests.Session()
+            for name in session.__attrs__:
+                if name != 'adapters':
+                    setattr(session, name, getattr(self.session, name))
+            self.session = session
+            self._own_session = True
+        self._mount(self.session)
+
+    def request(self, method, url, **kwargs):
+        span = current_span()
+        if span is None:
+            return self.session.request(method, url, **kwargs)
+
+        # Streaming tells the arrival of the headers apart from the
+        # download of the body.
+        connect = span.timings['connect']
+        start = time.time()
+        response = self.session.request(method, url,
+                                        **dict(kwargs, stream=True))
+        headers = time.time()
+        response.content
+        _trace_response(span, start, connect, headers)
+        body = getattr(response.request, 'body', None)
+        if body is not None:
+            span.request_bytes += len(body)
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def pool_stats(self):
+        stats = []
+        for adapter in self.session.adapters.values():
+            manager = getattr(adapter, 'poolmanager', None)
+            if manager is not None:
+                stats.extend(_pool_stats(manager))
+        return stats
+
+
+class Urllib3Transport(Transport):
+    """Send requests with ``urllib3``.
+
+    Only the request arguments ``params``, ``data``, ``files``,
+    ``headers``, ``verify``, ``cert``, ``timeout`` and
+    ``allow_redirects`` are supported. Errors are raised as the
+    corresponding ``requests`` exceptions, so that e.g.
+    :py:class:`pyrundeck.retry.RetryPolicy` treats them the same way.
+
+    :param num_pools: (optional) The number of hosts connections are
+                      kept for. *Default value:* ``10``.
+    :param maxsize: (optional) The number of connections kept per host.
+                    *Default value:* ``10``.
+    :param ssl_context: (optional) The ``SSLContext`` of all the HTTPS
+                        connections, as for
+                        :py:class:`RequestsTransport`. *Default value:*
+                        ``None``.
+    """
+    _supported = frozenset(['params', 'data', 'files', 'headers', 'verify',
+                            'cert', 'timeout', 'allow_redirects'])
+
+    def __init__(self, num_pools=10, maxsize=10, ssl_context=None):
+        self.num_pools = num_pools
+        self.maxsize = maxsize
+        self.ssl_context = ssl_context
+        self._managers = {}
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def _after_fork(self):
+        self._managers = {}
+        self._lock = threading.Lock()
+
+    def _manager(self, verify, cert):
+        key = (verify, cert)
+        manager = self._managers.get(key)
+        if manager is None:
+            args = {'num_pools': self.num_pools, 'maxsize': self.maxsize}
+            if self.ssl_context is not None:
+                args['ssl_context'] = self.ssl_context
+                args['cert_reqs'] = 'CERT_REQUIRED'
+            elif verify:
+                args['cert_reqs'] = 'CERT_REQUIRED'
+                args['ca_certs'] = (verify if verify is not True
+                                    else requests.certs.where())
+            else:
+                args['cert_reqs'] = 'CERT_NONE'
+            if isinstance(cert, tuple):
+                args['cert_file'], args['key_file'] = cert
+            elif cert is not None:
+                args['cert_file'] = cert
+            manager = urllib3.PoolManager(**args)
+            manager.pool_classes_by_scheme = _timed_pools()
+            with self._lock:
+                manager = self._managers.setdefault(key, manager)
+        return manager
+
+    def request(self, method, url, params=None, data=None, files=None,
+                headers=None, verify=True, cert=None, timeout=None,
+                allow_redirects=True, **kwargs):
+        unsupported = set(kwargs) - self._supported
+        if unsupported:
+            raise ValueError('Urllib3Transport does not support {}'
+                             .format(', '.join(sorted(unsupported))))
+        headers = dict(headers or {})
+        if params:
+            url = '{}?{}'.format(url, urlencode(params, doseq=True))
+
+        body = None
+        if files:
+            fields = dict(data or {})
+            for name, f in files.items():
+                filename = os.path.basename(getattr(f, 'name', name))
+                fields[name] = (filename, f.read())
+            body, headers['Content-Type'] = \
+                urllib3.filepost.encode_multipart_formdata(fields)
+        elif data:
+            body = urlencode(data, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        if isinstance(timeout, tuple):
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        elif timeout is None:
+            timeout = urllib3.Timeout(connect=None, read=None)
+
+        manager = self._manager(_checked_verify(self.ssl_context, verify),
+                                cert)
+        span = current_span()
+        if span is not None:
+            connect = span.timings['connect']
+            start = time.time()
+        with _requests_errors():
+            response = manager.urlopen(
+                method, url, body=body, headers=headers, timeout=timeout,
+                retries=False, redirect=allow_redirects,
+                preload_content=span is None
+            )
+            if span is None:
+                return Response(response.status, response.data,
+                                response.headers)
+
+            headers_time = time.time()
+            try:
+                content = response.read()
+            finally:
+                response.release_conn()
+        _trace_response(span, start, connect, headers_time)
+        if body is not None:
+            span.request_bytes += len(body)
+        return Response(response.status, content, response.headers)
+
+    def close(self):
+        with self._lock:
+            for manager in self._managers.values():
+                manager.clear()
+            self._managers.clear()
+
+    def pool_stats(self):
+        with self._lock:
+            managers = list(self._managers.values())
+        stats = []
+        for manager in managers:
+            stats.extend(_pool_stats(manager))
+        return stats
+
+
+class MemoryTransport(Transport):
+    """Answer requests with canned responses, without any network
+    traffic.
+
+    Responses are registered per endpoint name (see
+    :py:data:`pyrundeck.endpoints.ENDPOINTS`). Requests to endpoints
+    without a response get status ``404``.
+
+    :param record: (optional) Keep every request in :py:attr:`requests`
+                   as a tuple ``(method, url, kwargs)``. *Default
+                   value:* ``False``.
+    """
+    def __init__(self, record=False):
+        self.record = record
+        self.requests = []
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, body=b'', status=200, headers=None):
+        """Register the response of an endpoint.
+
+        :param endpoint: The name of the endpoint, e.g. ``'list_jobs'``.
+        :param body: (optional) The body of the response, or a callable
+                     taking the method, the URL and the arguments of a
+                     request and returning a :py:class:`Response`.
+                     *Default value:* ``b''``.
+        :param status: (optional) The status of the response. *Default
+                       value:* ``200``.
+        :param headers: (optional) The headers of the response.
+                        *Default value:* ``None``.
+        :raises RundeckException: If there is no such endpoint.
+        """
+        endpoint_by_name(endpoint)
+        if callable(body):
+            self._responses[endpoint] = body
+        else:
+            response = Response(status, body, headers)
+            self._responses[endpoint] = lambda method, url, kwargs: response
+
+    def request(self, method, url, **kwargs):
+        if self.record:
+            with self._lock:
+                self.requests.append((method, url, kwargs))
+        respond = self._responses.get(
+            find_endpoint(method, _api_path(url))['name'])
+        if respond is None:
+            return Response(404)
+        return respond(method, url, kwargs)
@@ -42,10 +42,17 @@ like yacc and bison.
 """
 
 import logging
-from lxml import etree
+import threading
+import time
+
+from pyrundeck.helpers import _LazyModule
+
+etree = _LazyModule('lxml.etree')
 
 __author__ = "Panagiotis Koutsourakis <kutsurak@ekt.gr>"
 
+_timer = getattr(time, 'perf_counter', time.time)
+
 
 class ParseError(Exception):
     def __init__(self, *args, **kwargs):
@@ -53,6 +60,168 @@ class ParseError(Exception):
         super(ParseError, self).__init__(*args, **kwargs)
 
 
+def _text_bytes(root):
+    size = len(root.text.encode('utf-8')) if root.text else 0
+    for value in root.attrib.values():
+        size += len(value.encode('utf-8'))
+    return size
+
+
+class ParseProfile(object):
+    """The cost of parsing, per parse table entry.
+
+    Collected by :py:meth:`ParserEngine.enable_profiling`. Every entry
+    is identified by the tag it parses and its type, e.g.
+    ``('command', 'alternatives')``, and counts:
+
+    ``'calls'``
+        The calls of the callback of the entry.
+    ``'seconds'``
+        The time spent in these calls, including the entries of the
+        children of the tag.
+    ``'self_seconds'``
+        The time spent in these calls, without the entries of the
+        children of the tag.
+    ``'text_bytes'``
+        The bytes of text and attribute values of the tags parsed.
+    ``'errors'``
+        The calls that raised a :py:class:`ParseError`, e.g. because
+        the entry was tried as an alternative that did not match.
+    ``'error_seconds'``
+        The time spent in the calls that raised.
+    ``'failed_alternatives'``
+        For ``'alternatives'`` entries, the alternatives tried that
+        did not match, and in ``'failed_branches'`` the number of
+        failures and the seconds spent on each alternative, by its
+        position in ``'parse tables'``.
+
+    The entries of parse tables without a ``'tag'``, such as the start
+    symbol of :py:class:`pyrundeck.rundeck_parser.RundeckParser`, are
+    under the tag ``'*'``. The counters of all the threads parsing with
+    the engine add up.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._entries = {}
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {
+                'tag': key[0],
+                'type': key[1],
+                'calls': 0,
+                'seconds': 0.0,
+                'self_seconds': 0.0,
+                'text_bytes': 0,
+                'errors': 0,
+                'error_seconds': 0.0,
+                'failed_alternatives': 0,
+                'failed_branches': {},
+            }
+        return entry
+
+    def wrap(self, kind, callback):
+        """Return ``callback``, the callback of the ``kind`` type of
+        tag, counting its calls.
+        """
+        local = self._local
+
+        def profiled(root, parse_table):
+            # The time of the calls in progress spent in their children.
+            children = getattr(local, 'children', None)
+            if children is None:
+                children = local.children = []
+            children.append(0.0)
+            failed = False
+            start = _timer()
+            try:
+                return callback(root, parse_table)
+            except ParseError:
+                failed = True
+                raise
+            finally:
+                seconds = _timer() - start
+                in_children = children.pop()
+                if children:
+                    children[-1] += seconds
+                key = (parse_table.get('tag', '*'), kind)
+                size = _text_bytes(root)
+                with self._lock:
+                    entry = self._entry(key)
+                    entry['calls'] += 1
+                    entry['seconds'] += seconds
+                    entry['self_seconds'] += seconds - in_children
+                    entry['text_bytes'] += size
+                    if failed:
+                        entry['errors'] += 1
+                        entry['error_seconds'] += seconds
+        return profiled
+
+    def failed_alternative(self, tag, index, seconds):
+        """Count a failed attempt to parse ``tag`` with the alternative
+        at ``index``, which took ``seconds``.
+        """
+        with self._lock:
+            entry = self._entry((tag, 'alternatives'))
+            entry['failed_alternatives'] += 1
+            branch = entry['failed_branches'].setdefault(index, [0, 0.0])
+            branch[0] += 1
+            branch[1] += seconds
+
+    def reset(self):
+        """Forget the counters collected so far."""
+        with self._lock:
+            self._entries = {}
+
+    def stats(self, order='self_seconds'):
+        """Return the counters of every entry.
+
+        :param order: (optional) The counter to order the entries by,
+                      highest first. *Default value:*
+                      ``'self_seconds'``.
+        :return: A list of dictionaries with the ``'tag'`` and
+                 ``'type'`` of the entry and its counters.
+        """
+        with self._lock:
+            entries = [dict(entry,
+                            failed_branches=dict(
+                                (index, tuple(branch)) for index, branch
+                                in entry['failed_branches'].items()))
+                       for entry in self._entries.values()]
+        entries.sort(key=lambda entry: (-entry[order], entry['tag'],
+                                        entry['type']))
+        return entries
+
+    def report(self, order='self_seconds', limit=None):
+        """Return a table of the counters of the entries, the most
+        costly first.
+
+        :param order: (optional) The counter to order the entries by.
+                      *Default value:* ``'self_seconds'``.
+        :param limit: (optional) The number of entries to show.
+                      *Default value:* all of them.
+        :return: The table as a string.
+        """
+        lines = ['{:<32} {:<14} {:>8} {:>10} {:>10} {:>10} {:>7} {:>10}'
+                 .format('tag', 'type', 'calls', 'total ms', 'self ms',
+                         'text B', 'errors', 'failed alt')]
+        for entry in self.stats(order)[:limit]:
+            lines.append('{:<32} {:<14} {:>8} {:>10.3f} {:>10.3f} {:>10} '
+                         '{:>7} {:>10}'
+                         .format(entry['tag'], entry['type'], entry['calls'],
+                                 entry['seconds'] * 1000,
+                                 entry['self_seconds'] * 1000,
+                                 entry['text_bytes'], entry['errors'],
+                                 entry['failed_alternatives']))
+            for index, (failures, seconds) in sorted(
+                    entry['failed_branches'].items()):
+                lines.append('    alternative #{}: {} failures, {:.3f} ms'
+                             .format(index, failures, seconds * 1000))
+        return '\n'.join(lines)
+
+
 class ParserEngine(object):
     """This is class converts the ``lxml.etree`` representation to native
     Python objects.
@@ -118,9 +287,10 @@ class ParserEngine(object):
       tables that can be used to parse this tag.
 
     """
-    def __init__(self, log_level=logging.INFO):
-        logging.basicConfig(level=log_level, filename='pyrundeck.log')
+    def __init__(self, log_level=None):
         self.logger = logging.getLogger(__name__)
+        if log_level is not None:
+            self.logger.setLevel(log_level)
         self.callbacks = {
             'text':           self.text_tag,
             'attribute':      self.attribute_tag,
@@ -129,6 +299,47 @@ class ParserEngine(object):
             'composite':      self.composite_tag,
             'alternatives':   self.alternatives_tag
         }
+        #: The :py:class:`ParseProfile` collecting the cost of parsing,
+        #: or ``None`` when profiling is disabled.
+        self.profile = None
+        self._callbacks = self.callbacks
+
+    def enable_profiling(self, profile=None):
+        """Count the calls and the time of every parse table entry in
+        ``profile``.
+
+        Profiling replaces the callbacks of the engine with counting
+        ones; without it parsing costs nothing extra.
+
+        :param profile: (optional) The :py:class:`ParseProfile` to add
+                        the counters to. *Default value:* the profile
+                        already enabled, or a new one.
+        :return: The profile.
+        """
+        if profile is None:
+            profile = self.profile or ParseProfile()
+        self.profile = profile
+        self.callbacks = dict((kind, profile.wrap(kind, callback))
+                              for kind, callback in self._callbacks.items())
+        return profile
+
+    def disable_profiling(self):
+        """Stop profiling.
+
+        :return: The :py:class:`ParseProfile` that was enabled, or
+                 ``None``.
+        """
+        profile = self.profile
+        self.callbacks = self._callbacks
+        self.profile = None
+        return profile
+
+    def _log_parsing(self, kind, root, parse_table):
+        # Serializing the tree costs more than parsing it.
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("{} tag, parsing:\n{}\nWith parse table:\n{}"
+                              .format(kind, etree.tostring(root).decode(),
+                                      parse_table))
 
     def text_tag(self, root, parse_table):
         """Parse a tag containing only text.
@@ -149,9 +360,7 @@ class ParserEngine(object):
 
         :return: The text of the tag.
         """
-        self.logger.debug("text tag, parsing:\n{}\nWith parse table:\n{}"
-                          .format(etree.tostring(root).decode(),
-                                  parse_table))
+        self._log_parsing('text', root, parse_table)
         self.check_root_tag(root.tag, parse_table['tag'])
 
         if len(root) != 0:
@@ -191,9 +400,7 @@ class ParserEngine(object):
 
         :return: A dictionary containing key value pairs for all the attributes
         """
-        self.logger.debug("attribute tag, parsing:\n{}\nWith parse table\n{}"
-                          .format(etree.tostring(root).decode(),
-                                  parse_table))
+        self._log_parsing('attribute', root, parse_table)
         self.check_root_tag(root.tag, parse_table['tag'])
 
         if len(root) != 0:
@@ -206,7 +413,7 @@ class ParserEngine(object):
                    '({}.text = "{}")'.format(root.tag, root.tag, root.text))
             raise ParseError(msg)
 
-        return root.attrib
+        return dict(root.attrib)
 
     def attribute_text_tag(self, root, parse_table):
         """Parse a tag with attributes and text.
@@ -240,9 +447,7 @@ class ParserEngine(object):
                  table for this tag.
 
         """
-        self.logger.debug("attribute text tag, parsing:\n{}\nWith parse table\n{}"
-                          .format(etree.tostring(root).decode(),
-                                  parse_table))
+        self._log_parsing('attribute text', root, parse_table)
         self.check_root_tag(root.tag, parse_table['tag'])
 
         if len(root) != 0:
@@ -250,7 +455,7 @@ class ParserEngine(object):
                    '(number of children = {})'.format(root.tag, len(root)))
             raise ParseError(msg)
 
-        ret = root.attrib
+        ret = dict(root.attrib)
 
         text_tag = parse_table['text tag']
         ret.update({text_tag: root.text})
@@ -291,9 +496,7 @@ class ParserEngine(object):
         :param parse_table: The parse table for this element.
         :return: A list of elements specified by the parse table.
         """
-        self.logger.debug("list tag, parsing:\n{}\nWith parse table\n{}"
-                          .format(etree.tostring(root).decode(),
-                                  parse_table))
+        self._log_parsing('list', root, parse_table)
         self.check_root_tag(root.tag, parse_table['tag'])
 
         element_pt = parse_table['element parse table']
@@ -404,9 +607,7 @@ class ParserEngine(object):
 
         :return: A dictionary representing the XML object.
         """
-        self.logger.debug("composite tag, parsing:\n{}\nWith parse table\n{}"
-                          .format(etree.tostring(root).decode(),
-                                  parse_table))
+        self._log_parsing('composite', root, parse_table)
         self.check_root_tag(root.tag, parse_table['tag'])
 
         # pt = parse_table[root.tag]['components']
@@ -478,12 +679,13 @@ class ParserEngine(object):
 
            {'attribute': 'value'}
         """
-        self.logger.debug("alternatives tag, parsing:\n{}\nWith parse table\n{}"
-                          .format(etree.tostring(root).decode(),
-                                  parse_table))
+        self._log_parsing('alternatives', root, parse_table)
         possible_pts = parse_table.get('parse tables', [])
+        profile = self.profile
         ret = None
-        for pt in possible_pts:
+        for index, pt in enumerate(possible_pts):
+            if profile is not None:
+                start = _timer()
             try:
                 if 'tag' in parse_table:
                     pt['tag'] = parse_table['tag']
@@ -491,7 +693,12 @@ class ParserEngine(object):
                 ret = callback(root, pt)
                 break  # Break on the first successful parse
             except ParseError as ex:
-                self.logger.debug("{}: {}".format(pt.get('tag'), ex))
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("{}: {}".format(pt.get('tag'), ex))
+                if profile is not None:
+                    profile.failed_alternative(
+                        parse_table.get('tag', '*'), index,
+                        _timer() - start)
                 ret = None
 
         if ret is None:
@@ -22,7 +22,8 @@ setup(
         'Programming Language :: Python :: 3.4',
     ],
     keywords='rest api client rundeck',
-    packages=find_packages(exclude=['tests', '*_virtualenv', 'doc']),
+    packages=find_packages(exclude=['tests', '*_virtualenv', 'doc',
+                                    'benchmarks']),
     install_requires=[
         'lxml>=3.4.4',
         'requests>=2.7.0',
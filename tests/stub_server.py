@@ -0,0 +1,157 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""A minimal HTTP server that stands in for Rundeck in tests that need
+real network round trips.
+"""
+
+import ssl
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+
+SYSTEM_INFO_TEMPLATE = """<result success="true" apiversion="13">
+<success><message>System Stats for RunDeck 2.5.1 on node stub</message></success>
+<system>
+<timestamp epoch="1437474661504" unit="ms"><datetime>2015-07-21T10:31:01Z</datetime></timestamp>
+<rundeck>
+<version>2.5.1-1</version><build>2.5.1-1</build><node>stub</node>
+<base>/var/lib/rundeck</base><apiversion>13</apiversion>
+<serverUUID>{server_uuid}</serverUUID>
+</rundeck>
+<os><arch>amd64</arch><name>Linux</name><version>3.13.0</version></os>
+<jvm><name>OpenJDK 64-Bit Server VM</name><vendor>Oracle Corporation</vendor>
+<version>1.7.0_79</version><implementationVersion>24.79-b02</implementationVersion></jvm>
+<stats>
+<uptime duration="1000" unit="ms"><since epoch="1437474660504" unit="ms"><datetime>2015-07-21T10:31:00Z</datetime></since></uptime>
+<cpu><loadAverage unit="percent">{load}</loadAverage><processors>{processors}</processors></cpu>
+<memory unit="byte"><max>{memory_max}</max><free>{memory_free}</free><total>{memory_max}</total></memory>
+<scheduler><running>0</running></scheduler>
+<threads><active>{active_threads}</active></threads>
+</stats>
+<metrics href="http://stub/metrics/metrics?pretty=true" contentType="text/json"/>
+<threadDump href="http://stub/metrics/threads" contentType="text/plain"/>
+</system>
+</result>"""
+
+
+def system_info_xml(load=0.0, processors=2, memory_max=1000000,
+                    memory_free=500000, active_threads=10,
+                    server_uuid='00000000-0000-0000-0000-000000000000'):
+    """Build a ``system_info`` response with the given statistics."""
+    return SYSTEM_INFO_TEMPLATE.format(
+        load=load, processors=processors, memory_max=memory_max,
+        memory_free=memory_free, active_threads=active_threads,
+        server_uuid=server_uuid
+    )
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StubServer(object):
+    """Serve requests on a local port with a user supplied function.
+
+    ``handle(method, path, body)`` is called in the thread serving the
+    request and should return a pair ``(status, body)``, where the body
+    is text or UTF-8 encoded bytes.
+
+    With a ``certfile`` and a ``keyfile`` the server speaks HTTPS, as
+    ``localhost``. With ``keep_alive`` connections are kept open
+    between requests. The server listens on ``port``, by default a free
+    one.
+
+    The server is started when used as a context manager and its URL
+    is available as ``url``.
+    """
+    def __init__(self, handle, certfile=None, keyfile=None,
+                 keep_alive=False, port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True
+            if keep_alive:
+                protocol_version = 'HTTP/1.1'
+
+            def _serve(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, text = stub.handle(self.command, self.path, body)
+                data = (text if isinstance(text, bytes)
+                        else text.encode('utf-8'))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/xml')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.handle = handle
+        self.server = _ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        if certfile is None:
+            self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        else:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket,
+                                                     server_side=True)
+            self.url = 'https://localhost:{}'.format(self.server.server_port)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
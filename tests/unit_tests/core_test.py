@@ -36,6 +36,8 @@ try:
 except ImportError:
     from mock import patch
 
+from os import path
+
 from lxml import etree
 import nose.tools as nt
 
@@ -144,7 +146,7 @@ class TestCoreRundeckAPIClient:
         res3 = self.client.delete('foo')
         nt.assert_equal(res3, ret)
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_perform_request_called_correctly_for_get_method(self,
                                                              mock_request):
         url = 'https://rundeck.example.com/api/13/test_endpoint'
@@ -161,7 +163,7 @@ class TestCoreRundeckAPIClient:
                                         'PyRundeck v ' + __version__},
                                        headers)
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_perform_requests_called_correctly_for_post_method(self,
                                                                mock_request):
         url = 'https://rundeck.example.com/api/13/test_endpoint'
@@ -183,7 +185,7 @@ class TestCoreRundeckAPIClient:
         data = args[1]['data']
         nt.assert_dict_contains_subset({'xmlBatch': '123\n456'}, data)
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_perform_request_returns_correctly_for_get_method(self, mock_get):
         mock_get.return_value = self.resp
 
@@ -194,7 +196,7 @@ class TestCoreRundeckAPIClient:
                         etree.tostring(data,
                                        pretty_print=True).decode('utf-8'))
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_perform_request_calls_request_correctly_with_https(self,
                                                                 mock_request):
         mock_request.return_value = self.resp
@@ -207,7 +209,8 @@ class TestCoreRundeckAPIClient:
         args, kwargs = mock_request.call_args
         nt.assert_dict_contains_subset({'verify': True}, kwargs)
 
-        path_to_pem = '/path/to/pem/file'
+        path_to_pem = path.join(config.rundeck_test_data_dir,
+                                'stub_server.pem')
         other_client = RundeckApiClient(self.token, https_url,
                                         pem_file_path=path_to_pem)
         other_client._perform_request(https_url)
@@ -215,7 +218,7 @@ class TestCoreRundeckAPIClient:
 
         nt.assert_dict_contains_subset({'verify': path_to_pem}, kwargs)
 
-    @patch('requests.request')
+    @patch('requests.Session.request')
     def test_perform_request_returns_correctly_on_empty_response(self,
                                                                  mock_request):
         class Object:
@@ -0,0 +1,200 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+
+import nose.tools as nt
+from lxml import etree
+
+from pyrundeck import (RundeckApiClient, AdaptiveConcurrency,
+                       MemoryTransport, RefreshingCache, RequestScheduler)
+from pyrundeck.rundeck_parser import parse
+from pyrundeck.transport import Response
+from tests.stub_server import StubServer, system_info_xml
+
+
+JOBS_XML = ('<result success="true" apiversion="13">'
+            '<jobs count="0"></jobs>'
+            '</result>')
+
+
+class TestAdaptiveConcurrency(object):
+    def setup(self):
+        self.controller = AdaptiveConcurrency(initial_limit=2, max_limit=4,
+                                              sample_interval=None)
+
+    def test_limit_grows_while_latency_is_stable(self):
+        for _ in range(20):
+            in_flight = self.controller.stats()['limit']
+            for _ in range(in_flight):
+                self.controller.acquire()
+            for _ in range(in_flight):
+                self.controller.release(0.01)
+
+        nt.assert_equal(4, self.controller.stats()['limit'])
+
+    def test_limit_shrinks_on_failure(self):
+        self.controller.limit = 4.0
+        self.controller.acquire()
+        self.controller.release(0.01, failed=True)
+
+        nt.assert_equal(2, self.controller.stats()['limit'])
+        nt.assert_equal(1, self.controller.stats()['decreases'])
+
+    def test_limit_shrinks_when_latency_grows(self):
+        self.controller.limit = 4.0
+        self.controller.acquire()
+        self.controller.release(0.01)
+        for _ in range(10):
+            self.controller.acquire()
+            self.controller.release(1.0)
+
+        nt.assert_true(self.controller.stats()['limit'] < 4)
+
+    def test_limit_never_drops_below_minimum(self):
+        for _ in range(10):
+            self.controller._last_decrease = 0
+            self.controller.acquire()
+            self.controller.release(0.01, failed=True)
+
+        nt.assert_equal(1, self.controller.stats()['limit'])
+
+    def test_system_info_load_is_observed(self):
+        busy = parse(etree.fromstring(system_info_xml(load=7.5,
+                                                      processors=4)))
+        idle = parse(etree.fromstring(system_info_xml(load=0.5,
+                                                      processors=4)))
+
+        self.controller.observe_system_info(busy)
+        nt.assert_true(self.controller.server_overloaded)
+        nt.assert_almost_equal(7.5 / 4,
+                               self.controller.server_load
+                               ['load_per_processor'])
+
+        self.controller.observe_system_info(idle)
+        nt.assert_false(self.controller.server_overloaded)
+
+    def test_low_memory_is_overload(self):
+        info = parse(etree.fromstring(system_info_xml(memory_max=1000,
+                                                      memory_free=10)))
+        self.controller.observe_system_info(info)
+        nt.assert_true(self.controller.server_overloaded)
+
+    def test_samples_skip_caches_and_share_one_thread(self):
+        controller = AdaptiveConcurrency(sample_interval=0)
+        transport = MemoryTransport(record=True)
+        transport.add('list_jobs', JOBS_XML)
+        loads = iter(range(1, 100))
+        transport.add('system_info', lambda method, url, kwargs: Response(
+            200, system_info_xml(load=next(loads), processors=1)))
+        cache = RefreshingCache({'system_info': {'soft_ttl': 600,
+                                                 'hard_ttl': 600}})
+        client = RundeckApiClient('mock_token', 'http://rundeck',
+                                  adaptive_concurrency=controller,
+                                  refresh_cache=cache,
+                                  scheduler=RequestScheduler(workers=1),
+                                  transport=transport)
+
+        def sampled(load):
+            deadline = time.time() + 5
+            while controller.stats()['server_load'].get(
+                    'load_per_processor') != load and time.time() < deadline:
+                time.sleep(0.01)
+            return controller.stats()['server_load']['load_per_processor']
+
+        # Cached with load 1, the sample that follows gets load 2.
+        client.system_info()
+        nt.assert_equal(2.0, sampled(2.0))
+        for load in (3.0, 4.0, 5.0):
+            client.list_jobs(native=False)
+            nt.assert_equal(load, sampled(load))
+
+        samplers = [t for t in threading.enumerate()
+                    if t.name == 'pyrundeck-sampler']
+        nt.assert_equal([controller._sampler], samplers)
+
+
+class TestAdaptiveConcurrencySimulation(object):
+    """Drive a client against a stub server whose latency grows once
+    more than ``capacity`` requests are in flight.
+    """
+    capacity = 4
+    base_latency = 0.01
+
+    def setup(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.samples = 0
+
+    def handle(self, method, path, body):
+        if path.startswith('/api/1/system/info'):
+            with self.lock:
+                self.samples += 1
+                load = self.in_flight
+            return 200, system_info_xml(load=load, processors=self.capacity)
+
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            excess = max(0, self.in_flight - self.capacity)
+        time.sleep(self.base_latency * (1 + excess))
+        with self.lock:
+            self.in_flight -= 1
+        return 200, JOBS_XML
+
+    def test_controller_keeps_load_near_capacity(self):
+        controller = AdaptiveConcurrency(initial_limit=2, max_limit=32,
+                                         sample_interval=0.05)
+        workers = 16
+
+        with StubServer(self.handle) as server:
+            client = RundeckApiClient('mock_token', server.url,
+                                      adaptive_concurrency=controller)
+
+            def work():
+                for _ in range(15):
+                    client.list_jobs(native=False)
+
+            threads = [threading.Thread(target=work) for _ in range(workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        stats = controller.stats()
+        nt.assert_true(self.samples > 0)
+        nt.assert_true(stats['decreases'] > 0)
+        nt.assert_true(stats['limit'] <= 2 * self.capacity)
+        # Without the controller all the workers would be in flight
+        nt.assert_true(self.max_in_flight < workers)
@@ -0,0 +1,472 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import nose.tools as nt
+from lxml import etree
+
+from pyrundeck import (RundeckApiClient, ExecutionCache, ParseMemo,
+                       RefreshingCache)
+from pyrundeck.cache import LRUCache, is_terminal
+from pyrundeck.rundeck_parser import parse
+
+
+def execution_xml(execution_id, status, ended=True):
+    date_ended = ('<date-ended unixtime="1432809844967">'
+                  '2015-05-28T10:44:04Z</date-ended>' if ended else '')
+    return ('<execution id="{}" status="{}" project="API_client_development">'
+            '<user>admin</user>'
+            '<date-started unixtime="1432809844290">2015-05-28T10:44:04Z'
+            '</date-started>'
+            '{}'
+            '<description>echo "Hello"</description>'
+            '</execution>'.format(execution_id, status, date_ended))
+
+
+def result_xml(*executions):
+    return etree.fromstring(
+        '<result success="true" apiversion="13">'
+        '<executions count="{}">{}</executions>'
+        '</result>'.format(len(executions), ''.join(executions))
+    )
+
+
+class TestLRUCache(object):
+    def test_least_recently_used_entry_is_evicted(self):
+        evicted = []
+        cache = LRUCache(2, on_evict=lambda k, v: evicted.append(k))
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        nt.assert_equal(['b'], evicted)
+        nt.assert_equal(1, cache.get('a'))
+        nt.assert_is_none(cache.get('b'))
+        nt.assert_equal(2, cache.hits)
+        nt.assert_equal(1, cache.misses)
+
+    def test_setdefault_keeps_the_cached_value(self):
+        evicted = []
+        cache = LRUCache(1, on_evict=lambda k, v: evicted.append(k))
+
+        nt.assert_equal(1, cache.setdefault('a', 1))
+        nt.assert_equal(1, cache.setdefault('a', 2))
+        nt.assert_equal(3, cache.setdefault('b', 3))
+
+        nt.assert_equal(['a'], evicted)
+        nt.assert_equal(['b'], cache.keys())
+
+
+class TestExecutionCache(object):
+    def setup(self):
+        self.root_url = 'http://www.example.com'
+        self.cache = ExecutionCache(max_entries=2)
+        self.client = RundeckApiClient('mock_token', self.root_url,
+                                       execution_cache=self.cache)
+
+    def test_terminal_executions(self):
+        nt.assert_true(is_terminal({'status': 'failed', 'date-ended': {}}))
+        nt.assert_false(is_terminal({'status': 'running'}))
+        nt.assert_false(is_terminal({'status': 'succeeded'}))
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_finished_executions_are_fetched_once(self, mock_get):
+        mock_get.return_value = (200,
+                                 result_xml(execution_xml(53, 'succeeded')))
+
+        status, first = self.client.execution_info(id=53)
+        status, second = self.client.execution_info(id=53)
+
+        nt.assert_equal(1, mock_get.call_count)
+        nt.assert_equal(200, status)
+        nt.assert_equal(first, second)
+        nt.assert_equal('53', second['executions']['list'][0]['id'])
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_running_executions_are_not_cached(self, mock_get):
+        mock_get.return_value = (200, result_xml(
+            execution_xml(54, 'running', ended=False)
+        ))
+
+        self.client.execution_info(id=54)
+        self.client.execution_info(id=54)
+
+        nt.assert_equal(2, mock_get.call_count)
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_cached_results_are_copies(self, mock_get):
+        mock_get.return_value = (200,
+                                 result_xml(execution_xml(53, 'aborted')))
+
+        _, first = self.client.execution_info(id=53)
+        first['executions']['list'][0]['status'] = 'mangled'
+        _, second = self.client.execution_info(id=53)
+
+        nt.assert_equal('aborted', second['executions']['list'][0]['status'])
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_history_scans_fill_the_cache(self, mock_get):
+        mock_get.return_value = (200, result_xml(
+            execution_xml(53, 'succeeded'),
+            execution_xml(54, 'running', ended=False)
+        ))
+        self.client.job_executions_info(id='job')
+
+        status, result = self.client.execution_info(id=53)
+
+        nt.assert_equal(1, mock_get.call_count)
+        nt.assert_equal(1, result['executions']['count'])
+        nt.assert_equal('13', result['apiversion'])
+        nt.assert_is_none(self.cache.get(54))
+
+    def test_evicted_executions_are_spilled_to_disk(self):
+        spill_dir = tempfile.mkdtemp()
+        try:
+            cache = ExecutionCache(max_entries=1,
+                                   spill_dir=os.path.join(spill_dir, 'x'))
+            client = RundeckApiClient('mock_token', self.root_url,
+                                      execution_cache=cache)
+            with patch('pyrundeck.RundeckApiClient.get') as mock_get:
+                mock_get.return_value = (200, result_xml(
+                    execution_xml(53, 'succeeded'),
+                    execution_xml(52, 'failed')
+                ))
+                client.job_executions_info(id='job')
+
+                _, result = client.execution_info(id=53)
+
+                nt.assert_equal(1, mock_get.call_count)
+            nt.assert_equal('succeeded',
+                            result['executions']['list'][0]['status'])
+            nt.assert_equal(1, cache.stats()['spill_hits'])
+        finally:
+            shutil.rmtree(spill_dir)
+
+    def test_spill_failures_do_not_break_calls(self):
+        spill_dir = tempfile.mkdtemp()
+        try:
+            cache = ExecutionCache(max_entries=1, spill_dir=spill_dir)
+            client = RundeckApiClient('mock_token', self.root_url,
+                                      execution_cache=cache)
+            with patch('pyrundeck.RundeckApiClient.get') as mock_get, \
+                    patch('tempfile.mkstemp') as mock_mkstemp:
+                mock_mkstemp.side_effect = OSError(28, 'No space left')
+                mock_get.return_value = (200, result_xml(
+                    execution_xml(53, 'succeeded'),
+                    execution_xml(52, 'failed')
+                ))
+
+                status, result = client.job_executions_info(id='job')
+
+            nt.assert_equal(200, status)
+            nt.assert_equal(2, result['executions']['count'])
+            nt.assert_equal(1, cache.stats()['spill_errors'])
+            nt.assert_equal([], os.listdir(spill_dir))
+        finally:
+            shutil.rmtree(spill_dir)
+
+    def test_oldest_spilled_executions_are_deleted(self):
+        spill_dir = tempfile.mkdtemp()
+        try:
+            cache = ExecutionCache(max_entries=1, spill_dir=spill_dir,
+                                   max_spilled=2)
+            for i in range(5):
+                cache.store(parse(result_xml(execution_xml(i, 'failed'))))
+
+            nt.assert_equal(['2.json', '3.json'],
+                            sorted(os.listdir(spill_dir)))
+            nt.assert_equal(2, cache.stats()['spilled'])
+            nt.assert_is_none(cache.get(1))
+            nt.assert_equal('3', cache.get(3)['executions']['list'][0]['id'])
+
+            reopened = ExecutionCache(max_entries=1, spill_dir=spill_dir,
+                                      max_spilled=2)
+            nt.assert_equal(2, reopened.stats()['spilled'])
+        finally:
+            shutil.rmtree(spill_dir)
+
+
+class Response(object):
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+class TestParseMemo(object):
+    def setup(self):
+        self.memo = ParseMemo(max_entries=2)
+        self.client = RundeckApiClient('mock_token', 'http://www.example.com',
+                                       parse_memo=self.memo)
+        self.body = etree.tostring(result_xml(
+            execution_xml(54, 'running', ended=False)
+        )).decode('utf-8')
+
+    @patch('requests.Session.request')
+    def test_identical_bodies_are_parsed_once(self, mock_request):
+        mock_request.side_effect = lambda *a, **kw: Response(self.body)
+
+        with patch('pyrundeck.cache.parse',
+                   wraps=parse) as mock_parse:
+            _, first = self.client.running_executions()
+            _, second = self.client.running_executions()
+
+        nt.assert_equal(1, mock_parse.call_count)
+        nt.assert_true(first is second)
+        nt.assert_equal({'entries': 1, 'hits': 1, 'misses': 1,
+                         'native_hits': 1}, self.memo.stats())
+
+    @patch('requests.Session.request')
+    def test_different_bodies_are_parsed(self, mock_request):
+        other = etree.tostring(result_xml(
+            execution_xml(55, 'running', ended=False)
+        )).decode('utf-8')
+        mock_request.side_effect = [Response(self.body), Response(other)]
+
+        _, first = self.client.running_executions()
+        _, second = self.client.running_executions()
+
+        nt.assert_equal('54', first['executions']['list'][0]['id'])
+        nt.assert_equal('55', second['executions']['list'][0]['id'])
+
+    @patch('requests.Session.request')
+    def test_xml_results_share_the_tree(self, mock_request):
+        mock_request.side_effect = lambda *a, **kw: Response(self.body)
+
+        _, first = self.client.running_executions(native=False)
+        _, second = self.client.running_executions(native=False)
+
+        nt.assert_true(first is second)
+
+    def test_foreign_trees_are_parsed(self):
+        tree = result_xml(execution_xml(56, 'running', ended=False))
+        nt.assert_equal('56',
+                        self.memo.native(tree)['executions']['list'][0]['id'])
+
+    def test_evicted_bodies_are_forgotten(self):
+        trees = [self.memo.tree('<a n="{}"/>'.format(i).encode('utf-8'))
+                 for i in range(3)]
+        nt.assert_equal(2, self.memo.stats()['entries'])
+        nt.assert_false(trees[0] is
+                        self.memo.tree('<a n="0"/>'.encode('utf-8')))
+
+
+    def test_concurrent_misses_keep_the_bound(self):
+        memo = ParseMemo(max_entries=4)
+        bodies = [etree.tostring(result_xml(execution_xml(i, 'running',
+                                                          ended=False)))
+                  for i in range(200)]
+
+        def parse_all():
+            for body in bodies:
+                memo.native(memo.tree(body))
+
+        threads = [threading.Thread(target=parse_all) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        nt.assert_less_equal(len(memo._entries), 4)
+        nt.assert_less_equal(len(memo._by_tree), 4)
+
+class TestRefreshingCache(object):
+    def setup(self):
+        self.cache = RefreshingCache({
+            'system_info': {'soft_ttl': 10, 'hard_ttl': 100},
+        })
+        self.client = RundeckApiClient('mock_token', 'http://www.example.com',
+                                       refresh_cache=self.cache)
+        self.trees = [etree.fromstring('<result n="{}"/>'.format(i))
+                      for i in range(3)]
+
+    def wait_for(self, key, value):
+        for _ in range(500):
+            if self.cache.stats()['system_info'][key] == value:
+                return
+            time.sleep(0.01)
+        raise AssertionError('{} never reached {}'.format(key, value))
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_fresh_results_are_served_from_cache(self, mock_get, mock_time):
+        mock_time.return_value = 1000.0
+        mock_get.side_effect = [(200, t) for t in self.trees]
+
+        first = self.client.system_info(native=False)
+        mock_time.return_value = 1005.0
+        second = self.client.system_info(native=False)
+
+        nt.assert_equal(1, mock_get.call_count)
+        nt.assert_true(first[1] is second[1])
+        nt.assert_equal(1, self.cache.stats()['system_info']['hits'])
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_stale_results_are_refreshed_in_background(self, mock_get,
+                                                       mock_time):
+        mock_time.return_value = 1000.0
+        mock_get.side_effect = [(200, t) for t in self.trees]
+        self.client.system_info(native=False)
+
+        mock_time.return_value = 1050.0
+        _, stale = self.client.system_info(native=False)
+        nt.assert_true(stale is self.trees[0])
+        self.wait_for('refreshes', 1)
+
+        _, fresh = self.client.system_info(native=False)
+        nt.assert_true(fresh is self.trees[1])
+        nt.assert_equal(2, mock_get.call_count)
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_expired_results_are_fetched(self, mock_get, mock_time):
+        mock_time.return_value = 1000.0
+        mock_get.side_effect = [(200, t) for t in self.trees]
+        self.client.system_info(native=False)
+
+        mock_time.return_value = 1200.0
+        _, result = self.client.system_info(native=False)
+
+        nt.assert_true(result is self.trees[1])
+        nt.assert_equal(2, self.cache.stats()['system_info']['misses'])
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_refresh_errors_keep_old_result(self, mock_get, mock_time):
+        mock_time.return_value = 1000.0
+        mock_get.side_effect = [(200, self.trees[0]), (503, None)]
+        self.client.system_info(native=False)
+
+        mock_time.return_value = 1050.0
+        self.client.system_info(native=False)
+        self.wait_for('refresh_errors', 1)
+
+        _, result = self.client.system_info(native=False)
+        nt.assert_true(result is self.trees[0])
+        nt.assert_equal((1050.0, 'status 503'),
+                        self.cache.stats()['system_info']['last_error'])
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_failed_refreshes_back_off(self, mock_get, mock_time):
+        mock_time.return_value = 1000.0
+        mock_get.side_effect = [(200, self.trees[0])] + [(503, None)] * 3
+        self.client.system_info(native=False)
+
+        # Soft TTL 10 s: retried 10 s after the first failure, 20 s
+        # after the second.
+        for now, errors in ((1050.0, 1), (1055.0, 1), (1060.0, 2),
+                            (1075.0, 2), (1080.0, 3)):
+            mock_time.return_value = now
+            _, result = self.client.system_info(native=False)
+            self.wait_for('refresh_errors', errors)
+            nt.assert_true(result is self.trees[0])
+
+        nt.assert_equal(4, mock_get.call_count)
+
+    def test_concurrent_misses_share_one_call(self):
+        release = threading.Event()
+        calls = []
+
+        def get(*args, **kwargs):
+            calls.append(args)
+            release.wait(5)
+            return 200, self.trees[0]
+
+        results = []
+        with patch('pyrundeck.RundeckApiClient.get', side_effect=get):
+            threads = [threading.Thread(target=lambda: results.append(
+                self.client.system_info(native=False)))
+                for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            self.wait_for('misses', 5)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        nt.assert_equal(1, len(calls))
+        nt.assert_equal(5, len(results))
+        nt.assert_true(all(r[1] is self.trees[0] for r in results))
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_number_of_results_is_bounded(self, mock_get):
+        mock_get.return_value = (200, self.trees[0])
+        cache = RefreshingCache({'system_info': {'soft_ttl': 10,
+                                                 'hard_ttl': 100}},
+                                max_entries=2)
+        shared = RundeckApiClient('mock_token', 'http://www.example.com',
+                                  refresh_cache=cache)
+        for token in ('a', 'b', 'c'):
+            client = shared.for_token(token)
+            for node in range(3):
+                client.system_info(native=False, node=node)
+
+        nt.assert_equal(2, len(cache._entries))
+        client.system_info(native=False, node=2)
+        nt.assert_equal(9, mock_get.call_count)
+        shared.for_token('a').system_info(native=False, node=0)
+        nt.assert_equal(10, mock_get.call_count)
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_expired_results_are_dropped(self, mock_get, mock_time):
+        mock_time.return_value = 1000.0
+        mock_get.side_effect = [(200, self.trees[0]), (503, None)]
+        self.client.system_info(native=False)
+
+        mock_time.return_value = 1200.0
+        status, _ = self.client.system_info(native=False)
+
+        nt.assert_equal(503, status)
+        nt.assert_equal(0, len(self.cache._entries))
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_other_endpoints_are_not_cached(self, mock_get):
+        mock_get.return_value = (200, self.trees[0])
+
+        self.client.list_jobs(native=False)
+        self.client.list_jobs(native=False)
+
+        nt.assert_equal(2, mock_get.call_count)
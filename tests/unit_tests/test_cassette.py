@@ -0,0 +1,213 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import nose.tools as nt
+from nose.tools import raises
+import requests
+
+from pyrundeck import (RundeckApiClient, MemoryTransport, RecordingTransport,
+                       ReplayTransport)
+from pyrundeck.cassette import load, replay
+from pyrundeck.transport import Response
+from tests import config
+
+
+JOBS_XML = ('<result success="true" apiversion="13"><jobs count="1">'
+            '<job id="1"><name>{}</name><group/><project>p</project>'
+            '<description/></job></jobs></result>')
+
+
+class TestCassette(object):
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cassette.jsonl.gz')
+        self.names = iter('abc')
+        self.server = MemoryTransport(record=True)
+        self.server.add('list_jobs', lambda method, url, kwargs:
+                        Response(200, JOBS_XML.format(next(self.names))))
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def record(self, *calls, **kwargs):
+        transport = RecordingTransport(kwargs.get('path', self.path),
+                                       kwargs.get('transport', self.server))
+        client = RundeckApiClient('secret_token', 'http://rundeck/rd',
+                                  transport=transport)
+        for name, params in calls:
+            try:
+                getattr(client, name)(**params)
+            except requests.exceptions.RequestException:
+                pass
+        transport.close()
+
+    def client(self, transport):
+        return RundeckApiClient('other_token', 'http://elsewhere:4440',
+                                transport=transport)
+
+    def test_replay_answers_like_the_server(self):
+        self.record(('list_jobs', {'project': 'p'}))
+
+        status, result = self.client(ReplayTransport(self.path)).list_jobs(
+            project='p')
+
+        nt.assert_equal(200, status)
+        nt.assert_equal('a', result['jobs']['list'][0]['name'])
+
+    def test_unrecorded_requests_are_not_found(self):
+        self.record(('list_jobs', {'project': 'p'}))
+        transport = ReplayTransport(self.path)
+
+        response = transport.request('GET', 'http://rundeck/rd/api/1/jobs',
+                                     params={'project': 'q'})
+
+        nt.assert_equal(404, response.status_code)
+
+    def test_repeated_requests_get_the_responses_in_turn(self):
+        self.record(('list_jobs', {'project': 'p'}),
+                    ('list_jobs', {'project': 'p'}))
+        client = self.client(ReplayTransport(self.path))
+
+        names = [client.list_jobs(project='p')[1]['jobs']['list'][0]['name']
+                 for i in range(3)]
+
+        nt.assert_equal(['a', 'b', 'b'], names)
+
+    def test_the_token_is_not_recorded(self):
+        path = os.path.join(self.tmp_dir, 'cassette.jsonl')
+        self.record(('list_jobs', {'project': 'p'}), path=path)
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        nt.assert_in(b'/api/1/jobs', content)
+        nt.assert_not_in(b'secret_token', content)
+
+    def test_bodies_are_stored_once(self):
+        self.server.add('list_jobs', JOBS_XML.format('a'))
+        self.record(*[('list_jobs', {'project': 'p'})] * 3)
+
+        exchanges = load(self.path)
+        nt.assert_equal(3, len(exchanges))
+        nt.assert_equal(JOBS_XML.format('a').encode('utf-8'),
+                        exchanges[2]['body'])
+        with gzip.open(self.path, 'rb') as f:
+            nt.assert_equal(1, f.read().count(b'<jobs count'))
+
+    def test_uploaded_files_are_recorded(self):
+        self.server.add('import_job', JOBS_XML.format('a'))
+        definition = io.BytesIO(b'<joblist/>')
+        definition.name = 'jobs.xml'
+        self.record(('import_job', {'xmlBatch': definition}))
+
+        exchange = load(self.path)[0]
+
+        nt.assert_equal('POST', exchange['method'])
+        nt.assert_equal({'xmlBatch': ('jobs.xml', b'<joblist/>')},
+                        exchange['files'])
+        nt.assert_equal(b'<joblist/>', self.server.requests[0][2]['files']
+                        ['xmlBatch'].getvalue())
+
+    @raises(requests.exceptions.ConnectionError)
+    def test_errors_are_replayed(self):
+        def refuse(method, url, kwargs):
+            raise requests.exceptions.ConnectionError('refused')
+        self.server.add('list_jobs', refuse)
+        self.record(('list_jobs', {'project': 'p'}))
+
+        nt.assert_equal(['ConnectionError', 'refused'],
+                        load(self.path)[0]['error'])
+        ReplayTransport(self.path).request('GET', 'http://x/api/1/jobs',
+                                           params={'project': 'p'})
+
+    def test_responses_take_the_recorded_time_divided_by_speed(self):
+        def slow(method, url, kwargs):
+            time.sleep(0.1)
+            return Response(200, JOBS_XML.format('a'))
+        self.server.add('list_jobs', slow)
+        self.record(('list_jobs', {'project': 'p'}))
+        transport = ReplayTransport(self.path, speed=4)
+
+        start = time.time()
+        transport.request('GET', 'http://x/api/1/jobs',
+                          params={'project': 'p'})
+
+        nt.assert_almost_equal(0.025, time.time() - start, delta=0.015)
+
+    def test_interrupted_recordings_are_read_up_to_the_break(self):
+        plain = os.path.join(self.tmp_dir, 'cassette.jsonl')
+        for cassette, cut, complete in ((self.path, 4, 2), (plain, 20, 1)):
+            self.names = iter('ab')
+            self.record(('list_jobs', {'project': 'p'}),
+                        ('list_jobs', {'project': 'p'}), path=cassette)
+            with open(cassette, 'rb') as f:
+                content = f.read()
+            with open(cassette, 'wb') as f:
+                f.write(content[:-cut])
+
+            exchanges = load(cassette)
+
+            nt.assert_equal(complete, len(exchanges))
+            nt.assert_equal(JOBS_XML.format('a').encode('utf-8'),
+                            exchanges[0]['body'])
+
+    def test_replay_calls_the_endpoints_at_the_recorded_pace(self):
+        with open(os.path.join(config.rundeck_test_data_dir,
+                            'execution_result.xml')) as f:
+            executions = f.read()
+        self.server.add('run_job', executions)
+        transport = RecordingTransport(self.path, self.server)
+        client = RundeckApiClient('secret_token', 'http://rundeck/rd',
+                                  transport=transport)
+        client.list_jobs(project='p')
+        time.sleep(0.2)
+        client.run_job(id='42', argString='-a b')
+        transport.close()
+        server = MemoryTransport(record=True)
+        server.add('list_jobs', JOBS_XML.format('a'))
+        server.add('run_job', executions)
+
+        start = time.time()
+        calls = replay(self.client(server), self.path, speed=2)
+
+        nt.assert_equal(['list_jobs', 'run_job'],
+                        [call['endpoint'] for call in calls])
+        nt.assert_equal([200, 200], [call['status'] for call in calls])
+        nt.assert_almost_equal(0.1, time.time() - start, delta=0.05)
+        method, url, kwargs = server.requests[1]
+        nt.assert_equal('http://elsewhere:4440/api/1/job/42/run', url)
+        nt.assert_equal({'argString': '-a b'}, kwargs['params'])
@@ -0,0 +1,197 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import socket
+import threading
+import time
+
+import nose.tools as nt
+from nose.tools import raises
+import requests
+
+from pyrundeck import RundeckClusterClient
+
+from tests.stub_server import StubServer, system_info_xml
+
+
+JOB_ID = '3b8a86d5-4fc3-4cc1-95a2-8b51421c2069'
+
+
+def jobs_xml(owner):
+    return ('<result success="true" apiversion="13"><jobs count="1">'
+            '<job id="{}" serverNodeUUID="{}"><name>a</name><group/>'
+            '<project>p</project><description/></job></jobs></result>'
+            .format(JOB_ID, owner))
+
+
+def executions_xml(execution_id):
+    return ('<result success="true" apiversion="13">'
+            '<executions count="1"><execution id="{}" status="running" '
+            'project="p"><user>admin</user><date-started '
+            'unixtime="1432809844290">2015-05-28T10:44:04Z</date-started>'
+            '<description>echo</description></execution></executions>'
+            '</result>'.format(execution_id))
+
+
+class Node(object):
+    """A stub Rundeck node that counts the requests it serves."""
+    def __init__(self, uuid, owner=None):
+        self.uuid = uuid
+        self.owner = owner
+        self.status = 200
+        self.paths = []
+        self.server = StubServer(self.handle)
+        self.url = self.server.url
+
+    def handle(self, method, path, body):
+        self.paths.append(path.split('?')[0])
+        if self.status != 200:
+            return self.status, ''
+        if path.startswith('/api/1/system/info'):
+            return 200, system_info_xml(server_uuid=self.uuid)
+        if path.startswith('/api/1/jobs'):
+            return 200, jobs_xml(self.owner)
+        if path.endswith('/run'):
+            return 200, executions_xml('42')
+        return 200, executions_xml(path.rsplit('/', 1)[1])
+
+
+def closed_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:{}'.format(port)
+
+
+class TestRundeckClusterClient(object):
+    def setup(self):
+        self.nodes = [Node('uuid-{}'.format(i), owner='uuid-2')
+                      for i in range(3)]
+        for node in self.nodes:
+            node.server.start()
+
+    def teardown(self):
+        for node in self.nodes:
+            node.server.stop()
+
+    def client(self, urls=None, **kwargs):
+        urls = urls or [node.url for node in self.nodes]
+        return RundeckClusterClient('token', urls, **kwargs)
+
+    def test_reads_are_spread(self):
+        client = self.client()
+        for _ in range(9):
+            nt.assert_equal(200, client.system_info(native=False)[0])
+
+        nt.assert_equal([3, 3, 3], [len(n.paths) for n in self.nodes])
+
+    def test_least_outstanding_node_is_chosen(self):
+        client = self.client()
+        release = threading.Event()
+        started = threading.Event()
+        slow = self.nodes[0]
+        handle = slow.handle
+
+        def blocking(method, path, body):
+            started.set()
+            release.wait(5)
+            return handle(method, path, body)
+        slow.server.handle = blocking
+
+        worker = threading.Thread(target=client.system_info)
+        worker.start()
+        started.wait(5)
+        for _ in range(4):
+            client.system_info(native=False)
+        release.set()
+        worker.join()
+
+        nt.assert_equal(1, len(slow.paths))
+        nt.assert_equal([2, 2], [len(n.paths) for n in self.nodes[1:]])
+
+    def test_failing_node_is_ejected_and_readmitted(self):
+        client = self.client(max_failures=2, eject_time=0.2)
+        self.nodes[0].status = 503
+        for _ in range(12):
+            nt.assert_equal(200, client.system_info(native=False)[0])
+
+        stats = client.stats()
+        nt.assert_true(stats[0]['ejected'])
+        nt.assert_equal(2, len(self.nodes[0].paths))
+
+        self.nodes[0].status = 200
+        time.sleep(0.25)
+        for _ in range(6):
+            client.system_info(native=False)
+        nt.assert_false(client.stats()[0]['ejected'])
+        nt.assert_true(len(self.nodes[0].paths) > 2)
+
+    def test_unreachable_node_fails_over(self):
+        client = self.client([closed_url(), self.nodes[0].url])
+        for _ in range(4):
+            nt.assert_equal(200, client.run_job(id=JOB_ID)[0])
+
+        nt.assert_equal(4, len(self.nodes[0].paths))
+        nt.assert_true(client.stats()[0]['ejected'])
+
+    def test_launches_go_to_owner(self):
+        client = self.client()
+        client.list_jobs(project='p')
+        for node in self.nodes:
+            del node.paths[:]
+
+        client.run_job(id=JOB_ID)
+        client.execution_info(id='42')
+
+        owner = self.nodes[2]
+        nt.assert_equal(['/api/1/job/{}/run'.format(JOB_ID),
+                         '/api/1/execution/42'],
+                        [p for p in owner.paths
+                         if not p.startswith('/api/1/system')])
+        nt.assert_equal(['uuid-0', 'uuid-1', 'uuid-2'],
+                        [n['server_uuid'] for n in client.stats()])
+
+    def test_launches_are_not_repeated_after_errors(self):
+        client = self.client([self.nodes[0].url, self.nodes[1].url])
+        for node in self.nodes:
+            node.status = 503
+
+        nt.assert_equal(503, client.run_job(id=JOB_ID, native=False)[0])
+        nt.assert_equal(1, sum(len(n.paths) for n in self.nodes))
+
+    @raises(requests.exceptions.ConnectionError)
+    def test_all_nodes_down(self):
+        self.client([closed_url(), closed_url()]).system_info()
+
+    @raises(ValueError)
+    def test_root_urls_are_required(self):
+        RundeckClusterClient('token', [])
@@ -0,0 +1,144 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import nose.tools as nt
+from lxml import etree
+
+from pyrundeck import RundeckApiClient, LaunchDeduplicator
+from pyrundeck.dedup import launch_key
+
+
+class TestLaunchKey(object):
+    def test_argstring_whitespace_is_ignored(self):
+        nt.assert_equal(launch_key('a', {'argstring': '-x  1 -y 2 '}),
+                        launch_key('a', {'argstring': '-x 1 -y 2'}))
+
+    def test_params_are_normalized(self):
+        nt.assert_equal(launch_key('a', {'loglevel': 'INFO',
+                                         'asUser': 'bob'}),
+                        launch_key('a', {'asUser': 'bob',
+                                         'loglevel': 'INFO'}))
+        nt.assert_equal(launch_key('a', {'exclude-precedence': True}),
+                        launch_key('a', {'exclude-precedence': 'true'}))
+
+    def test_different_launches_differ(self):
+        nt.assert_not_equal(launch_key('a', {'argstring': '-x 1'}),
+                            launch_key('a', {'argstring': '-x 2'}))
+        nt.assert_not_equal(launch_key('a', {'argstring': "-m 'a  b'"}),
+                            launch_key('a', {'argstring': "-m 'a b'"}))
+        nt.assert_not_equal(launch_key('a', {'argstring': "-m 'a  b"}),
+                            launch_key('a', {'argstring': "-m 'a b"}))
+        nt.assert_not_equal(launch_key('a', {}), launch_key('b', {}))
+
+
+class TestRunJobDeduplication(object):
+    def setup(self):
+        self.root_url = 'http://www.example.com'
+        self.deduplicator = LaunchDeduplicator(window=5)
+        self.client = RundeckApiClient('mock_token', self.root_url,
+                                       launch_deduplicator=self.deduplicator)
+        self.xml_tree = etree.fromstring('<result success="true"/>')
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_identical_launches_share_execution(self, mock_get):
+        mock_get.return_value = (200, self.xml_tree)
+
+        first = self.client.run_job(native=False, id='job',
+                                    argstring='-x 1')
+        second = self.client.run_job(native=False, id='job',
+                                     argstring='-x  1')
+
+        nt.assert_equal(1, mock_get.call_count)
+        nt.assert_equal(first, second)
+        nt.assert_equal({'launched': 1, 'deduplicated': 1},
+                        self.deduplicator.stats())
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_different_launches_are_sent(self, mock_get):
+        mock_get.return_value = (200, self.xml_tree)
+
+        self.client.run_job(native=False, id='job', argstring='-x 1')
+        self.client.run_job(native=False, id='job', argstring='-x 2')
+
+        nt.assert_equal(2, mock_get.call_count)
+
+    @patch('time.time')
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_launches_after_window_are_sent(self, mock_get, mock_time):
+        mock_get.return_value = (200, self.xml_tree)
+        mock_time.return_value = 1000.0
+        self.client.run_job(native=False, id='job')
+        mock_time.return_value = 1004.0
+        self.client.run_job(native=False, id='job')
+        mock_time.return_value = 1006.0
+        self.client.run_job(native=False, id='job')
+
+        nt.assert_equal(2, mock_get.call_count)
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_failed_launches_are_not_remembered(self, mock_get):
+        mock_get.return_value = (500, None)
+
+        self.client.run_job(native=False, id='job')
+        self.client.run_job(native=False, id='job')
+
+        nt.assert_equal(2, mock_get.call_count)
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_concurrent_launches_are_sent_once(self, mock_get):
+        def get(url, params):
+            time.sleep(0.05)
+            return 200, self.xml_tree
+
+        mock_get.side_effect = get
+        results = []
+
+        def launch():
+            results.append(self.client.run_job(native=False, id='job'))
+
+        threads = [threading.Thread(target=launch) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        nt.assert_equal(1, mock_get.call_count)
+        nt.assert_equal(5, len(results))
+        nt.assert_true(all(r == results[0] for r in results))
@@ -0,0 +1,138 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import gc
+import os
+import threading
+import weakref
+
+import nose.tools as nt
+import requests
+
+from pyrundeck import (RequestScheduler, RequestsTransport, Urllib3Transport,
+                       fork)
+from pyrundeck.throttle import ConcurrencyLimit
+
+
+def in_child(check):
+    """Run ``check`` in a forked child and return whether it passed."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = check()
+        except Exception:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    return os.WEXITSTATUS(status) == 0
+
+
+class TestAfterFork(object):
+    def test_urllib3_pools_are_dropped(self):
+        transport = Urllib3Transport()
+        transport._manager(True, None)
+        nt.assert_equal(len(transport._managers), 1)
+
+        nt.assert_true(in_child(lambda: transport._managers == {}))
+        nt.assert_equal(len(transport._managers), 1)
+
+    def test_requests_adapters_are_replaced(self):
+        transport = RequestsTransport()
+        adapter = transport.session.get_adapter('http://rundeck')
+
+        def check():
+            return transport.session.get_adapter('http://rundeck') \
+                is not adapter
+        nt.assert_true(in_child(check))
+        nt.assert_is(transport.session.get_adapter('http://rundeck'),
+                     adapter)
+
+    def test_sessions_of_the_caller_are_left_alone(self):
+        session = requests.Session()
+        session.headers['X-Test'] = 'yes'
+        transport = RequestsTransport(session=session)
+        adapter = session.get_adapter('http://rundeck')
+        adapter.close = lambda: os._exit(2)
+
+        def check():
+            return (transport.session is not session and
+                    transport.session.headers['X-Test'] == 'yes' and
+                    session.get_adapter('http://rundeck') is adapter)
+        nt.assert_true(in_child(check))
+        nt.assert_is(transport.session, session)
+
+    def test_in_flight_requests_are_forgotten(self):
+        limit = ConcurrencyLimit(1)
+        nt.assert_true(limit.try_acquire())
+
+        nt.assert_true(in_child(limit.try_acquire))
+        nt.assert_false(limit.try_acquire())
+
+    def test_scheduler_works_in_child(self):
+        scheduler = RequestScheduler(workers=2)
+        blocked = threading.Event()
+        # Keep a worker of the parent busy while forking.
+        scheduler.submit('bulk', blocked.wait)
+
+        def check():
+            future = scheduler.submit('interactive', lambda: 42)
+            return future.result(timeout=5) == 42
+        try:
+            nt.assert_true(in_child(check))
+        finally:
+            blocked.set()
+            scheduler.shutdown()
+
+    def test_registry_does_not_keep_objects_alive(self):
+        # Garbage of earlier tests must not leave the registry during
+        # the test.
+        gc.collect()
+        size = len(fork._registry)
+        transport = Urllib3Transport()
+        ref = weakref.ref(transport)
+        nt.assert_equal(len(fork._registry), size + 1)
+
+        del transport
+        gc.collect()
+
+        nt.assert_is_none(ref())
+        nt.assert_equal(len(fork._registry), size)
+
+
+class TestFreeze(object):
+    def test_freeze(self):
+        if not hasattr(gc, 'freeze'):
+            nt.assert_is_none(fork.freeze())
+            return
+        try:
+            nt.assert_greater(fork.freeze(), 0)
+        finally:
+            gc.unfreeze()
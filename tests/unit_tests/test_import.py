@@ -0,0 +1,89 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import nose.tools as nt
+from nose.tools import raises
+
+from pyrundeck.helpers import _LazyModule
+from pyrundeck import rundeck_parser
+
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
+
+
+class TestImport(object):
+    def setup(self):
+        self.cwd = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.cwd)
+
+    def python(self, code):
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT))
+        return subprocess.check_output([sys.executable, '-c', code],
+                                       cwd=self.cwd, env=env,
+                                       universal_newlines=True).split()
+
+    def test_dependencies_are_imported_on_first_use(self):
+        imported = self.python(
+            'import sys, pyrundeck\n'
+            'for name in ("requests", "lxml.etree", "yaml", "ssl"):\n'
+            '    print(name in sys.modules)\n'
+            'print(pyrundeck.rundeck_parser._parser is None)\n'
+        )
+        nt.assert_equal(imported, ['False'] * 4 + ['True'])
+
+    def test_import_writes_no_files(self):
+        self.python('import pyrundeck')
+        nt.assert_equal(os.listdir(self.cwd), [])
+
+
+class TestLazyModule(object):
+    def test_attributes(self):
+        module = _LazyModule('json')
+        nt.assert_equal(module.dumps([1]), '[1]')
+        nt.assert_in('dumps', vars(module))
+
+    @raises(AttributeError)
+    def test_missing_attribute(self):
+        _LazyModule('json').no_such_function
+
+
+class TestParser(object):
+    def test_parser_is_built_once(self):
+        parser = rundeck_parser.get_parser()
+        nt.assert_is(rundeck_parser.get_parser(), parser)
@@ -0,0 +1,221 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import nose.tools as nt
+from nose.tools import raises
+
+from pyrundeck import LaunchQueue, QueueFullError, RundeckException
+
+
+class FakeClient(object):
+    """Launches jobs by handing out consecutive execution ids."""
+    def __init__(self, status=200):
+        self.status = status
+        self.launches = []
+        self._lock = threading.Lock()
+
+    def run_job(self, **params):
+        with self._lock:
+            self.launches.append(params)
+            execution = str(len(self.launches))
+        if self.status != 200:
+            return self.status, None
+        return 200, {'executions': {'count': 1,
+                                    'list': [{'id': execution}]}}
+
+
+class TestLaunchQueue(object):
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'launches.db')
+        self.client = FakeClient()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_launches_resolve_to_execution_ids(self):
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01)
+        tickets = [queue.enqueue(id='job', argstring='-n {}'.format(i))
+                   for i in range(5)]
+
+        ids = [queue.result(t, timeout=5) for t in tickets]
+        queue.stop()
+
+        nt.assert_equal(['1', '2', '3', '4', '5'], sorted(ids))
+        nt.assert_equal(5, queue.stats()['done'])
+        nt.assert_equal({'id': 'job', 'argstring': '-n 0'},
+                        [l for l in self.client.launches
+                         if l['argstring'] == '-n 0'][0])
+
+    def test_waiting_duplicates_are_queued_once(self):
+        queue = LaunchQueue(self.client, self.path, start=False)
+        first = queue.enqueue(id='job', argstring='-x 1')
+        second = queue.enqueue(id='job', argstring='-x  1')
+        other = queue.enqueue(id='job', argstring='-x 2')
+
+        nt.assert_equal(first, second)
+        nt.assert_not_equal(first, other)
+        nt.assert_equal(2, queue.stats()['pending'])
+
+    def test_queue_survives_restart(self):
+        queue = LaunchQueue(self.client, self.path, start=False)
+        ticket = queue.enqueue(id='job')
+        del queue
+
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01)
+        nt.assert_equal('1', queue.result(ticket, timeout=5))
+        queue.stop()
+
+    def test_interrupted_launches_are_resubmitted(self):
+        queue = LaunchQueue(self.client, self.path, start=False)
+        ticket = queue.enqueue(id='job')
+        queue.close()
+        db = sqlite3.connect(self.path)
+        db.execute("UPDATE launches SET state = 'running', lease = 1")
+        db.commit()
+        db.close()
+
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01)
+        nt.assert_equal('1', queue.result(ticket, timeout=5))
+        queue.close()
+
+    def test_launches_of_other_processes_are_left_alone(self):
+        queue = LaunchQueue(self.client, self.path, start=False)
+        ticket = queue.enqueue(id='job')
+        queue.close()
+        db = sqlite3.connect(self.path)
+        db.execute("UPDATE launches SET state = 'running', lease = ?",
+                   (time.time() + 60,))
+        db.commit()
+        db.close()
+
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01)
+        nt.assert_is_none(queue.result(ticket, timeout=0.1))
+        queue.close()
+        nt.assert_equal('running', queue.status(ticket)['state'])
+        nt.assert_equal([], self.client.launches)
+
+    def test_launches_with_unreadable_results_are_done(self):
+        self.client.run_job = lambda **params: (200, {'executions': {}})
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01)
+        ticket = queue.enqueue(id='job')
+
+        nt.assert_is_none(queue.result(ticket, timeout=5))
+        queue.close()
+        status = queue.status(ticket)
+        nt.assert_equal('done', status['state'])
+        nt.assert_equal(1, status['attempts'])
+        nt.assert_in('unknown execution id', status['error'])
+
+    def test_drainers_survive_database_errors(self):
+        queue = LaunchQueue(self.client, self.path, workers=1, start=False,
+                            poll_interval=0.01)
+        claim = queue._claim
+        failures = [sqlite3.OperationalError('database is locked')]
+
+        def flaky_claim(db):
+            if failures:
+                raise failures.pop()
+            return claim(db)
+        queue._claim = flaky_claim
+        ticket = queue.enqueue(id='job')
+        queue.start()
+
+        nt.assert_equal('1', queue.result(ticket, timeout=5))
+        queue.close()
+
+    def test_unrecorded_outcomes_wait_for_the_lease(self):
+        queue = LaunchQueue(self.client, self.path, workers=1, start=False,
+                            lease=0.2, poll_interval=0.01)
+        finish = queue._finish
+        failures = [sqlite3.OperationalError('disk I/O error')]
+
+        def flaky_finish(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return finish(*args, **kwargs)
+        queue._finish = flaky_finish
+        ticket = queue.enqueue(id='job')
+        queue.start()
+
+        nt.assert_equal('2', queue.result(ticket, timeout=5))
+        queue.close()
+        nt.assert_equal(2, len(self.client.launches))
+
+    def test_close_closes_the_connections(self):
+        queue = LaunchQueue(self.client, self.path, workers=1,
+                            poll_interval=0.01)
+        queue.result(queue.enqueue(id='job'), timeout=5)
+        connections = list(queue._connections)
+
+        queue.close()
+
+        nt.assert_equal(2, len(connections))
+        for db in connections:
+            nt.assert_raises(sqlite3.ProgrammingError, db.execute,
+                             'SELECT 1')
+        nt.assert_equal([], queue._connections)
+
+    @raises(QueueFullError)
+    def test_full_queue_applies_backpressure(self):
+        queue = LaunchQueue(self.client, self.path, start=False,
+                            max_pending=2, enqueue_timeout=0.05,
+                            poll_interval=0.01)
+        queue.enqueue(id='job1')
+        queue.enqueue(id='job2')
+        queue.enqueue(id='job3')
+
+    def test_rejected_launches_fail(self):
+        self.client.status = 400
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01)
+        ticket = queue.enqueue(id='job')
+
+        nt.assert_raises(RundeckException, queue.result, ticket, 5)
+        queue.stop()
+        nt.assert_equal(1, queue.status(ticket)['attempts'])
+
+    def test_server_errors_are_retried(self):
+        self.client.status = 503
+        queue = LaunchQueue(self.client, self.path, poll_interval=0.01,
+                            max_attempts=3, retry_delay=0)
+        ticket = queue.enqueue(id='job')
+
+        nt.assert_raises(RundeckException, queue.result, ticket, 5)
+        queue.stop()
+        nt.assert_equal(3, len(self.client.launches))
@@ -0,0 +1,154 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import nose.tools as nt
+from nose.tools import raises
+from lxml import etree
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from pyrundeck import RundeckApiClient, MemoryTransport, QueueLogging
+from pyrundeck.log import _DroppingQueueHandler
+from pyrundeck.rundeck_parser import parse
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((threading.current_thread().name,
+                             record.getMessage()))
+
+
+def record(message):
+    return logging.LogRecord('pyrundeck.test', logging.INFO, __file__, 0,
+                             message, None, None)
+
+
+class TestNoConfiguration(object):
+    def setup(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.root_handlers = list(logging.getLogger().handlers)
+
+    def teardown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_client_does_not_configure_logging(self):
+        RundeckApiClient('token', 'http://rundeck',
+                         transport=MemoryTransport())
+        nt.assert_equal(logging.getLogger().handlers, self.root_handlers)
+        nt.assert_equal(os.listdir(self.directory), [])
+
+    def test_log_level(self):
+        logger = logging.getLogger('pyrundeck.api')
+        level = logger.level
+        try:
+            RundeckApiClient('token', 'http://rundeck', log_level=logging.WARN,
+                             transport=MemoryTransport())
+            nt.assert_equal(logger.level, logging.WARN)
+        finally:
+            logger.setLevel(level)
+
+    def test_parser_does_not_serialize_without_debug(self):
+        xml = etree.fromstring('<result success="true" apiversion="13">'
+                               '<jobs count="0"></jobs></result>')
+        logger = logging.getLogger('pyrundeck.xml2native')
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            with patch('pyrundeck.xml2native.etree') as mock_etree:
+                parse(xml)
+        finally:
+            logger.setLevel(level)
+        nt.assert_false(mock_etree.tostring.called)
+
+
+class TestQueueLogging(object):
+    def setup(self):
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger('pyrundeck.test')
+
+    def test_records_are_written_on_another_thread(self):
+        with QueueLogging([self.handler], level=logging.INFO):
+            self.logger.info('message')
+        nt.assert_equal(len(self.handler.records), 1)
+        thread, message = self.handler.records[0]
+        nt.assert_equal(message, 'message')
+        nt.assert_not_equal(thread, threading.current_thread().name)
+
+    def test_stop_restores_propagation(self):
+        logger = logging.getLogger('pyrundeck')
+        propagate = logger.propagate
+        queue_logging = QueueLogging([self.handler]).start()
+        nt.assert_false(logger.propagate)
+        queue_logging.stop()
+        nt.assert_equal(logger.propagate, propagate)
+        nt.assert_equal(queue_logging.stats(), {'queued': 0, 'dropped': 0})
+
+    @raises(ValueError)
+    def test_unknown_drop_policy(self):
+        QueueLogging([self.handler], drop='random')
+
+
+class TestDroppingQueueHandler(object):
+    def emit(self, drop):
+        handler = _DroppingQueueHandler(queue.Queue(2), drop)
+        for i in range(4):
+            handler.emit(record(str(i)))
+        messages = []
+        while not handler.queue.empty():
+            messages.append(handler.queue.get().getMessage())
+        return messages, handler.dropped
+
+    def test_drop_newest(self):
+        nt.assert_equal(self.emit('newest'), (['0', '1'], 2))
+
+    def test_drop_oldest(self):
+        nt.assert_equal(self.emit('oldest'), (['2', '3'], 2))
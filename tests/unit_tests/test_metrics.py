@@ -0,0 +1,203 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import random
+
+import nose.tools as nt
+
+from pyrundeck import (RundeckApiClient, RequestsTransport, Urllib3Transport,
+                       MemoryTransport, RefreshingCache, Tracer, Metrics)
+from pyrundeck.metrics import Histogram
+from pyrundeck.tracing import Span
+
+from tests.stub_server import StubServer
+
+
+JOBS_XML = ('<result success="true" apiversion="13"><jobs count="1">'
+            '<job id="1"><name>a</name><group/><project>p</project>'
+            '<description/></job></jobs></result>')
+
+
+def span(name='list_jobs', duration=0.1, status=200, requests=1,
+         error=None):
+    result = Span(name, '/api/1/jobs', 'GET')
+    result.duration = duration
+    result.status = status
+    result.requests = requests
+    result.error = error
+    return result
+
+
+class TestHistogram(object):
+    def test_empty(self):
+        histogram = Histogram()
+
+        nt.assert_equal(0, histogram.percentile(99))
+        nt.assert_equal([0, 0], histogram.cumulative((0.1, 1)))
+
+    def test_percentiles_are_close(self):
+        rng = random.Random(1)
+        values = sorted(rng.lognormvariate(-3, 1) for _ in range(10000))
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+
+        for q in (50, 90, 99):
+            exact = values[len(values) * q // 100 - 1]
+            nt.assert_almost_equal(exact, histogram.percentile(q),
+                                   delta=exact / 16)
+        nt.assert_equal(values[-1], histogram.percentile(100))
+        nt.assert_equal(len(values), histogram.count)
+        nt.assert_almost_equal(sum(values), histogram.sum)
+
+    def test_cumulative(self):
+        histogram = Histogram()
+        for value in (0.001, 0.002, 0.05, 2, 5000):
+            histogram.record(value)
+
+        nt.assert_equal([2, 3, 3, 4],
+                        histogram.cumulative((0.01, 0.1, 1, 10)))
+
+    def test_out_of_range(self):
+        histogram = Histogram()
+        histogram.record(0)
+        histogram.record(1e6)
+
+        nt.assert_equal(1e6, histogram.max)
+        nt.assert_equal(1e6, histogram.percentile(100))
+
+
+class TestMetrics(object):
+    def setup(self):
+        self.metrics = Metrics()
+
+    def test_status_classes(self):
+        self.metrics(span(status=200))
+        self.metrics(span(status=404))
+        self.metrics(span(status=None, requests=0))
+        self.metrics(span(status=None, error=ValueError()))
+
+        calls = self.metrics.snapshot()['calls']['list_jobs']
+        nt.assert_equal(set(['2xx', '4xx', 'cached', 'error']), set(calls))
+        nt.assert_equal(1, calls['2xx']['count'])
+
+    def test_counters(self):
+        first = span()
+        first.response_bytes = 1000
+        first.timings['xml_parse'] = 0.001
+        first.timings['native'] = 0.001
+        self.metrics(first)
+        self.metrics(span())
+
+        endpoint = self.metrics.snapshot()['endpoints']['list_jobs']
+        nt.assert_equal(2, endpoint['requests'])
+        nt.assert_equal(1000, endpoint['parsed_bytes'])
+        nt.assert_almost_equal(0.002, endpoint['parse_seconds'])
+        nt.assert_almost_equal(500000, endpoint['parse_bytes_per_second'])
+
+    def test_prometheus(self):
+        self.metrics(span(duration=0.02))
+        self.metrics(span(duration=3))
+        self.metrics(span(name='weird"name'))
+
+        text = self.metrics.prometheus()
+        lines = text.splitlines()
+        nt.assert_in('# TYPE rundeck_client_call_duration_seconds histogram',
+                     lines)
+        nt.assert_in('rundeck_client_call_duration_seconds_bucket'
+                     '{endpoint="list_jobs",le="0.025",status="2xx"} 1.0',
+                     lines)
+        nt.assert_in('rundeck_client_call_duration_seconds_bucket'
+                     '{endpoint="list_jobs",le="+Inf",status="2xx"} 2.0',
+                     lines)
+        nt.assert_in('rundeck_client_call_duration_seconds_count'
+                     '{endpoint="list_jobs",status="2xx"} 2.0', lines)
+        nt.assert_in('rundeck_client_http_requests_total'
+                     '{endpoint="weird\\"name"} 1.0', lines)
+        nt.assert_true(text.endswith('\n'))
+
+    def test_traced_client(self):
+        transport = MemoryTransport()
+        transport.add('list_jobs', JOBS_XML)
+        client = RundeckApiClient('token', 'http://rundeck',
+                                  transport=transport,
+                                  tracer=Tracer([self.metrics]),
+                                  refresh_cache=RefreshingCache({
+                                      'list_jobs': {'soft_ttl': 60,
+                                                    'hard_ttl': 60}}))
+        self.metrics.watch(client)
+        self.metrics.watch(client.for_token('other'))
+        client.list_jobs()
+        client.list_jobs()
+
+        snapshot = self.metrics.snapshot()
+        nt.assert_equal(1, snapshot['calls']['list_jobs']['2xx']['count'])
+        nt.assert_equal(1, snapshot['calls']['list_jobs']['cached']['count'])
+        nt.assert_equal({'hits': 1, 'misses': 1, 'hit_ratio': 0.5},
+                        snapshot['caches']['refresh_cache'])
+        nt.assert_equal([], snapshot['pools'])
+        nt.assert_in('rundeck_client_cache_hits_total'
+                     '{cache="refresh_cache"} 1.0',
+                     self.metrics.prometheus().splitlines())
+
+
+class TestPoolStats(object):
+    def setup(self):
+        self.server = StubServer(lambda method, path, body: (200, JOBS_XML),
+                                 keep_alive=True)
+        self.server.start()
+
+    def teardown(self):
+        self.server.stop()
+
+    def check(self, transport):
+        metrics = Metrics()
+        client = RundeckApiClient('token', self.server.url,
+                                  transport=transport,
+                                  tracer=Tracer([metrics]))
+        metrics.watch(client)
+        client.list_jobs()
+        client.list_jobs()
+
+        pool, = metrics.snapshot()['pools']
+        nt.assert_equal(self.server.url, pool['pool'])
+        nt.assert_equal((1, 0, 1, 2),
+                        (pool['idle'], pool['in_use'], pool['opened'],
+                         pool['requests']))
+        nt.assert_in('rundeck_client_pool_connections{{pool="{}",'
+                     'state="idle"}} 1.0'.format(self.server.url),
+                     metrics.prometheus().splitlines())
+
+    def test_requests_transport(self):
+        self.check(RequestsTransport())
+
+    def test_urllib3_transport(self):
+        self.check(Urllib3Transport())
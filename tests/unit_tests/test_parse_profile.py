@@ -0,0 +1,150 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+
+from lxml import etree
+import nose.tools as nt
+from nose.tools import raises
+
+from pyrundeck.rundeck_parser import RundeckParser
+from pyrundeck.xml2native import ParseError, ParserEngine
+
+
+TEXT_OR_ATTRIBUTE = {
+    'tag': 'value',
+    'type': 'alternatives',
+    'parse tables': [
+        {'type': 'attribute'},
+        {'type': 'text'},
+    ]
+}
+
+LIST = {
+    'tag': 'values',
+    'type': 'list',
+    'skip count': True,
+    'element parse table': TEXT_OR_ATTRIBUTE,
+}
+
+VALUES = etree.fromstring('<values><value>abc</value><value>d</value>'
+                          '<value x="yz"/></values>')
+
+
+class TestParseProfile(object):
+    def setup(self):
+        self.engine = ParserEngine()
+        self.profile = self.engine.enable_profiling()
+
+    def entries(self):
+        return dict(((entry['tag'], entry['type']), entry)
+                    for entry in self.profile.stats())
+
+    def test_counters(self):
+        result = self.engine.callbacks['list'](VALUES, LIST)
+        nt.assert_equal({'list': ['abc', 'd', {'x': 'yz'}]}, result)
+
+        entries = self.entries()
+        values = entries[('values', 'list')]
+        nt.assert_equal(1, values['calls'])
+        nt.assert_greater_equal(values['seconds'], values['self_seconds'])
+
+        alternatives = entries[('value', 'alternatives')]
+        nt.assert_equal(3, alternatives['calls'])
+        nt.assert_equal(6, alternatives['text_bytes'])
+        nt.assert_equal(2, alternatives['failed_alternatives'])
+        nt.assert_equal([0], list(alternatives['failed_branches']))
+        nt.assert_equal(2, alternatives['failed_branches'][0][0])
+
+        attribute = entries[('value', 'attribute')]
+        nt.assert_equal((3, 2), (attribute['calls'], attribute['errors']))
+        nt.assert_equal(2, entries[('value', 'text')]['calls'])
+
+    def test_report_is_ordered_by_cost(self):
+        self.engine.callbacks['list'](VALUES, LIST)
+
+        stats = self.profile.stats('calls')
+        nt.assert_equal([3, 3, 2, 1], [entry['calls'] for entry in stats])
+        report = self.profile.report(limit=2).splitlines()
+        nt.assert_true(report[0].startswith('tag'))
+        nt.assert_in('alternative #0: 2 failures', '\n'.join(report))
+
+    def test_disable(self):
+        profile = self.engine.disable_profiling()
+        self.engine.callbacks['list'](VALUES, LIST)
+
+        nt.assert_is(self.profile, profile)
+        nt.assert_equal([], profile.stats())
+        nt.assert_is_none(self.engine.profile)
+
+    def test_reset(self):
+        self.engine.callbacks['list'](VALUES, LIST)
+        self.profile.reset()
+
+        nt.assert_equal([], self.profile.stats())
+
+    @raises(ParseError)
+    def test_failed_parse(self):
+        try:
+            self.engine.callbacks['alternatives'](
+                etree.fromstring('<value><a/></value>'), TEXT_OR_ATTRIBUTE)
+        finally:
+            entry = self.entries()[('value', 'text')]
+            nt.assert_equal(1, entry['errors'])
+
+    def test_threads_add_up(self):
+        threads = [threading.Thread(target=self.engine.callbacks['list'],
+                                    args=(VALUES, LIST))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        nt.assert_equal(4, self.entries()[('values', 'list')]['calls'])
+
+    def test_rundeck_parser(self):
+        parser = RundeckParser()
+        profile = parser.engine.enable_profiling()
+        xml = etree.fromstring(
+            '<joblist><job><id>1</id><uuid>1</uuid><loglevel>INFO</loglevel>'
+            '<sequence keepgoing="false" '
+            'strategy="node-first"><command><script>echo</script>'
+            '</command></sequence><description/><name>a</name>'
+            '<context><project>p</project></context></job></joblist>')
+        parser.parse(xml, 'alternatives', parser.start_symbol)
+
+        entries = dict(((entry['tag'], entry['type']), entry)
+                       for entry in profile.stats())
+        nt.assert_equal(1, entries[('*', 'alternatives')]['calls'])
+        command = entries[('command', 'alternatives')]
+        nt.assert_equal({0: 1}, dict((index, failures) for index, (failures, _)
+                                     in command['failed_branches'].items()))
@@ -0,0 +1,193 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+
+import nose.tools as nt
+from nose.tools import raises
+from lxml import etree
+
+from pyrundeck import RundeckApiClient, JobPrefetcher
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+def jobs_xml(ids):
+    jobs = ''.join('<job id="{0}"><name>{0}</name><group/>'
+                   '<project>p</project><description/></job>'.format(i)
+                   for i in ids)
+    return ('<result success="true" apiversion="13">'
+            '<jobs count="{}">{}</jobs></result>'.format(len(ids), jobs))
+
+
+def definition_xml(job_id):
+    return jobs_xml([job_id])
+
+
+class FakeServer(object):
+    """Answers ``get`` calls for the job list and job definitions."""
+    def __init__(self, ids):
+        self.ids = ids
+        self.definitions = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None):
+        if url.endswith('/jobs'):
+            return 200, etree.fromstring(jobs_xml(self.ids))
+        job_id = url.rsplit('/', 1)[1]
+        with self._lock:
+            self.definitions.append(job_id)
+        return 200, etree.fromstring(definition_xml(job_id))
+
+
+class TestJobPrefetcher(object):
+    def setup(self):
+        self.server = FakeServer(['a', 'b', 'c', 'd'])
+        patcher = patch('pyrundeck.RundeckApiClient.get',
+                        side_effect=self.server.get)
+        patcher.start()
+        self.patcher = patcher
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def client(self, prefetcher):
+        return RundeckApiClient('mock_token', 'http://www.example.com',
+                                prefetcher=prefetcher)
+
+    def test_first_listed_jobs_are_prefetched(self):
+        prefetcher = JobPrefetcher(top_n=2)
+        client = self.client(prefetcher)
+
+        client.list_jobs(project='p')
+        status, definition = client.job_definition(id='a')
+        client.job_definition(id='b')
+        client.job_definition(id='c')
+
+        nt.assert_equal(200, status)
+        nt.assert_equal('a', definition['jobs']['list'][0]['name'])
+        nt.assert_equal(['a', 'b', 'c'], sorted(self.server.definitions))
+        stats = prefetcher.stats()
+        nt.assert_equal(2, stats['prefetched'])
+        nt.assert_equal(2, stats['hits'])
+        nt.assert_equal(1, stats['misses'])
+
+    def test_recent_strategy_prefetches_recently_used_jobs(self):
+        prefetcher = JobPrefetcher(top_n=2, strategy='recent')
+        client = self.client(prefetcher)
+        for job_id in ('d', 'x', 'b'):
+            client.job_definition(id=job_id)
+        del self.server.definitions[:]
+
+        client.list_jobs(project='p')
+        client.job_definition(id='b')
+        client.job_definition(id='d')
+
+        nt.assert_equal(['b', 'd'], sorted(self.server.definitions))
+        nt.assert_equal(2, prefetcher.stats()['hits'])
+
+    def test_etree_results_are_copies(self):
+        client = self.client(JobPrefetcher(top_n=1))
+        client.list_jobs()
+
+        _, first = client.job_definition(id='a', native=False)
+        first.clear()
+        _, second = client.job_definition(id='a', native=False)
+
+        nt.assert_equal(1, len(second))
+        nt.assert_equal(['a'], self.server.definitions)
+
+    def test_calls_waiting_for_a_prefetch_share_it(self):
+        release = threading.Event()
+        get = self.server.get
+
+        def slow_get(url, params=None):
+            if not url.endswith('/jobs'):
+                release.wait(5)
+            return get(url, params)
+        self.patcher.stop()
+        self.patcher = patch('pyrundeck.RundeckApiClient.get',
+                             side_effect=slow_get)
+        self.patcher.start()
+        prefetcher = JobPrefetcher(top_n=1)
+        client = self.client(prefetcher)
+        client.list_jobs()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            client.job_definition(id='a'))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        client.list_jobs()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        nt.assert_equal(['a'], self.server.definitions)
+        nt.assert_equal([200] * 3, [status for status, _ in results])
+        nt.assert_equal(3, prefetcher.stats()['hits'])
+        nt.assert_equal(1, prefetcher.stats()['prefetched'])
+
+    def test_calls_with_other_parameters_are_not_served(self):
+        prefetcher = JobPrefetcher(top_n=1)
+        client = self.client(prefetcher)
+        client.list_jobs()
+
+        client.job_definition(id='a', format='xml')
+
+        nt.assert_equal(['a', 'a'], sorted(self.server.definitions))
+        nt.assert_equal(0, prefetcher.stats()['hits'])
+
+    def test_disabled_prefetcher_does_not_fetch(self):
+        prefetcher = JobPrefetcher()
+        prefetcher.enabled = False
+        client = self.client(prefetcher)
+
+        client.list_jobs()
+        client.job_definition(id='a')
+
+        nt.assert_equal(['a'], self.server.definitions)
+        nt.assert_equal(0.0, prefetcher.stats()['hit_ratio'])
+
+    def test_unused_definitions_are_counted(self):
+        prefetcher = JobPrefetcher(top_n=4, max_entries=2)
+        client = self.client(prefetcher)
+
+        client.list_jobs()
+
+        nt.assert_equal(2, prefetcher.stats()['unused'])
+
+    @raises(ValueError)
+    def test_unknown_strategy(self):
+        JobPrefetcher(strategy='random')
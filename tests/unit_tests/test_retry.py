@@ -0,0 +1,237 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import nose.tools as nt
+from nose.tools import raises
+import requests
+
+from pyrundeck import (RundeckApiClient, RetryPolicy, RetryBudget,
+                       CircuitBreaker, CircuitOpenError)
+from pyrundeck.endpoints import find_endpoint
+
+
+class Response(object):
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class TestFindEndpoint(object):
+    def test_known_endpoints_are_found(self):
+        nt.assert_equal('run_job',
+                        find_endpoint('GET', '/api/1/job/abc/run')['name'])
+        nt.assert_equal('job_definition',
+                        find_endpoint('GET', '/api/1/job/abc')['name'])
+        nt.assert_false(find_endpoint('GET', '/api/1/job/abc/run')
+                        ['idempotent'])
+
+    def test_unknown_endpoints_are_idempotent_only_for_get(self):
+        nt.assert_true(find_endpoint('GET', '/api/13/foo')['idempotent'])
+        nt.assert_false(find_endpoint('POST', '/api/13/foo')['idempotent'])
+
+
+@patch('time.sleep')
+class TestRetryPolicy(object):
+    def setup(self):
+        self.root_url = 'http://www.example.com'
+        self.policy = RetryPolicy(max_attempts=3,
+                                  breaker=CircuitBreaker(failure_threshold=10))
+        self.client = RundeckApiClient('mock_token', self.root_url,
+                                       retry_policy=self.policy)
+
+    def test_backoff_is_bounded(self, mock_sleep):
+        for attempt in range(10):
+            delay = self.policy.backoff(attempt)
+            nt.assert_true(0 <= delay <= min(30.0, 0.5 * 2 ** attempt))
+
+    def test_backoff_honors_retry_after(self, mock_sleep):
+        nt.assert_equal(7.0, self.policy.backoff(0, '7'))
+        nt.assert_equal(30.0, self.policy.backoff(0, '3600'))
+
+    @patch('requests.Session.request')
+    def test_idempotent_endpoint_is_retried(self, mock_request, mock_sleep):
+        mock_request.side_effect = [Response(503), Response(503),
+                                    Response(200)]
+
+        status, _ = self.client._perform_request(
+            '{}/api/1/jobs'.format(self.root_url))
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(3, mock_request.call_count)
+        nt.assert_equal(2, mock_sleep.call_count)
+        nt.assert_equal(2, self.policy.stats()['retries'])
+
+    def test_breaker_is_on_by_default(self, mock_sleep):
+        nt.assert_is_instance(RetryPolicy().breaker, CircuitBreaker)
+
+    @patch('requests.Session.request')
+    def test_breaker_can_be_disabled(self, mock_request, mock_sleep):
+        mock_request.return_value = Response(503)
+        policy = RetryPolicy(max_attempts=1, breaker=None)
+        client = RundeckApiClient('mock_token', self.root_url,
+                                  retry_policy=policy)
+
+        for i in range(10):
+            status, _ = client._perform_request(
+                '{}/api/1/jobs'.format(self.root_url))
+
+        nt.assert_equal(503, status)
+        nt.assert_equal(10, mock_request.call_count)
+        nt.assert_not_in('breaker_state', policy.stats())
+
+    @patch('requests.Session.request')
+    def test_attempts_are_limited(self, mock_request, mock_sleep):
+        mock_request.return_value = Response(502)
+
+        status, _ = self.client._perform_request(
+            '{}/api/1/system/info'.format(self.root_url))
+
+        nt.assert_equal(502, status)
+        nt.assert_equal(3, mock_request.call_count)
+
+    @patch('requests.Session.request')
+    def test_run_job_is_not_retried_on_server_error(self, mock_request,
+                                                    mock_sleep):
+        mock_request.return_value = Response(503)
+
+        status, _ = self.client._perform_request(
+            '{}/api/1/job/abc/run'.format(self.root_url))
+
+        nt.assert_equal(503, status)
+        nt.assert_equal(1, mock_request.call_count)
+
+    @patch('requests.Session.request')
+    def test_run_job_is_not_retried_after_connection_reset(self,
+                                                           mock_request,
+                                                           mock_sleep):
+        mock_request.side_effect = requests.exceptions.ConnectionError()
+
+        nt.assert_raises(requests.exceptions.ConnectionError,
+                         self.client._perform_request,
+                         '{}/api/1/job/abc/run'.format(self.root_url))
+        nt.assert_equal(1, mock_request.call_count)
+
+    @patch('requests.Session.request')
+    def test_run_job_is_retried_if_never_sent(self, mock_request,
+                                              mock_sleep):
+        mock_request.side_effect = [requests.exceptions.ConnectTimeout(),
+                                    Response(200)]
+
+        status, _ = self.client._perform_request(
+            '{}/api/1/job/abc/run'.format(self.root_url))
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(2, mock_request.call_count)
+
+    @patch('requests.Session.request')
+    def test_retries_stop_when_budget_is_exhausted(self, mock_request,
+                                                   mock_sleep):
+        self.policy.budget = RetryBudget(ratio=0, min_per_second=0.1,
+                                         window=10)
+        mock_request.return_value = Response(503)
+
+        self.client._perform_request('{}/api/1/jobs'.format(self.root_url))
+
+        nt.assert_equal(2, mock_request.call_count)
+        nt.assert_equal(1, self.policy.stats()['retries'])
+        nt.assert_equal(1, self.policy.stats()['budget_exhausted'])
+
+
+class TestCircuitBreaker(object):
+    def setup(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def test_breaker_opens_after_threshold(self):
+        self.breaker.before_request()
+        self.breaker.record_failure()
+        nt.assert_equal(CircuitBreaker.CLOSED, self.breaker.state)
+        self.breaker.before_request()
+        self.breaker.record_failure()
+        nt.assert_equal(CircuitBreaker.OPEN, self.breaker.state)
+        nt.assert_equal(1, self.breaker.opened_count)
+
+        nt.assert_raises(CircuitOpenError, self.breaker.before_request)
+        nt.assert_equal(1, self.breaker.fast_failed_count)
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        nt.assert_equal(CircuitBreaker.CLOSED, self.breaker.state)
+
+    @patch('time.time')
+    def test_half_open_breaker_allows_single_probe(self, mock_time):
+        mock_time.return_value = 1000.0
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        mock_time.return_value = 1031.0
+        self.breaker.before_request()
+        nt.assert_equal(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        nt.assert_raises(CircuitOpenError, self.breaker.before_request)
+
+        self.breaker.record_success()
+        nt.assert_equal(CircuitBreaker.CLOSED, self.breaker.state)
+        self.breaker.before_request()
+
+    @patch('time.time')
+    def test_failed_probe_opens_breaker(self, mock_time):
+        mock_time.return_value = 1000.0
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        mock_time.return_value = 1031.0
+        self.breaker.before_request()
+        self.breaker.record_failure()
+        nt.assert_equal(CircuitBreaker.OPEN, self.breaker.state)
+        nt.assert_equal(2, self.breaker.opened_count)
+
+    @raises(CircuitOpenError)
+    @patch('requests.Session.request')
+    def test_client_fails_fast_while_open(self, mock_request):
+        policy = RetryPolicy(breaker=self.breaker)
+        client = RundeckApiClient('mock_token', 'http://www.example.com',
+                                  retry_policy=policy)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        try:
+            client.list_jobs()
+        finally:
+            nt.assert_equal(0, mock_request.call_count)
+            nt.assert_equal(1, policy.stats()['fast_failed'])
@@ -0,0 +1,157 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import nose.tools as nt
+from nose.tools import raises
+
+from pyrundeck import RundeckApiClient, RequestScheduler, RundeckException
+
+
+class Response(object):
+    status_code = 200
+    text = ''
+
+
+class TestRequestScheduler(object):
+    def setup(self):
+        self.scheduler = RequestScheduler(workers=1, max_wait=60)
+        self.gate = threading.Event()
+        self.order = []
+        started = threading.Event()
+
+        def block():
+            started.set()
+            self.gate.wait()
+
+        # Keep the single worker busy until all the calls are queued
+        self.scheduler.submit('bulk', block)
+        started.wait()
+
+    def teardown(self):
+        self.gate.set()
+        self.scheduler.shutdown()
+
+    def test_interactive_calls_are_dispatched_first(self):
+        futures = [self.scheduler.submit('bulk', self.order.append, 'bulk')
+                   for _ in range(3)]
+        futures.append(self.scheduler.submit('interactive',
+                                             self.order.append,
+                                             'interactive'))
+        self.gate.set()
+        for f in futures:
+            f.result(timeout=5)
+
+        nt.assert_equal(['interactive', 'bulk', 'bulk', 'bulk'], self.order)
+
+    def test_old_calls_are_not_starved(self):
+        self.scheduler.max_wait = 0
+        futures = [self.scheduler.submit('bulk', self.order.append, 'bulk'),
+                   self.scheduler.submit('interactive', self.order.append,
+                                         'interactive')]
+        self.gate.set()
+        for f in futures:
+            f.result(timeout=5)
+
+        nt.assert_equal(['bulk', 'interactive'], self.order)
+
+    def test_stats_report_queues_and_waits(self):
+        self.scheduler.submit('bulk', self.order.append, 'bulk')
+        stats = self.scheduler.stats()
+        nt.assert_equal(1, stats['bulk']['queued'])
+        nt.assert_equal(0, stats['interactive']['queued'])
+
+        self.gate.set()
+        self.scheduler.shutdown()
+        stats = self.scheduler.stats()
+        nt.assert_equal(0, stats['bulk']['queued'])
+        nt.assert_equal(2, stats['bulk']['dispatched'])
+        nt.assert_true(stats['bulk']['max_wait'] >= stats['bulk']['mean_wait'])
+
+    def test_exceptions_are_set_on_the_future(self):
+        def fail():
+            raise ValueError('boom')
+
+        future = self.scheduler.submit('interactive', fail)
+        self.gate.set()
+        nt.assert_raises(ValueError, future.result, 5)
+
+    @raises(RundeckException)
+    def test_unknown_priority_raises(self):
+        self.scheduler.submit('urgent', self.order.append, 'urgent')
+
+
+class TestClientWithScheduler(object):
+    def setup(self):
+        self.scheduler = RequestScheduler(workers=2)
+        self.client = RundeckApiClient('mock_token', 'http://www.example.com',
+                                       scheduler=self.scheduler)
+
+    def teardown(self):
+        self.scheduler.shutdown()
+
+    @patch('requests.Session.request')
+    def test_requests_run_on_workers(self, mock_request):
+        threads = []
+
+        def request(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return Response()
+
+        mock_request.side_effect = request
+        status, _ = self.client.system_info(native=False)
+
+        nt.assert_equal(200, status)
+        nt.assert_not_equal(threading.current_thread(), threads[0])
+        nt.assert_equal(1, self.scheduler.stats()['interactive']['dispatched'])
+
+    @patch('requests.Session.request')
+    def test_submit_uses_endpoint_priority(self, mock_request):
+        mock_request.return_value = Response()
+
+        status, _ = self.client.submit('export_jobs',
+                                       native=False).result(timeout=5)
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(1, self.scheduler.stats()['bulk']['dispatched'])
+        nt.assert_equal(0, self.scheduler.stats()['interactive']['dispatched'])
+
+    @raises(RundeckException)
+    def test_submit_requires_scheduler(self):
+        client = RundeckApiClient('mock_token', 'http://www.example.com')
+        client.submit('list_jobs')
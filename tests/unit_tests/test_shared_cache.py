@@ -0,0 +1,175 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+from lxml import etree
+
+from pyrundeck import RundeckApiClient, SharedCache
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+JOBS_XML = '''<result success="true" apiversion="13">
+  <jobs count="1">
+    <job id="3b8a86d5-4fc3-4cc1-95a2-8b51421c2069">
+      <name>job_with_args</name>
+      <group/>
+      <project>API_client_development</project>
+      <description/>
+    </job>
+  </jobs>
+</result>'''
+
+
+class TestSharedCache(object):
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache.db')
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def client(self, cache):
+        return RundeckApiClient('mock_token', 'http://www.example.com',
+                                shared_cache=cache)
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_processes_share_results(self, mock_get):
+        mock_get.return_value = (200, etree.fromstring(JOBS_XML))
+        first = SharedCache(self.path)
+        second = SharedCache(self.path)
+
+        status, result = self.client(first).list_jobs(project='p')
+        nt.assert_equal((status, result),
+                        self.client(second).list_jobs(project='p'))
+
+        nt.assert_equal(1, mock_get.call_count)
+        nt.assert_equal(1, second.stats()['hits'])
+        nt.assert_equal('job_with_args', result['jobs']['list'][0]['name'])
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_forked_process_fills_cache(self, mock_get):
+        mock_get.return_value = (200, etree.fromstring(JOBS_XML))
+        cache = SharedCache(self.path)
+        client = self.client(cache)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                client.list_jobs(project='p')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        client.list_jobs(project='p')
+        nt.assert_equal(0, mock_get.call_count)
+        nt.assert_equal(1, cache.stats()['hits'])
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_etree_results_are_copied(self, mock_get):
+        mock_get.return_value = (200, etree.fromstring(JOBS_XML))
+        client = self.client(SharedCache(self.path))
+
+        client.list_jobs(native=False)
+        _, first = client.list_jobs(native=False)
+        first.clear()
+        _, second = client.list_jobs(native=False)
+
+        nt.assert_equal('result', second.tag)
+        nt.assert_equal(1, len(second))
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_errors_are_not_cached(self, mock_get):
+        mock_get.return_value = (404, None)
+        cache = SharedCache(self.path)
+        client = self.client(cache)
+
+        client.job_definition(id='missing', native=False)
+        client.job_definition(id='missing', native=False)
+
+        nt.assert_equal(2, mock_get.call_count)
+        nt.assert_equal(0, cache.stats()['entries'])
+
+    @patch('time.time')
+    def test_expired_entries_are_not_served(self, mock_time):
+        mock_time.return_value = 1000.0
+        cache = SharedCache(self.path, ttl=60)
+        cache.set('key', 'list_jobs', (200, {'a': 1}))
+
+        nt.assert_equal((200, {'a': 1}), cache.get('key'))
+        mock_time.return_value = 1061.0
+        nt.assert_is_none(cache.get('key'))
+
+    @patch('time.time')
+    def test_least_recently_used_entries_are_evicted(self, mock_time):
+        cache = SharedCache(self.path, max_entries=2)
+        mock_time.return_value = 1000.0
+        cache.set('a', 'list_jobs', (200, 'a'))
+        mock_time.return_value = 1001.0
+        cache.set('b', 'list_jobs', (200, 'b'))
+        mock_time.return_value = 1003.0
+        cache.get('a')
+        mock_time.return_value = 1004.0
+        cache.set('c', 'list_jobs', (200, 'c'))
+
+        nt.assert_is_none(cache.get('b'))
+        nt.assert_equal((200, 'a'), cache.get('a'))
+        nt.assert_equal((200, 'c'), cache.get('c'))
+        nt.assert_equal(1, cache.stats()['evictions'])
+
+    def test_invalidate(self):
+        cache = SharedCache(self.path)
+        cache.set('a', 'list_jobs', (200, 'a'))
+        cache.set('b', 'job_definition', (200, 'b'))
+
+        SharedCache(self.path).invalidate('list_jobs')
+
+        nt.assert_is_none(cache.get('a'))
+        nt.assert_equal((200, 'b'), cache.get('b'))
+
+    @patch('pyrundeck.RundeckApiClient.get')
+    def test_broken_database_is_bypassed(self, mock_get):
+        mock_get.return_value = (200, etree.fromstring(JOBS_XML))
+        cache = SharedCache(self.path)
+        client = self.client(cache)
+        cache._db().execute('DROP TABLE entries')
+
+        status, _ = client.list_jobs()
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(2, cache._stats['errors'])
@@ -0,0 +1,98 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import nose.tools as nt
+
+from pyrundeck import (RundeckApiClient, MemoryTransport, ExecutionCache,
+                       RefreshingCache)
+
+from tests.unit_tests.test_cache import execution_xml
+
+
+JOBS_XML = ('<result success="true" apiversion="13"><jobs count="1">'
+            '<job id="1"><name>a</name><group/><project>p</project>'
+            '<description/></job></jobs></result>')
+
+
+class TestTenantViews(object):
+    def setup(self):
+        self.transport = MemoryTransport(record=True)
+        self.transport.add('list_jobs', JOBS_XML)
+        self.transport.add(
+            'execution_info',
+            '<result success="true" apiversion="13"><executions count="1">'
+            '{}</executions></result>'.format(execution_xml(7, 'succeeded'))
+        )
+        self.client = RundeckApiClient(
+            'base_token', 'http://rundeck', transport=self.transport,
+            refresh_cache=RefreshingCache({
+                'list_jobs': {'soft_ttl': 60, 'hard_ttl': 60},
+            }),
+            execution_cache=ExecutionCache()
+        )
+
+    def tokens(self):
+        return [kwargs['headers']['X-Rundeck-Auth-Token']
+                for _, _, kwargs in self.transport.requests]
+
+    def test_views_send_their_token(self):
+        team_a = self.client.for_token('a')
+        team_b = self.client.for_token('b')
+
+        team_a.list_jobs()
+        team_b.list_jobs()
+        self.client.list_jobs()
+
+        nt.assert_equal(['a', 'b', 'base_token'], self.tokens())
+        nt.assert_equal('base_token', self.client.token)
+
+    def test_views_share_the_transport(self):
+        view = self.client.for_token('a')
+
+        nt.assert_true(view.transport is self.client.transport)
+        nt.assert_true(view.refresh_cache is self.client.refresh_cache)
+        nt.assert_not_equal(view.partition, self.client.partition)
+
+    def test_caches_are_partitioned_by_token(self):
+        self.client.for_token('a').list_jobs()
+        self.client.for_token('a').list_jobs()
+        self.client.for_token('b').list_jobs()
+
+        nt.assert_equal(['a', 'b'], self.tokens())
+
+    def test_execution_cache_is_partitioned_by_token(self):
+        for token in ('a', 'a', 'b'):
+            status, result = self.client.for_token(token).execution_info(
+                id=7
+            )
+            nt.assert_equal('7', result['executions']['list'][0]['id'])
+
+        nt.assert_equal(['a', 'b'], self.tokens())
@@ -0,0 +1,150 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import nose.tools as nt
+from nose.tools import raises
+
+from pyrundeck import RundeckApiClient, RateLimiter, ThrottledError
+from pyrundeck.throttle import TokenBucket, ConcurrencyLimit
+
+
+class Response(object):
+    status_code = 200
+    text = ''
+
+
+class TestTokenBucket(object):
+    def test_burst_is_available_immediately(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        for _ in range(3):
+            nt.assert_true(bucket.acquire(timeout=0))
+        nt.assert_false(bucket.acquire(timeout=0))
+
+    def test_reserve_returns_delay_without_blocking(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        nt.assert_equal(0.0, bucket.reserve())
+        delay = bucket.reserve()
+        nt.assert_true(0.05 < delay <= 0.1)
+
+    def test_tokens_are_refilled(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        bucket.acquire()
+        start = time.time()
+        nt.assert_true(bucket.acquire(timeout=1))
+        nt.assert_true(time.time() - start < 0.5)
+
+
+class TestConcurrencyLimit(object):
+    def test_limit_is_enforced(self):
+        limit = ConcurrencyLimit(2)
+        nt.assert_true(limit.acquire())
+        nt.assert_true(limit.try_acquire())
+        nt.assert_false(limit.try_acquire())
+        nt.assert_false(limit.acquire(timeout=0.01))
+        limit.release()
+        nt.assert_true(limit.try_acquire())
+
+
+class TestRateLimiter(object):
+    def setup(self):
+        self.limiter = RateLimiter({
+            'read': {'max_in_flight': 2},
+            'heavy': {'rate': 1, 'burst': 1, 'max_in_flight': 1},
+        }, timeout=0.05)
+
+    def test_classes_are_limited_separately(self):
+        self.limiter.acquire('heavy')
+        self.limiter.acquire('read')
+        self.limiter.acquire('read')
+        # Writes are not limited at all
+        self.limiter.acquire('write')
+        nt.assert_equal({'in_flight': 2, 'throttled': 0},
+                        self.limiter.stats()['read'])
+
+    def test_throttled_requests_are_counted(self):
+        self.limiter.acquire('heavy')
+        self.limiter.release('heavy')
+        nt.assert_raises(ThrottledError, self.limiter.acquire, 'heavy')
+        nt.assert_equal(1, self.limiter.stats()['heavy']['throttled'])
+
+    def test_reserve_does_not_block(self):
+        nt.assert_equal(0.0, self.limiter.reserve('heavy'))
+        nt.assert_is_none(self.limiter.reserve('heavy'))
+        self.limiter.release('heavy')
+        nt.assert_true(self.limiter.reserve('heavy') > 0)
+
+    @patch('requests.Session.request')
+    def test_limiter_is_shared_by_client_threads(self, mock_request):
+        limiter = RateLimiter({'read': {'max_in_flight': 2}})
+        client = RundeckApiClient('mock_token', 'http://www.example.com',
+                                  rate_limiter=limiter)
+        lock = threading.Lock()
+        state = {'current': 0, 'max': 0}
+
+        def request(*args, **kwargs):
+            with lock:
+                state['current'] += 1
+                state['max'] = max(state['max'], state['current'])
+            time.sleep(0.01)
+            with lock:
+                state['current'] -= 1
+            return Response()
+
+        mock_request.side_effect = request
+        threads = [threading.Thread(target=client.system_info,
+                                    kwargs={'native': False})
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        nt.assert_equal(8, mock_request.call_count)
+        nt.assert_equal(2, state['max'])
+        nt.assert_equal(0, limiter.stats()['read']['in_flight'])
+
+    @raises(ThrottledError)
+    @patch('requests.Session.request')
+    def test_client_raises_when_throttled(self, mock_request):
+        mock_request.return_value = Response()
+        client = RundeckApiClient('mock_token', 'http://www.example.com',
+                                  rate_limiter=self.limiter)
+        client.export_jobs(native=False)
+        client.export_jobs(native=False)
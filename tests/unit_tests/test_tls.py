@@ -0,0 +1,133 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import tempfile
+from os import path
+
+import nose.tools as nt
+from nose.tools import raises
+
+from pyrundeck import RundeckApiClient, RequestsTransport, Urllib3Transport
+from pyrundeck.tls import ResumingSSLContext, ssl_context
+from tests import config
+from tests.stub_server import StubServer, system_info_xml
+
+
+CERTFILE = path.join(config.rundeck_test_data_dir, 'stub_server.pem')
+KEYFILE = path.join(config.rundeck_test_data_dir, 'stub_server.key')
+
+
+def handle(method, path, body):
+    return 200, system_info_xml()
+
+
+class TestTLS(object):
+    def test_client_builds_context_from_pem_file(self):
+        client = RundeckApiClient('token', 'https://localhost',
+                                  pem_file_path=CERTFILE)
+
+        nt.assert_is_instance(client.transport.ssl_context,
+                              ResumingSSLContext)
+
+    def test_plain_http_has_no_context(self):
+        client = RundeckApiClient('token', 'http://localhost')
+
+        nt.assert_is_none(client.transport.ssl_context)
+
+    def test_ca_bundle_from_environment(self):
+        old_bundle = os.environ.get('REQUESTS_CA_BUNDLE')
+        os.environ['REQUESTS_CA_BUNDLE'] = CERTFILE
+        try:
+            with StubServer(handle, CERTFILE, KEYFILE) as server:
+                client = RundeckApiClient('token', server.url)
+                status, _ = client.system_info(native=False)
+        finally:
+            if old_bundle is None:
+                del os.environ['REQUESTS_CA_BUNDLE']
+            else:
+                os.environ['REQUESTS_CA_BUNDLE'] = old_bundle
+
+        nt.assert_is_none(client.transport.ssl_context)
+        nt.assert_equal(200, status)
+
+    def test_context_from_directory(self):
+        ca_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(CERTFILE, ca_dir)
+            client = RundeckApiClient('token', 'https://localhost',
+                                      pem_file_path=ca_dir)
+        finally:
+            shutil.rmtree(ca_dir)
+
+        nt.assert_is_instance(client.transport.ssl_context,
+                              ResumingSSLContext)
+
+    def test_sessions_are_resumed(self):
+        with StubServer(handle, CERTFILE, KEYFILE) as server:
+            client = RundeckApiClient('token', server.url,
+                                      pem_file_path=CERTFILE)
+            statuses = [client.system_info(native=False)[0]
+                        for _ in range(3)]
+
+        nt.assert_equal([200, 200, 200], statuses)
+        nt.assert_equal({'handshakes': 3, 'resumed': 2},
+                        client.transport.ssl_context.stats())
+
+    def test_connections_are_reused(self):
+        with StubServer(handle, CERTFILE, KEYFILE,
+                        keep_alive=True) as server:
+            client = RundeckApiClient('token', server.url,
+                                      pem_file_path=CERTFILE)
+            for _ in range(3):
+                client.system_info(native=False)
+
+        nt.assert_equal(1, client.transport.ssl_context.stats()['handshakes'])
+
+    def test_urllib3_transport(self):
+        transport = Urllib3Transport(ssl_context=ssl_context(CERTFILE))
+        with StubServer(handle, CERTFILE, KEYFILE) as server:
+            client = RundeckApiClient('token', server.url,
+                                      pem_file_path=CERTFILE,
+                                      transport=transport)
+            status, _ = client.system_info(native=False)
+            client.system_info(native=False)
+        transport.close()
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(1, transport.ssl_context.stats()['resumed'])
+
+    @raises(ValueError)
+    def test_verification_cannot_be_disabled(self):
+        transport = RequestsTransport(ssl_context=ssl_context(CERTFILE))
+        with StubServer(handle, CERTFILE, KEYFILE) as server:
+            transport.request('GET', server.url, verify=False)
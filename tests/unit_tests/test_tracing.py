@@ -0,0 +1,203 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import nose.tools as nt
+from nose.tools import raises
+import requests
+
+from pyrundeck import (RundeckApiClient, RequestsTransport, Urllib3Transport,
+                       MemoryTransport, RefreshingCache, RequestScheduler,
+                       Tracer)
+from pyrundeck.tracing import OpenTelemetryHook, current_span
+from pyrundeck.transport import Transport
+
+from tests.stub_server import StubServer
+
+
+JOBS_XML = ('<result success="true" apiversion="13"><jobs count="1">'
+            '<job id="1"><name>a</name><group/><project>p</project>'
+            '<description/></job></jobs></result>')
+
+
+class FailingTransport(Transport):
+    def request(self, method, url, **kwargs):
+        raise requests.exceptions.ConnectionError('refused')
+
+
+class TestSpans(object):
+    def setup(self):
+        self.spans = []
+        self.transport = MemoryTransport()
+        self.transport.add('list_jobs', JOBS_XML)
+        self.tracer = Tracer([self.spans.append])
+
+    def client(self, **kwargs):
+        kwargs.setdefault('transport', self.transport)
+        return RundeckApiClient('token', 'http://rundeck', tracer=self.tracer,
+                                **kwargs)
+
+    def test_span_of_call(self):
+        self.client().list_jobs(project='p')
+
+        span = self.spans[0]
+        nt.assert_equal(('list_jobs', '/api/1/jobs', 'GET'),
+                        (span.name, span.path, span.method))
+        nt.assert_equal('http://rundeck/api/1/jobs', span.url)
+        nt.assert_equal(200, span.status)
+        nt.assert_equal(1, span.requests)
+        nt.assert_equal(len(JOBS_XML), span.response_bytes)
+        nt.assert_greater(span.timings['xml_parse'], 0)
+        nt.assert_greater(span.timings['native'], 0)
+        nt.assert_greater_equal(span.duration,
+                                sum(span.timings.values()))
+        nt.assert_is_none(current_span())
+
+    def test_no_native_conversion(self):
+        self.client().list_jobs(native=False)
+
+        nt.assert_equal(0, self.spans[0].timings['native'])
+
+    def test_cached_call_sends_no_request(self):
+        client = self.client(refresh_cache=RefreshingCache({
+            'list_jobs': {'soft_ttl': 60, 'hard_ttl': 60},
+        }))
+        client.list_jobs()
+        client.list_jobs()
+
+        nt.assert_equal([1, 0], [span.requests for span in self.spans])
+        nt.assert_is_none(self.spans[1].url)
+
+    def test_scheduled_call(self):
+        scheduler = RequestScheduler(workers=1)
+        try:
+            self.client(scheduler=scheduler).list_jobs()
+        finally:
+            scheduler.shutdown()
+
+        nt.assert_equal(200, self.spans[0].status)
+        nt.assert_greater(self.spans[0].timings['xml_parse'], 0)
+
+    @raises(requests.exceptions.ConnectionError)
+    def test_failed_call(self):
+        try:
+            self.client(transport=FailingTransport()).list_jobs()
+        finally:
+            nt.assert_is_instance(self.spans[0].error,
+                                  requests.exceptions.ConnectionError)
+            nt.assert_is_none(self.spans[0].status)
+
+    def test_hook_errors_are_ignored(self):
+        def fail(span):
+            raise ValueError()
+        self.tracer = Tracer([fail, self.spans.append])
+
+        status, _ = self.client().list_jobs()
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(1, len(self.spans))
+
+
+class TestNetworkTimings(object):
+    def setup(self):
+        self.spans = []
+        self.server = StubServer(lambda method, path, body: (200, JOBS_XML),
+                                 keep_alive=True)
+        self.server.start()
+
+    def teardown(self):
+        self.server.stop()
+
+    def check(self, transport):
+        client = RundeckApiClient('token', self.server.url,
+                                  transport=transport,
+                                  tracer=Tracer([self.spans.append]))
+        client.list_jobs()
+        client.list_jobs()
+        client.import_job(xmlBatch='<joblist/>')
+
+        first, second, post = self.spans
+        nt.assert_greater(first.timings['connect'], 0)
+        nt.assert_equal(0, second.timings['connect'])
+        for span in self.spans:
+            nt.assert_greater(span.timings['ttfb'], 0)
+            nt.assert_greater(span.timings['download'], 0)
+        nt.assert_equal(0, first.request_bytes)
+        nt.assert_greater(post.request_bytes, len('<joblist/>'))
+
+    def test_requests_transport(self):
+        self.check(RequestsTransport())
+
+    def test_urllib3_transport(self):
+        self.check(Urllib3Transport())
+
+
+class FakeOtelSpan(object):
+    def __init__(self, name, start_time, attributes):
+        self.name = name
+        self.start_time = start_time
+        self.attributes = attributes
+        self.end_time = None
+        self.exceptions = []
+
+    def record_exception(self, ex):
+        self.exceptions.append(ex)
+
+    def end(self, end_time=None):
+        self.end_time = end_time
+
+
+class FakeOtelTracer(object):
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time=None, attributes=None):
+        span = FakeOtelSpan(name, start_time, attributes)
+        self.spans.append(span)
+        return span
+
+
+class TestOpenTelemetryHook(object):
+    def test_spans(self):
+        otel = FakeOtelTracer()
+        transport = MemoryTransport()
+        transport.add('list_jobs', JOBS_XML)
+        client = RundeckApiClient('token', 'http://rundeck',
+                                  transport=transport,
+                                  tracer=Tracer([OpenTelemetryHook(otel)]))
+        client.list_jobs()
+
+        span = otel.spans[0]
+        nt.assert_equal('rundeck list_jobs', span.name)
+        nt.assert_equal(200, span.attributes['http.response.status_code'])
+        nt.assert_equal('/api/1/jobs', span.attributes['url.template'])
+        nt.assert_greater(span.attributes['rundeck.xml_parse_ms'], 0)
+        nt.assert_greater_equal(span.end_time, span.start_time)
+        nt.assert_equal([], span.exceptions)
@@ -0,0 +1,193 @@
+# Copyright (c) 2015, National Documentation Centre (EKT, www.ekt.gr)
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+
+#     Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+
+#     Neither the name of the National Documentation Centre nor the
+#     names of its contributors may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import io
+import socket
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import nose.tools as nt
+from nose.tools import raises
+import requests
+
+from pyrundeck import (RundeckApiClient, RequestsTransport, Urllib3Transport,
+                       MemoryTransport, RundeckException)
+from pyrundeck.retry import _never_sent
+from pyrundeck.transport import Response
+
+from tests.stub_server import StubServer, system_info_xml
+
+
+JOBS_XML = ('<result success="true" apiversion="13"><jobs count="1">'
+            '<job id="1"><name>a</name><group/><project>p</project>'
+            '<description/></job></jobs></result>')
+
+
+class TestMemoryTransport(object):
+    def setup(self):
+        self.transport = MemoryTransport(record=True)
+        self.client = RundeckApiClient('mock_token', 'http://rundeck/rd',
+                                       transport=self.transport)
+
+    def test_endpoint_to_native(self):
+        self.transport.add('list_jobs', JOBS_XML)
+
+        status, result = self.client.list_jobs(project='p')
+
+        nt.assert_equal(200, status)
+        nt.assert_equal('a', result['jobs']['list'][0]['name'])
+        method, url, kwargs = self.transport.requests[0]
+        nt.assert_equal(('GET', 'http://rundeck/rd/api/1/jobs'),
+                        (method, url))
+        nt.assert_equal({'project': 'p'}, kwargs['params'])
+        nt.assert_equal('mock_token',
+                        kwargs['headers']['X-Rundeck-Auth-Token'])
+
+    def test_unknown_endpoints_are_not_found(self):
+        status, result = self.client.system_info(native=False)
+
+        nt.assert_equal(404, status)
+        nt.assert_is_none(result)
+
+    def test_callable_responses(self):
+        def respond(method, url, kwargs):
+            return Response(200, system_info_xml(load=url.count('/')))
+        self.transport.add('system_info', respond)
+
+        status, result = self.client.system_info(native=False)
+
+        nt.assert_equal('7', result.findtext('system/stats/cpu/loadAverage'))
+
+    @raises(RundeckException)
+    def test_unknown_endpoint_name(self):
+        self.transport.add('no_such_endpoint', '')
+
+
+class TestRequestsTransport(object):
+    def test_requests_are_sent(self):
+        seen = []
+
+        def handle(method, path, body):
+            seen.append((method, path, body))
+            return 200, JOBS_XML
+
+        transport = RequestsTransport()
+        with StubServer(handle) as server:
+            client = RundeckApiClient('mock_token', server.url,
+                                      transport=transport)
+            status, result = client.list_jobs(project='p')
+            client.running_executions(project='p')
+        transport.close()
+
+        nt.assert_equal(200, status)
+        nt.assert_equal(('GET', '/api/1/jobs?project=p', b''), seen[0])
+        nt.assert_equal(('POST', '/api/1/executions/running', b'project=p'),
+                        seen[1])
+
+    @patch('socket.getaddrinfo')
+    def test_unresolved_hosts_were_never_sent(self, mock_getaddrinfo):
+        mock_getaddrinfo.side_effect = socket.gaierror(
+            socket.EAI_NONAME, 'Name does not resolve')
+        transport = RequestsTransport()
+
+        try:
+            transport.request('GET', 'http://nonexistent.invalid/')
+        except requests.exceptions.ConnectionError as ex:
+            nt.assert_true(_never_sent(ex))
+        else:
+            raise AssertionError('ConnectionError not raised')
+        finally:
+            transport.close()
+
+    def test_cookies_are_not_kept(self):
+        transport = RequestsTransport()
+        policy = transport.session.cookies._policy
+        nt.assert_equal((), tuple(policy.allowed_domains()))
+
+
+class TestUrllib3Transport(object):
+    def setup(self):
+        self.seen = []
+        self.transport = Urllib3Transport()
+
+    def teardown(self):
+        self.transport.close()
+
+    def handle(self, method, path, body):
+        self.seen.append((method, path, body))
+        return 200, JOBS_XML
+
+    def test_get_and_post(self):
+        with StubServer(self.handle) as server:
+            client = RundeckApiClient('mock_token', server.url,
+                                      transport=self.transport)
+            status, result = client.list_jobs(project='p', idlist=['1', '2'])
+            client.running_executions(project='p')
+
+        nt.assert_equal(200, status)
+        nt.assert_equal('a', result['jobs']['list'][0]['name'])
+        nt.assert_equal('GET', self.seen[0][0])
+        nt.assert_true(self.seen[0][1].startswith('/api/1/jobs?'))
+        nt.assert_in('idlist=1%2C2', self.seen[0][1])
+        nt.assert_equal(('POST', '/api/1/executions/running', b'project=p'),
+                        self.seen[1])
+
+    def test_files_are_sent_as_multipart(self):
+        with StubServer(self.handle) as server:
+            client = RundeckApiClient('mock_token', server.url,
+                                      transport=self.transport)
+            client.import_job(xmlBatch=io.BytesIO(b'<joblist/>'))
+
+        method, path, body = self.seen[0]
+        nt.assert_equal(('POST', '/api/1/jobs/import'), (method, path))
+        nt.assert_in(b'name="xmlBatch"', body)
+        nt.assert_in(b'<joblist/>', body)
+
+    def test_refused_connections_were_never_sent(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        try:
+            self.transport.request('GET',
+                                   'http://127.0.0.1:{}/'.format(port))
+        except requests.exceptions.ConnectionError as ex:
+            nt.assert_true(_never_sent(ex))
+        else:
+            raise AssertionError('ConnectionError not raised')
+
+    @raises(ValueError)
+    def test_unsupported_arguments(self):
+        self.transport.request('GET', 'http://127.0.0.1/', proxies={})